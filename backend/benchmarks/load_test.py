@@ -0,0 +1,127 @@
+"""
+Requests per second and latency of the WSGI and ASGI request paths under
+concurrent clients.
+
+Start the same project under both servers, e.g. from the backend
+directory:
+
+    gunicorn core.wsgi -w 4 -b 127.0.0.1:8000
+    uvicorn core.asgi:application --workers 4 --port 8001
+
+then run:
+
+    python benchmarks/load_test.py --wsgi http://127.0.0.1:8000 --asgi http://127.0.0.1:8001
+
+The WSGI target is sent to the sync views (``/calculate-route/``,
+``/trips/``) and the ASGI target to their async variants under
+``/async/``. Every calculate-route payload has a distinct distance so it
+misses the result cache. Prints one JSON object per target.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.client import HTTPConnection
+from urllib.parse import urlsplit
+
+PATHS = {
+    'wsgi': {'calculate': '/calculate-route/', 'trips': '/trips/?page_size=20'},
+    'asgi': {'calculate': '/async/calculate-route/', 'trips': '/async/trips/?page_size=20'},
+}
+
+
+def calculate_payload(rng):
+    distance = round(rng.uniform(200, 2500), 3)
+    return {
+        'current_location': 'New York, NY',
+        'pickup_location': 'Philadelphia, PA',
+        'dropoff_location': 'Washington, DC',
+        'current_cycle_hours': round(rng.uniform(0, 60), 1),
+        'total_distance': distance,
+        'total_drive_time': round(distance / 55, 3),
+        'points': [
+            {'lat': 40.7128, 'lon': -74.0060, 'name': 'New York, NY', 'type': 'start'},
+            {'lat': 39.9526, 'lon': -75.1652, 'name': 'Philadelphia, PA', 'type': 'pickup'},
+            {'lat': 38.9072, 'lon': -77.0369, 'name': 'Washington, DC', 'type': 'dropoff'},
+        ],
+    }
+
+
+def client(base_url, path, endpoint, count, latencies, errors, seed):
+    """One client on a keep-alive connection sending ``count`` requests."""
+    url = urlsplit(base_url)
+    connection = HTTPConnection(url.hostname, url.port or 80, timeout=60)
+    rng = random.Random(seed)
+    for _ in range(count):
+        if endpoint == 'calculate':
+            body = json.dumps(calculate_payload(rng))
+            method, headers = 'POST', {'Content-Type': 'application/json'}
+        else:
+            body, method, headers = None, 'GET', {}
+        start = time.perf_counter()
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            ok = response.status < 400
+        except OSError:
+            connection.close()
+            ok = False
+        latencies.append(time.perf_counter() - start)
+        if not ok:
+            errors.append(1)
+    connection.close()
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run(name, base_url, endpoint, concurrency, requests):
+    path = PATHS[name][endpoint]
+    latencies, errors = [], []
+    per_client = max(1, requests // concurrency)
+    threads = [
+        threading.Thread(target=client, args=(base_url, path, endpoint, per_client, latencies, errors, seed))
+        for seed in range(concurrency)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    return {
+        'server': name,
+        'url': base_url + path,
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--wsgi', help='Base URL of the WSGI server')
+    parser.add_argument('--asgi', help='Base URL of the ASGI server')
+    parser.add_argument('--endpoint', choices=sorted(PATHS['wsgi']), default='calculate')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+    if not (args.wsgi or args.asgi):
+        parser.error('give --wsgi and/or --asgi')
+
+    for name in ('wsgi', 'asgi'):
+        base_url = getattr(args, name)
+        if base_url:
+            print(json.dumps(run(name, base_url.rstrip('/'), args.endpoint, args.concurrency, args.requests)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Payload size and latency of route geometries: raw JSON points versus
+server-side simplification and Google encoded polylines.
+
+Run from the backend directory:
+
+    python benchmarks/polyline_payload.py [vertices]
+"""
+import json
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from route_planner.geometry import decode_polyline, encode_polyline, simplify  # noqa: E402
+from route_planner.services import SIMPLIFY_TOLERANCE_MILES, process_route_data  # noqa: E402
+
+
+def synthetic_route(vertices, seed=7):
+    """A wiggly ~2,500 mile road from New York towards Los Angeles, ~5 m vertex noise"""
+    rng = random.Random(seed)
+    start, end = (40.71, -74.01), (34.05, -118.24)
+    points = []
+    for i in range(vertices):
+        t = i / (vertices - 1)
+        lat = start[0] + t * (end[0] - start[0]) + 0.3 * math.sin(t * 40) + rng.uniform(-5e-5, 5e-5)
+        lon = start[1] + t * (end[1] - start[1]) + 0.2 * math.cos(t * 25) + rng.uniform(-5e-5, 5e-5)
+        points.append({'lat': round(lat, 6), 'lon': round(lon, 6)})
+    return points
+
+
+def timed(func, *args, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def route_data(geometry):
+    return {
+        'total_distance': 2790.0,
+        'total_drive_time': 41.5,
+        'points': [
+            {'lat': 40.71, 'lon': -74.01, 'name': 'New York, NY'},
+            {'lat': 34.05, 'lon': -118.24, 'name': 'Los Angeles, CA'},
+        ],
+        'geometry': geometry,
+    }
+
+
+def main(vertices):
+    points = synthetic_route(vertices)
+    raw_json = json.dumps(points)
+    encoded = encode_polyline(points)
+    simplified = simplify([(p['lat'], p['lon']) for p in points], SIMPLIFY_TOLERANCE_MILES)
+    simplified_encoded = encode_polyline(simplified)
+
+    _, parse_raw = timed(json.loads, raw_json)
+    _, parse_encoded = timed(decode_polyline, encoded)
+    _, plan_raw = timed(process_route_data, route_data(points), 0)
+    _, plan_encoded = timed(process_route_data, route_data(encoded), 0)
+
+    results = {
+        'vertices': vertices,
+        'simplified_vertices': len(simplified),
+        'bytes': {
+            'json_points': len(raw_json),
+            'encoded': len(encoded),
+            'simplified_encoded': len(simplified_encoded),
+        },
+        'seconds': {
+            'parse_json_points': parse_raw,
+            'decode_encoded': parse_encoded,
+            'process_route_json_points': plan_raw,
+            'process_route_encoded': plan_encoded,
+        },
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,269 @@
+"""
+Benchmark suite for the planning services and the request path.
+
+Microbenchmarks time ``process_route_data``, ``generate_stops``,
+``generate_eld_logs`` and ``format_time`` on synthetic short, long and
+multi-week trips, and nearest-place lookups in a ``spatial.GridIndex``. End-to-end benchmarks drive ``/calculate-route/`` and
+``/trips/`` through the Django test client against a throwaway test
+database filled to several table sizes.
+
+Run from the backend directory:
+
+    python benchmarks/run.py [--output results.json] [--baseline old.json] [--quick]
+
+Results are written as JSON (median and min seconds per call, plus the
+commit and environment) so runs can be compared across releases; with
+``--baseline`` every benchmark is also compared to an earlier results
+file and the run fails if any got slower than ``--max-regression``.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import django  # noqa: E402
+from decouple import config  # noqa: E402
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', f"core.settings.{config('DJANGO_ENV', default='dev')}")
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+
+from route_planner import cache as result_cache, hos, spatial  # noqa: E402
+from route_planner.models import Trip  # noqa: E402
+from route_planner.persistence import save_trip_plans  # noqa: E402
+from route_planner.services import (  # noqa: E402
+    format_time, generate_eld_logs, generate_stops, plan_trip, process_route_data,
+)
+
+# Synthetic trips: (total miles, drive hours, cycle hours already used, geometry vertices)
+TRIPS = {
+    'short': (200.0, 4.5, 10.0, 200),
+    'long': (2790.0, 45.0, 20.0, 5000),
+    'multi_week': (11000.0, 190.0, 60.0, 20000),
+}
+TABLE_SIZES = (0, 1000, 10000)
+QUICK_TABLE_SIZES = (0, 1000)
+STATIONS = 100_000
+
+
+def synthetic_route(miles, drive_hours, vertices):
+    """route_data for a road winding from New York towards Los Angeles"""
+    start, end = (40.71, -74.01), (34.05, -118.24)
+    geometry = []
+    for i in range(vertices):
+        t = i / (vertices - 1)
+        geometry.append({
+            'lat': round(start[0] + t * (end[0] - start[0]) + 0.3 * math.sin(t * 40), 6),
+            'lon': round(start[1] + t * (end[1] - start[1]) + 0.2 * math.cos(t * 25), 6),
+        })
+    return {
+        'total_distance': miles,
+        'total_drive_time': drive_hours,
+        'points': [
+            {'lat': start[0], 'lon': start[1], 'name': 'New York, NY', 'type': 'start'},
+            {'lat': 39.95, 'lon': -75.17, 'name': 'Philadelphia, PA', 'type': 'pickup'},
+            {'lat': end[0], 'lon': end[1], 'name': 'Los Angeles, CA', 'type': 'dropoff'},
+        ],
+        'geometry': geometry,
+    }
+
+
+def measure(func, *args, repeat=7, min_time=0.2):
+    """Median and min seconds per call, calling ``func`` enough times per sample to be measurable"""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func(*args)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / repeat or number >= 1 << 20:
+            break
+        number *= 2
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func(*args)
+        samples.append((time.perf_counter() - start) / number)
+    return {'median': statistics.median(samples), 'min': min(samples), 'calls': number * repeat}
+
+
+def microbenchmarks(repeat):
+    results = {}
+    clock = [hour / 4 for hour in range(4 * 24 * 7)]
+    results['format_time/week_of_quarter_hours'] = measure(
+        lambda: [format_time(hours) for hours in clock], repeat=repeat)
+
+    for name, (miles, drive_hours, cycle_hours, vertices) in TRIPS.items():
+        route_data = synthetic_route(miles, drive_hours, vertices)
+        events, _ = hos.simulate(hos.single_leg_plan(drive_hours, miles), cycle_hours)
+        processed_route = process_route_data(route_data, cycle_hours)
+
+        results[f'process_route_data/{name}'] = measure(
+            process_route_data, route_data, cycle_hours, repeat=repeat)
+        results[f'generate_stops/{name}'] = measure(
+            generate_stops, {**route_data, 'geometry': None}, events, repeat=repeat)
+        results[f'generate_eld_logs/{name}'] = measure(
+            generate_eld_logs, processed_route, repeat=repeat)
+
+    # Nearest-station lookups over a continental US-sized station set
+    rng = random.Random(0)
+    index = spatial.GridIndex(
+        spatial.Place(str(i), rng.uniform(25, 49), rng.uniform(-124, -67), {}) for i in range(STATIONS))
+    queries = [(rng.uniform(25, 49), rng.uniform(-124, -67)) for _ in range(100)]
+    timing = measure(lambda: [index.nearest(lat, lon) for lat, lon in queries], repeat=repeat)
+    results[f'spatial_nearest/{STATIONS}_places'] = {
+        key: value / len(queries) if key != 'calls' else value * len(queries) for key, value in timing.items()}
+    return results
+
+
+def calculate_payload(miles, drive_hours):
+    route_data = synthetic_route(miles, drive_hours, 2)
+    return {
+        'current_location': 'New York, NY',
+        'pickup_location': 'Philadelphia, PA',
+        'dropoff_location': 'Los Angeles, CA',
+        'current_cycle_hours': 20.0,
+        'total_distance': miles,
+        'total_drive_time': drive_hours,
+        'points': route_data['points'],
+    }
+
+
+def fill_trips(count):
+    """Insert trips (with their stops and logs) until the table holds ``count``"""
+    missing = count - Trip.objects.count()
+    if missing <= 0:
+        return
+    payload = calculate_payload(1100.0, 20.0)
+    processed_route, log_sheets = plan_trip(synthetic_route(1100.0, 20.0, 2), 20.0)
+    for offset in range(0, missing, 1000):
+        save_trip_plans([
+            (Trip(current_location=payload['current_location'], pickup_location=payload['pickup_location'],
+                  dropoff_location=payload['dropoff_location'], current_cycle_hours=20.0,
+                  total_distance=1100.0, total_drive_time=20.0),
+             processed_route, log_sheets)
+            for _ in range(min(1000, missing - offset))
+        ])
+
+
+def request_timings(send, count):
+    samples = []
+    for index in range(count):
+        start = time.perf_counter()
+        response = send(index)
+        samples.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            raise RuntimeError(f'{response.status_code}: {response.content[:200]!r}')
+    samples.sort()
+    return {
+        'median': statistics.median(samples),
+        'min': samples[0],
+        'p95': samples[min(len(samples) - 1, int(0.95 * len(samples)))],
+        'calls': count,
+    }
+
+
+def end_to_end(table_sizes, requests):
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    client = Client()
+    results = {}
+    try:
+        for size in table_sizes:
+            fill_trips(size)
+            result_cache.get_cache().clear()
+            # Distinct distances so every request plans and saves a new trip
+            results[f'calculate_route/{size}_trips'] = request_timings(
+                lambda i: client.post('/calculate-route/', calculate_payload(1100.0 + i, 20.0),
+                                      content_type='application/json'),
+                requests)
+            results[f'trips_list/{size}_trips'] = request_timings(
+                lambda i: client.get('/trips/'), requests)
+            results[f'trips_list_summary/{size}_trips'] = request_timings(
+                lambda i: client.get('/trips/?fields=id,pickup_location,dropoff_location,created_at'),
+                requests)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BACKEND_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'commit': commit,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'numpy': hos.np.__version__ if hos.np is not None else None,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'database': connection.vendor,
+    }
+
+
+def compare(results, baseline, max_regression):
+    """Print the change of every benchmark against ``baseline``; True if none regressed too far"""
+    ok = True
+    for section in ('micro', 'end_to_end'):
+        for name, timing in results[section].items():
+            previous = baseline.get(section, {}).get(name)
+            if not previous:
+                continue
+            ratio = timing['median'] / previous['median']
+            flag = ''
+            if ratio > 1 + max_regression:
+                flag, ok = '  REGRESSION', False
+            print(f'{section}/{name}: {ratio:.2f}x{flag}', file=sys.stderr)
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--output', help='Write results to this file instead of stdout')
+    parser.add_argument('--baseline', help='Earlier results file to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help='Allowed slowdown against the baseline (0.2 = 20%%)')
+    parser.add_argument('--quick', action='store_true', help='Fewer repeats and smaller tables')
+    args = parser.parse_args()
+
+    repeat = 3 if args.quick else 7
+    results = {
+        'environment': environment(),
+        'micro': microbenchmarks(repeat),
+        'end_to_end': end_to_end(QUICK_TABLE_SIZES if args.quick else TABLE_SIZES, 10 if args.quick else 30),
+    }
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            if not compare(results, json.load(f), args.max_regression):
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
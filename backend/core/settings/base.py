@@ -45,6 +45,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'route_planner.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -135,4 +136,100 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 STATICFILES_DIRS = [
    os.path.join(BASE_DIR.parent, 'frontend', 'public'),
    os.path.join(BASE_DIR.parent, 'frontend', 'dist'), # Points to Vite's output assets
-]
\ No newline at end of file
+]
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # calculate-route results, keyed by a hash of the planning input
+    'route_results': {
+        'BACKEND': config('ROUTE_RESULT_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('ROUTE_RESULT_CACHE_LOCATION', default='route-results'),
+        'TIMEOUT': config('ROUTE_RESULT_CACHE_TIMEOUT', default=3600, cast=int),
+        'OPTIONS': {
+            'MAX_ENTRIES': config('ROUTE_RESULT_CACHE_MAX_ENTRIES', default=1000, cast=int),
+        },
+    },
+    # Rendered SVG/PDF log sheets, keyed by a hash of the sheets' content;
+    # use FileBasedCache to keep them on disk across restarts
+    'log_renders': {
+        'BACKEND': config('LOG_RENDER_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('LOG_RENDER_CACHE_LOCATION', default='log-renders'),
+        'TIMEOUT': config('LOG_RENDER_CACHE_TIMEOUT', default=86400, cast=int),
+        'OPTIONS': {
+            'MAX_ENTRIES': config('LOG_RENDER_CACHE_MAX_ENTRIES', default=500, cast=int),
+        },
+    },
+}
+
+# Route planner
+# Cache alias holding calculate-route results
+ROUTE_PLANNER_RESULT_CACHE = 'route_results'
+
+# Cache alias holding rendered log sheets
+ROUTE_PLANNER_RENDER_CACHE = 'log_renders'
+
+# Douglas-Peucker tolerance (miles) applied to route geometries sent to /calculate-route/
+ROUTE_PLANNER_SIMPLIFY_TOLERANCE_MILES = config('ROUTE_PLANNER_SIMPLIFY_TOLERANCE_MILES', default=0.01, cast=float)
+
+# Batch planning (/calculate-routes/batch/): trips per request, worker processes
+# (0 = one per CPU) and the batch size below which planning stays in-process
+ROUTE_PLANNER_BATCH_MAX_TRIPS = config('ROUTE_PLANNER_BATCH_MAX_TRIPS', default=1000, cast=int)
+ROUTE_PLANNER_BATCH_WORKERS = config('ROUTE_PLANNER_BATCH_WORKERS', default=0, cast=int)
+ROUTE_PLANNER_BATCH_POOL_MIN_TRIPS = config('ROUTE_PLANNER_BATCH_POOL_MIN_TRIPS', default=16, cast=int)
+
+# Idempotency-Key handling for /calculate-route/: how long keys are kept, how long
+# a duplicate waits for an in-flight request, and when an unfinished claim is abandoned
+ROUTE_PLANNER_IDEMPOTENCY_TTL_SECONDS = config('ROUTE_PLANNER_IDEMPOTENCY_TTL_SECONDS', default=86400, cast=int)
+ROUTE_PLANNER_IDEMPOTENCY_WAIT_SECONDS = config('ROUTE_PLANNER_IDEMPOTENCY_WAIT_SECONDS', default=10, cast=float)
+ROUTE_PLANNER_IDEMPOTENCY_LEASE_SECONDS = config('ROUTE_PLANNER_IDEMPOTENCY_LEASE_SECONDS', default=60, cast=int)
+
+# How generated log activities are stored: 'rows' (one LogActivity per activity)
+# or 'packed' (one quarter-hour duty grid per LogSheet)
+ROUTE_PLANNER_LOG_STORAGE = config('ROUTE_PLANNER_LOG_STORAGE', default='rows')
+
+# Trips fetched per database round trip by the streaming trip export
+ROUTE_PLANNER_EXPORT_CHUNK_SIZE = config('ROUTE_PLANNER_EXPORT_CHUNK_SIZE', default=500, cast=int)
+
+# Requests slower than this many seconds are logged with their stage timings
+# and SQL to the route_planner.slow_requests logger (0 disables the log)
+ROUTE_PLANNER_SLOW_REQUEST_SECONDS = config('ROUTE_PLANNER_SLOW_REQUEST_SECONDS', default=0, cast=float)
+
+# Fuel stops: at least every ROUTE_PLANNER_FUEL_INTERVAL_MILES (0 disables them),
+# snapped to the nearest station of a CSV/GeoJSON file within the radius of the
+# route, searched over the last ROUTE_PLANNER_FUEL_SEARCH_MILES before each stop
+ROUTE_PLANNER_FUEL_INTERVAL_MILES = config('ROUTE_PLANNER_FUEL_INTERVAL_MILES', default=1000, cast=float)
+ROUTE_PLANNER_FUEL_STATIONS_PATH = config('ROUTE_PLANNER_FUEL_STATIONS_PATH', default='')
+ROUTE_PLANNER_FUEL_STATION_RADIUS_MILES = config('ROUTE_PLANNER_FUEL_STATION_RADIUS_MILES', default=5, cast=float)
+ROUTE_PLANNER_FUEL_SEARCH_MILES = config('ROUTE_PLANNER_FUEL_SEARCH_MILES', default=100, cast=float)
+
+# Breaks and rests are moved to the nearest rest area or truck stop of a CSV/GeoJSON
+# file within the radius of the route, up to this many hours of driving earlier
+ROUTE_PLANNER_REST_AREAS_PATH = config('ROUTE_PLANNER_REST_AREAS_PATH', default='')
+ROUTE_PLANNER_REST_AREA_RADIUS_MILES = config('ROUTE_PLANNER_REST_AREA_RADIUS_MILES', default=2, cast=float)
+ROUTE_PLANNER_REST_AREA_TOLERANCE_HOURS = config('ROUTE_PLANNER_REST_AREA_TOLERANCE_HOURS', default=0.5, cast=float)
+
+# Offline reverse geocoding of stops (and /reverse-geocode/) against a gazetteer
+# (GeoNames cities table, CSV or GeoJSON): lookups are cached by coordinate rounded
+# to PRECISION decimal places in an LRU of CACHE_SIZE entries, and cities further
+# than MAX_MILES away are not used
+ROUTE_PLANNER_GAZETTEER_PATH = config('ROUTE_PLANNER_GAZETTEER_PATH', default='')
+ROUTE_PLANNER_GEOCODE_PRECISION = config('ROUTE_PLANNER_GEOCODE_PRECISION', default=2, cast=int)
+ROUTE_PLANNER_GEOCODE_CACHE_SIZE = config('ROUTE_PLANNER_GEOCODE_CACHE_SIZE', default=100000, cast=int)
+ROUTE_PLANNER_GEOCODE_MAX_MILES = config('ROUTE_PLANNER_GEOCODE_MAX_MILES', default=50, cast=float)
+ROUTE_PLANNER_GEOCODE_MAX_POINTS = config('ROUTE_PLANNER_GEOCODE_MAX_POINTS', default=1000, cast=int)
+
+# Server-side routing for calculate-route payloads that only name their locations:
+# road graph (OSM XML extract or .npz from manage.py build_road_graph), how far a
+# location may be from the nearest road, and how many routes are kept in memory
+ROUTE_PLANNER_ROAD_GRAPH_PATH = config('ROUTE_PLANNER_ROAD_GRAPH_PATH', default='')
+ROUTE_PLANNER_ROUTING_SNAP_MILES = config('ROUTE_PLANNER_ROUTING_SNAP_MILES', default=5, cast=float)
+ROUTE_PLANNER_ROUTING_CACHE_SIZE = config('ROUTE_PLANNER_ROUTING_CACHE_SIZE', default=10000, cast=int)
+
+# Trips with a start_time are scheduled on the real clock; stops take the time zone
+# of the nearest gazetteer city within this distance (else TIME_ZONE, with a warning)
+ROUTE_PLANNER_TIME_ZONE_MAX_MILES = config('ROUTE_PLANNER_TIME_ZONE_MAX_MILES', default=100, cast=float)
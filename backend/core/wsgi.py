@@ -16,3 +16,8 @@ django_env = config('DJANGO_ENV', default='dev')
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', f'core.settings.{django_env}')
 
 application = get_wsgi_application()
+
+# Load the road graph now rather than on the first request that routes
+from route_planner import routing  # noqa: E402
+
+routing.get_router()
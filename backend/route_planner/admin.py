@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Trip, Stop, LogSheet, LogActivity
+from .models import Trip, Stop, LogSheet, LogActivity, DriverCycleLedger
 
 class StopInline(admin.TabularInline):
     model = Stop
@@ -15,12 +15,17 @@ class LogSheetInline(admin.TabularInline):
 
 class LogSheetAdmin(admin.ModelAdmin):
     inlines = [LogActivityInline]
-    list_display = ['date', 'from_location', 'to_location', 'total_miles']
+    list_display = ['day', 'from_location', 'to_location', 'total_miles']
 
 class TripAdmin(admin.ModelAdmin):
     inlines = [StopInline, LogSheetInline]
     list_display = ['id', 'pickup_location', 'dropoff_location', 'total_distance', 'created_at']
 
+class DriverCycleLedgerAdmin(admin.ModelAdmin):
+    list_display = ['driver_id', 'last_day', 'total_hours', 'updated_at']
+    search_fields = ['driver_id']
+
 
 admin.site.register(Trip, TripAdmin)
-admin.site.register(LogSheet, LogSheetAdmin)
\ No newline at end of file
+admin.site.register(LogSheet, LogSheetAdmin)
+admin.site.register(DriverCycleLedger, DriverCycleLedgerAdmin)
\ No newline at end of file
@@ -0,0 +1,107 @@
+"""
+Fan HOS/ELD planning for many trips out over a process pool.
+
+Planning is pure and CPU-bound, so batches above a small threshold are
+spread across worker processes; smaller ones run in-process where the
+pickling overhead would outweigh the parallelism. ``plan_trip_async``
+hands a single trip to the same pool so async views never plan on the
+event loop. Workers time their stages and send them back with each
+result, so pooled planning still shows up in the request's metrics.
+"""
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+
+from .metrics import add_stages, collect_stages
+from .services import plan_trip
+
+_executor = None
+
+
+def worker_count():
+    return settings.ROUTE_PLANNER_BATCH_WORKERS or os.cpu_count() or 1
+
+
+def get_executor():
+    """The shared process pool, created on first use."""
+    global _executor
+    if _executor is None:
+        # Spawned rather than forked: forking a threaded server can copy locks
+        # held by other threads. Each worker sets Django up once on start.
+        _executor = ProcessPoolExecutor(
+            max_workers=worker_count(), mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup)
+    return _executor
+
+
+def _discard_executor(executor):
+    """Drop a broken pool so the next call gets a fresh one."""
+    global _executor
+    executor.shutdown(wait=False, cancel_futures=True)
+    if _executor is executor:
+        _executor = None
+
+
+def _plan(job):
+    route_data, current_cycle_hours = job
+    try:
+        return plan_trip(route_data, current_cycle_hours), None
+    except Exception as e:
+        return None, str(e)
+
+
+def _plan_timed(job):
+    """``_plan`` in a pool worker, with the stage timings it took."""
+    with collect_stages() as stages:
+        result = _plan(job)
+    return result, stages
+
+
+def plan_trips(jobs):
+    """
+    Plan each ``(route_data, current_cycle_hours)`` job.
+
+    Returns one ``(plan, error)`` pair per job, in order, where ``plan`` is
+    the ``(processed_route, log_sheets)`` pair or None when it failed.
+    """
+    if len(jobs) < settings.ROUTE_PLANNER_BATCH_POOL_MIN_TRIPS or worker_count() < 2:
+        return [_plan(job) for job in jobs]
+
+    chunksize = max(1, len(jobs) // (worker_count() * 4))
+    executor = get_executor()
+    try:
+        timed = list(executor.map(_plan_timed, jobs, chunksize=chunksize))
+    except BrokenProcessPool:
+        # A worker died; plan the batch here instead
+        _discard_executor(executor)
+        return [_plan(job) for job in jobs]
+    results = []
+    for result, stages in timed:
+        add_stages(stages)
+        results.append(result)
+    return results
+
+
+async def plan_trip_async(route_data, current_cycle_hours):
+    """
+    ``_plan`` one trip without blocking the event loop.
+
+    Runs in the process pool when there are at least two workers, so the
+    planning does not hold the server's GIL, and in a thread otherwise.
+    """
+    job = (route_data, current_cycle_hours)
+    if worker_count() >= 2:
+        executor = get_executor()
+        try:
+            result, stages = await asyncio.get_running_loop().run_in_executor(executor, _plan_timed, job)
+        except BrokenProcessPool:
+            _discard_executor(executor)
+        else:
+            add_stages(stages)
+            return result
+    return await asyncio.to_thread(_plan, job)
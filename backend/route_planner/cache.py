@@ -0,0 +1,96 @@
+"""
+Content-addressed cache of calculate_route results.
+
+Results are keyed by a hash of the canonical (normalized, key-sorted)
+planning input, so resubmitting an identical payload returns the stored
+route, log sheets and trip id without planning or writing again. The
+backing store is the Django cache named by ``ROUTE_PLANNER_RESULT_CACHE``
+(locmem by default, which evicts least-recently-used entries past
+``MAX_ENTRIES`` and expires them after ``TIMEOUT``). Hit and miss counts
+are kept in process memory, apart from the entries they would otherwise
+be evicted with, so each worker process reports its own.
+"""
+import hashlib
+import json
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import Trip
+
+KEY_PREFIX = 'calculate-route'
+
+_counts = {'hits': 0, 'misses': 0}
+_counts_lock = threading.Lock()
+
+
+def get_cache():
+    return caches[settings.ROUTE_PLANNER_RESULT_CACHE]
+
+
+def payload_hash(data, route_data):
+    """SHA-256 of the canonical planning input of a calculate-route payload."""
+    trip = [data['current_location'], data['pickup_location'],
+            data['dropoff_location'], float(data['current_cycle_hours'])]
+    if data.get('driver_id'):
+        # Each driver's trips are their own; only added when set to keep older keys valid
+        trip.append(data['driver_id'])
+    canonical = json.dumps(
+        {
+            'trip': trip,
+            'route': route_data,
+        },
+        sort_keys=True, separators=(',', ':'), default=str,
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def location_hash(data, graph_version):
+    """
+    ``payload_hash`` of a payload to be routed server-side, before routing.
+
+    Routes over one version of the road graph never change, so the
+    payload's locations and options and the graph version stand in for
+    the route.
+    """
+    return payload_hash(data, {'roadGraph': list(graph_version), 'payload': data})
+
+
+def result_key(request_hash):
+    """Cache key of the result for a ``payload_hash``."""
+    return f'{KEY_PREFIX}:{request_hash}'
+
+
+def lookup(key):
+    """
+    Cached response body for ``key``, or None. Entries whose trip is gone,
+    or was re-planned since, are dropped.
+    """
+    cache = get_cache()
+    body = cache.get(key)
+    if body is not None and not Trip.objects.filter(pk=body['tripId'], replanned_at__isnull=True).exists():
+        cache.delete(key)
+        body = None
+    with _counts_lock:
+        _counts['hits' if body is not None else 'misses'] += 1
+    return body
+
+
+def store(key, body):
+    get_cache().set(key, body)
+
+
+def stats():
+    with _counts_lock:
+        hits, misses = _counts['hits'], _counts['misses']
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hitRatio': hits / (hits + misses) if hits + misses else 0.0,
+    }
+
+
+def reset_stats():
+    with _counts_lock:
+        _counts.update(hits=0, misses=0)
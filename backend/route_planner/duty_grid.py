@@ -0,0 +1,80 @@
+"""
+Compact encoding of a log sheet's duty-status grid.
+
+A day is stored as 96 quarter-hour slots of 2-bit status codes packed
+into 24 bytes, the same 15-minute resolution as the paper log grid. The
+day clocks fall back on is 25 hours long and takes 25 bytes, and the one
+they spring forward on 23 hours and 23 bytes; the grid's length is the
+day's.
+Locations and remarks go in a small sidecar list of
+``[start_slot, location, remarks]`` entries, one per activity that does
+not have the default ``En route`` location and empty remarks. Activity
+times are rounded to the nearest quarter hour.
+"""
+SLOTS_PER_HOUR = 4
+SLOTS_PER_DAY = 24 * SLOTS_PER_HOUR
+# Slots of the shortest and longest days, when clocks spring forward and fall back
+MIN_SLOTS_PER_DAY = 23 * SLOTS_PER_HOUR
+MAX_SLOTS_PER_DAY = 25 * SLOTS_PER_HOUR
+
+STATUS_CODES = {'offDuty': 0, 'sleeperBerth': 1, 'driving': 2, 'onDuty': 3}
+STATUSES = {code: status for status, code in STATUS_CODES.items()}
+
+DEFAULT_LOCATION = 'En route'
+DEFAULT_REMARKS = ''
+
+
+def encode(activities, hours=None):
+    """
+    Pack activities into ``(grid, notes)``.
+
+    Each activity is a dict with ``status``, ``start_time`` and ``end_time``
+    (hours of the day), ``location`` and ``remarks``. ``hours`` is the
+    length of the day, 23 to 25; by default it runs to the end of the last
+    activity, and at least 24 hours. Slots no activity covers are off duty.
+    """
+    if hours is None:
+        ends = [round(float(activity['end_time']) * SLOTS_PER_HOUR) for activity in activities]
+        slots = max([SLOTS_PER_DAY, *ends])
+    else:
+        slots = round(float(hours) * SLOTS_PER_HOUR)
+    slots = min(MAX_SLOTS_PER_DAY, max(MIN_SLOTS_PER_DAY, slots))
+    slots += -slots % 4
+    codes = bytearray(slots)
+    notes = []
+    for activity in activities:
+        first = max(0, round(float(activity['start_time']) * SLOTS_PER_HOUR))
+        last = min(slots, round(float(activity['end_time']) * SLOTS_PER_HOUR))
+        if last <= first:
+            continue
+        codes[first:last] = bytes([STATUS_CODES[activity['status']]]) * (last - first)
+        if activity['location'] != DEFAULT_LOCATION or activity['remarks'] != DEFAULT_REMARKS:
+            notes.append([first, activity['location'], activity['remarks']])
+
+    grid = bytearray(slots // 4)
+    for slot, code in enumerate(codes):
+        grid[slot >> 2] |= code << ((slot & 3) * 2)
+    return bytes(grid), notes
+
+
+def decode(grid, notes):
+    """Unpack ``(grid, notes)`` into activity dicts with times in hours of the day"""
+    slots = len(grid) * 4
+    codes = [(grid[slot >> 2] >> ((slot & 3) * 2)) & 3 for slot in range(slots)]
+    notes_by_slot = {slot: (location, remarks) for slot, location, remarks in notes or []}
+
+    activities = []
+    start = 0
+    for slot in range(1, slots + 1):
+        if slot < slots and codes[slot] == codes[start] and slot not in notes_by_slot:
+            continue
+        location, remarks = notes_by_slot.get(start, (DEFAULT_LOCATION, DEFAULT_REMARKS))
+        activities.append({
+            'status': STATUSES[codes[start]],
+            'start_time': start / SLOTS_PER_HOUR,
+            'end_time': slot / SLOTS_PER_HOUR,
+            'location': location,
+            'remarks': remarks,
+        })
+        start = slot
+    return activities
@@ -0,0 +1,144 @@
+"""
+Streaming exports of stored trips for compliance audits.
+
+Trips are read with a chunked ``.iterator()`` (stops and log sheets are
+prefetched per chunk) and rendered one line at a time, so memory use
+stays flat however many trips are exported. ``ndjson`` writes one
+serialized trip per line, in the same shape as ``GET /trips/``; ``csv``
+writes one row per ELD log activity.
+
+Under ASGI Django fully consumes a synchronous streaming iterator before
+sending it, so async views stream ``aexport_trips`` instead, which pulls
+the same lines in batches from a worker thread.
+"""
+import csv
+import json
+from datetime import datetime, time, timedelta
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from . import duty_grid
+from .models import Trip
+from .serializers import TripSerializer
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+CSV_HEADER = [
+    'trip_id', 'created_at', 'current_location', 'pickup_location', 'dropoff_location',
+    'day', 'status', 'start_time', 'end_time', 'location', 'remarks',
+]
+
+
+def parse_bound(value, end=False):
+    """
+    Datetime bound of an export date range from an ISO date or datetime.
+
+    A plain date covers the whole day: as an ``end`` bound it means up to
+    the following midnight. Raises ValueError for anything else.
+    """
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'Invalid date: {value}')
+        if end:
+            day += timedelta(days=1)
+        moment = datetime.combine(day, time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+# Relations each format reads, prefetched once per chunk of trips
+FORMAT_PREFETCHES = {
+    'ndjson': ('stops', 'log_sheets__activities'),
+    'csv': ('log_sheets__activities',),
+}
+
+
+def export_queryset(start=None, end=None, prefetches=FORMAT_PREFETCHES['ndjson']):
+    """Trips created in ``[start, end)``, oldest first, with ``prefetches`` loaded."""
+    trips = Trip.objects.order_by('created_at', 'id').prefetch_related(*prefetches)
+    if start is not None:
+        trips = trips.filter(created_at__gte=start)
+    if end is not None:
+        trips = trips.filter(created_at__lt=end)
+    return trips
+
+
+def sheet_activities(sheet):
+    """A log sheet's activities as dicts, from its rows or its packed duty grid."""
+    if sheet.duty_grid is not None:
+        return duty_grid.decode(bytes(sheet.duty_grid), sheet.grid_notes)
+    return [
+        {
+            'status': activity.status,
+            'start_time': activity.start_time,
+            'end_time': activity.end_time,
+            'location': activity.location,
+            'remarks': activity.remarks,
+        }
+        for activity in sheet.activities.all()
+    ]
+
+
+class _Echo:
+    """File-like object whose ``write`` returns the line instead of storing it."""
+    def write(self, value):
+        return value
+
+
+def iter_ndjson(trips):
+    for trip in trips:
+        yield json.dumps(TripSerializer(trip).data, separators=(',', ':')) + '\n'
+
+
+def iter_csv(trips):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_HEADER)
+    for trip in trips:
+        created_at = trip.created_at.isoformat()
+        for sheet in trip.log_sheets.all():
+            for activity in sheet_activities(sheet):
+                yield writer.writerow([
+                    trip.id, created_at, trip.current_location, trip.pickup_location,
+                    trip.dropoff_location, sheet.day, activity['status'],
+                    activity['start_time'], activity['end_time'],
+                    activity['location'], activity['remarks'],
+                ])
+
+
+def export_trips(export_format='ndjson', start=None, end=None):
+    """Generator of export lines for trips created in ``[start, end)``."""
+    if export_format not in FORMATS:
+        raise ValueError(f'Unknown export format: {export_format}')
+    trips = export_queryset(start, end, FORMAT_PREFETCHES[export_format]).iterator(
+        chunk_size=settings.ROUTE_PLANNER_EXPORT_CHUNK_SIZE)
+    if export_format == 'csv':
+        return iter_csv(trips)
+    return iter_ndjson(trips)
+
+
+async def aexport_trips(export_format='ndjson', start=None, end=None):
+    """
+    Async iterator over the lines of ``export_trips``.
+
+    Lines are read ``ROUTE_PLANNER_EXPORT_CHUNK_SIZE`` at a time through
+    ``sync_to_async``; the database cursor stays on the one sync thread.
+    """
+    lines = export_trips(export_format, start, end)
+    read_batch = sync_to_async(lambda: list(islice(lines, settings.ROUTE_PLANNER_EXPORT_CHUNK_SIZE)))
+    while True:
+        batch = await read_batch()
+        if not batch:
+            return
+        for line in batch:
+            yield line
@@ -0,0 +1,136 @@
+"""
+Offline reverse geocoding of coordinates to nearest-city labels.
+
+Coordinates are resolved against the gazetteer at
+``ROUTE_PLANNER_GAZETTEER_PATH`` (a GeoNames cities table, or a CSV or
+GeoJSON file with ``name``, ``lat``, ``lon`` and optional
+``admin1``/``state`` and ``country`` columns) through a
+``spatial.GridIndex``. Lookups are keyed by the coordinate rounded to
+``ROUTE_PLANNER_GEOCODE_PRECISION`` decimal places (0.01 degree is about
+0.7 miles), and the label of each rounded point is kept in an in-process
+LRU cache, so stops along corridors that are planned again and again are
+labelled from memory. ``lookup_many`` resolves a whole batch of
+coordinates with a single pass over the cache.
+
+``locate`` goes the other way for server-side routing: a
+``"City, Region"`` name (or a ``"lat, lon"`` string) to coordinates.
+"""
+import re
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from . import spatial
+
+REGION_COLUMNS = ('admin1', 'state', 'region')
+
+COORDINATES = re.compile(r'^\s*(-?\d+(?:\.\d*)?)\s*,\s*(-?\d+(?:\.\d*)?)\s*$')
+
+
+def label(place):
+    """``"City, Region"`` of a gazetteer place (the country when it has no region)"""
+    properties = place.properties
+    region = next((properties[column] for column in REGION_COLUMNS if properties.get(column)),
+                  properties.get('country'))
+    return f'{place.name}, {region}' if region else place.name
+
+
+class ReverseGeocoder:
+    """Nearest-city labels of coordinates, cached by quantized coordinate."""
+
+    def __init__(self, index, precision=2, max_miles=50.0, cache_size=100_000):
+        self.index = index
+        self.scale = 10 ** precision
+        self.max_miles = max_miles
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._names = None
+
+    def key(self, lat, lon):
+        return round(lat * self.scale), round(lon * self.scale)
+
+    def _resolve(self, key):
+        found = self.index.nearest(key[0] / self.scale, key[1] / self.scale, self.max_miles)
+        return label(found[0]) if found is not None else None
+
+    def lookup(self, lat, lon):
+        """Label of the city nearest to (lat, lon), None if none is within ``max_miles``"""
+        return self.lookup_many([(lat, lon)])[0]
+
+    def lookup_many(self, coordinates):
+        """``lookup`` of every (lat, lon) pair; each distinct key is resolved once"""
+        keys = [self.key(lat, lon) for lat, lon in coordinates]
+        labels = {}
+        with self._lock:
+            for key in keys:
+                if key not in labels and key in self._cache:
+                    self._cache.move_to_end(key)
+                    labels[key] = self._cache[key]
+
+        # Index lookups run outside the lock
+        resolved = {key: self._resolve(key) for key in dict.fromkeys(keys) if key not in labels}
+        with self._lock:
+            self._cache.update(resolved)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            self.misses += len(resolved)
+            self.hits += len(keys) - len(resolved)
+
+        labels.update(resolved)
+        return [labels[key] for key in keys]
+
+    def find(self, name):
+        """The place labelled ``name``, or the most populous city called ``name``; None if unknown"""
+        if self._names is None:
+            names = {}
+            by_population = sorted(self.index.places, key=spatial.population, reverse=True)
+            for place in by_population:
+                names.setdefault(place.name.lower(), place)
+                names.setdefault(label(place).lower(), place)
+            self._names = names
+        return self._names.get(' '.join(name.split()).lower())
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._cache)}
+
+
+_geocoder = None
+
+
+def get_geocoder():
+    """
+    The process-wide ``ReverseGeocoder``, or None without a gazetteer.
+
+    Rebuilt, with an empty cache, when the gazetteer file changes.
+    """
+    global _geocoder
+    index = spatial.get_index(settings.ROUTE_PLANNER_GAZETTEER_PATH)
+    if index is None:
+        return None
+    geocoder = _geocoder
+    if geocoder is None or geocoder.index is not index:
+        geocoder = _geocoder = ReverseGeocoder(
+            index,
+            precision=settings.ROUTE_PLANNER_GEOCODE_PRECISION,
+            max_miles=settings.ROUTE_PLANNER_GEOCODE_MAX_MILES,
+            cache_size=settings.ROUTE_PLANNER_GEOCODE_CACHE_SIZE,
+        )
+    return geocoder
+
+
+def locate(query):
+    """
+    (lat, lon) of a ``"lat, lon"`` string or of the gazetteer city it names
+    (``"City"`` or ``"City, Region"``); None when it cannot be placed.
+    """
+    match = COORDINATES.match(query)
+    if match:
+        return float(match.group(1)), float(match.group(2))
+    geocoder = get_geocoder()
+    place = geocoder.find(query) if geocoder is not None else None
+    return (place.lat, place.lon) if place is not None else None
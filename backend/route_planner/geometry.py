@@ -0,0 +1,226 @@
+"""
+Route polyline helpers.
+
+Geometries arrive either as lists of points or as Google encoded
+polylines, and are simplified with Douglas-Peucker before use.
+``RouteLine`` precomputes the cumulative great-circle distance along a
+polyline once, so any position along the route is then found with a
+binary search in O(log n). NumPy is used for the precomputation when it
+is installed; the pure-Python path gives the same results.
+"""
+import math
+from bisect import bisect_right
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - NumPy is optional
+    np = None
+
+EARTH_RADIUS_MILES = 3958.8
+# Miles per degree of latitude, used to project small spans onto a plane
+MILES_PER_DEGREE = 69.0934
+
+# Default Douglas-Peucker tolerance for route geometries, in miles (~16 m)
+SIMPLIFY_TOLERANCE_MILES = 0.01
+
+
+def point_coordinates(point):
+    """(lat, lon) of a ``{'lat', 'lon'|'lng'}`` dict or a ``[lat, lon]`` pair"""
+    if isinstance(point, dict):
+        return float(point['lat']), float(point.get('lon', point.get('lng')))
+    return float(point[0]), float(point[1])
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Great-circle distance in miles between two coordinates"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2 +
+         math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_MILES * math.asin(math.sqrt(min(1.0, a)))
+
+
+def cumulative_distances(lats, lons):
+    """Distance in miles from the first vertex to every vertex of a polyline"""
+    if np is not None:
+        lat = np.radians(np.asarray(lats, dtype=float))
+        lon = np.radians(np.asarray(lons, dtype=float))
+        a = (np.sin(np.diff(lat) / 2) ** 2 +
+             np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lon) / 2) ** 2)
+        segments = 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.minimum(1.0, a)))
+        return np.concatenate(([0.0], np.cumsum(segments))).tolist()
+
+    total = 0.0
+    cumulative = [0.0]
+    for i in range(1, len(lats)):
+        total += haversine(lats[i - 1], lons[i - 1], lats[i], lons[i])
+        cumulative.append(total)
+    return cumulative
+
+
+class RouteLine:
+    """A polyline indexed by cumulative distance for O(log n) lookups."""
+
+    def __init__(self, coordinates):
+        coordinates = [point_coordinates(point) for point in coordinates]
+        if not coordinates:
+            raise ValueError('A route line needs at least one coordinate')
+        self.lats = [lat for lat, _ in coordinates]
+        self.lons = [lon for _, lon in coordinates]
+        self.cumulative = cumulative_distances(self.lats, self.lons)
+        self.length = self.cumulative[-1]
+
+    def __len__(self):
+        return len(self.lats)
+
+    def locate(self, distance):
+        """(lat, lon) at ``distance`` miles along the line, clamped to its ends"""
+        cumulative = self.cumulative
+        if distance <= 0 or len(cumulative) == 1:
+            return self.lats[0], self.lons[0]
+        if distance >= self.length:
+            return self.lats[-1], self.lons[-1]
+
+        i = bisect_right(cumulative, distance)
+        start, end = cumulative[i - 1], cumulative[i]
+        t = (distance - start) / (end - start) if end > start else 0.0
+        return (
+            self.lats[i - 1] + t * (self.lats[i] - self.lats[i - 1]),
+            self.lons[i - 1] + t * (self.lons[i] - self.lons[i - 1]),
+        )
+
+    def locate_fraction(self, fraction):
+        """(lat, lon) at ``fraction`` (0..1) of the line's length"""
+        return self.locate(fraction * self.length)
+
+    def project(self, lat, lon):
+        """Miles along the line of its point closest to (lat, lon)"""
+        # Segments are short enough to treat as straight on a local plane
+        scale = math.cos(math.radians(lat))
+        best_miles, best_offset = math.inf, 0.0
+        for i in range(max(1, len(self.lats) - 1)):
+            j = min(i + 1, len(self.lats) - 1)
+            ax, ay = (self.lons[i] - lon) * scale, self.lats[i] - lat
+            dx, dy = (self.lons[j] - self.lons[i]) * scale, self.lats[j] - self.lats[i]
+            length = dx * dx + dy * dy
+            t = max(0.0, min(1.0, -(ax * dx + ay * dy) / length)) if length else 0.0
+            miles = math.hypot(ax + t * dx, ay + t * dy) * MILES_PER_DEGREE
+            if miles < best_miles:
+                best_miles = miles
+                best_offset = self.cumulative[i] + t * (self.cumulative[j] - self.cumulative[i])
+        return best_offset
+
+
+def encode_polyline(coordinates, precision=5):
+    """Encode ``(lat, lon)`` coordinates with Google's encoded polyline algorithm"""
+    factor = 10 ** precision
+    chunks = []
+    previous_lat = previous_lon = 0
+    for point in coordinates:
+        lat, lon = point_coordinates(point)
+        lat, lon = round(lat * factor), round(lon * factor)
+        for delta in (lat - previous_lat, lon - previous_lon):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            chunks.append(chr(value + 63))
+        previous_lat, previous_lon = lat, lon
+    return ''.join(chunks)
+
+
+def decode_polyline(encoded, precision=5):
+    """Decode a Google encoded polyline into a list of ``(lat, lon)`` tuples"""
+    factor = 10 ** precision
+    coordinates = []
+    index = lat = lon = 0
+    length = len(encoded)
+    while index < length:
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                if index >= length:
+                    raise ValueError('Truncated encoded polyline')
+                byte = ord(encoded[index]) - 63
+                index += 1
+                result |= (byte & 0x1f) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lon += deltas[1]
+        coordinates.append((lat / factor, lon / factor))
+    return coordinates
+
+
+def parse_geometry(geometry, precision=5):
+    """Coordinates of a geometry given as an encoded polyline or a list of points"""
+    if isinstance(geometry, str):
+        return decode_polyline(geometry, precision)
+    return [point_coordinates(point) for point in geometry]
+
+
+def simplify(coordinates, tolerance):
+    """
+    Douglas-Peucker simplification of ``(lat, lon)`` coordinates.
+
+    ``tolerance`` is the largest distance in miles a removed vertex may lie
+    from the simplified line. Coordinates are projected onto a local plane,
+    which is accurate enough at the tolerances used for route display.
+    The endpoints are always kept.
+    """
+    n = len(coordinates)
+    if n < 3 or tolerance <= 0:
+        return list(coordinates)
+
+    sample = coordinates[::max(1, n // 64)]
+    scale = math.cos(math.radians(sum(lat for lat, _ in sample) / len(sample)))
+    xs = [lon * scale * MILES_PER_DEGREE for _, lon in coordinates]
+    ys = [lat * MILES_PER_DEGREE for lat, _ in coordinates]
+    if np is not None:
+        xs, ys = np.asarray(xs), np.asarray(ys)
+
+    keep = [False] * n
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        index, distance = _farthest_point(xs, ys, first, last)
+        if distance > tolerance:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+
+    return [point for point, kept in zip(coordinates, keep) if kept]
+
+
+def _farthest_point(xs, ys, first, last):
+    """Index and distance of the vertex farthest from the segment first-last"""
+    x1, y1, x2, y2 = xs[first], ys[first], xs[last], ys[last]
+    dx, dy = x2 - x1, y2 - y1
+    length_sq = dx * dx + dy * dy
+
+    if np is not None:
+        px = xs[first + 1:last] - x1
+        py = ys[first + 1:last] - y1
+        if length_sq > 0:
+            t = np.clip((px * dx + py * dy) / length_sq, 0.0, 1.0)
+            px = px - t * dx
+            py = py - t * dy
+        distances = px * px + py * py
+        offset = int(np.argmax(distances))
+        return first + 1 + offset, math.sqrt(distances[offset])
+
+    best_index, best = first, -1.0
+    for i in range(first + 1, last):
+        px, py = xs[i] - x1, ys[i] - y1
+        if length_sq > 0:
+            t = max(0.0, min(1.0, (px * dx + py * dy) / length_sq))
+            px, py = px - t * dx, py - t * dy
+        distance = px * px + py * py
+        if distance > best:
+            best_index, best = i, distance
+    return best_index, math.sqrt(best)
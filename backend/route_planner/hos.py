@@ -0,0 +1,456 @@
+"""
+Event-driven Hours of Service (HOS) simulation.
+
+Steps a property-carrying driver through a trip plan and emits one
+``DutyEvent`` per duty-status change. Each loop iteration either emits an
+event or inserts the break/rest that unblocks driving, so the cost is
+O(number of duty events) regardless of how many hours the trip takes.
+
+Times are decimal hours from midnight of the first trip day, distances
+are miles from the start of the trip.
+
+Rules applied (FMCSA property-carrying, 70-hour/8-day):
+
+* 11 hours of driving after 10 consecutive hours off duty
+* no driving after the 14th hour since coming on duty
+* a 30-minute interruption after 8 cumulative hours of driving; on-duty
+  time that is not driving counts as the interruption
+* no driving after 70 on-duty hours in the cycle; a 34-hour restart
+  resets the cycle. Hours do not roll off the 8-day window during the
+  trip, so the restart is the only way cycle hours are regained.
+
+Optionally a 30-minute on-duty fuel stop is inserted at least every
+``fuel_interval`` miles.
+"""
+import math
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - NumPy is optional
+    np = None
+
+MAX_DRIVING_HOURS = 11
+DUTY_WINDOW_HOURS = 14
+BREAK_AFTER_DRIVING_HOURS = 8
+BREAK_HOURS = 0.5
+REST_HOURS = 10
+CYCLE_LIMIT_HOURS = 70
+RESTART_HOURS = 34
+
+# Fuel at least every FUEL_INTERVAL_MILES; fueling is on-duty time
+FUEL_INTERVAL_MILES = 1000
+FUEL_HOURS = 0.5
+
+PICKUP_HOURS = 1
+DROPOFF_HOURS = 1
+START_TIME = 8
+
+OFF_DUTY = 'offDuty'
+SLEEPER_BERTH = 'sleeperBerth'
+DRIVING = 'driving'
+ON_DUTY = 'onDuty'
+
+# Kinds of events the simulation emits
+PICKUP = 'pickup'
+DROPOFF = 'dropoff'
+DRIVE = 'drive'
+BREAK = 'break'
+REST = 'rest'
+RESTART = 'restart'
+FUEL = 'fuel'
+
+EPSILON = 1e-9
+
+# ``leg`` is the leg of the trip the event belongs to: 0 for the pickup at the
+# origin, then 1..n for the drive to each stop and the dwell at that stop
+DutyEvent = namedtuple('DutyEvent', ['status', 'start', 'end', 'start_mile', 'end_mile', 'kind', 'leg'],
+                       defaults=(0,))
+
+
+class DutyClocks:
+    """The HOS clocks carried from one event to the next."""
+    __slots__ = ('driving', 'since_break', 'shift_start', 'cycle', 'since_fuel')
+
+    def __init__(self, cycle=0.0, driving=0.0, since_break=0.0, shift_start=None, since_fuel=0.0):
+        self.cycle = cycle
+        self.driving = driving
+        self.since_break = since_break
+        # Start of the current 14-hour window, None while off duty
+        self.shift_start = shift_start
+        # Miles driven since the last fuel stop
+        self.since_fuel = since_fuel
+
+    def reset_shift(self):
+        self.driving = 0.0
+        self.since_break = 0.0
+        self.shift_start = None
+
+
+def single_leg_plan(total_drive_time, total_distance):
+    """Task list for the classic pickup -> drive -> dropoff trip."""
+    return [
+        (ON_DUTY, PICKUP_HOURS, 0.0, PICKUP, 0),
+        (DRIVING, total_drive_time, total_distance, DRIVE, 1),
+        (ON_DUTY, DROPOFF_HOURS, 0.0, DROPOFF, 1),
+    ]
+
+
+def multi_leg_plan(legs):
+    """
+    Task list for a pickup at the origin followed by one or more legs.
+
+    ``legs`` is a sequence of ``(drive_time, distance, dwell_hours, kind)``
+    where ``kind`` (``PICKUP`` or ``DROPOFF``) is the on-duty work done at
+    the stop the leg ends at. Legs are numbered from 1.
+    """
+    plan = [(ON_DUTY, PICKUP_HOURS, 0.0, PICKUP, 0)]
+    for leg, (drive_time, distance, dwell_hours, kind) in enumerate(legs, start=1):
+        plan.append((DRIVING, drive_time, distance, DRIVE, leg))
+        plan.append((ON_DUTY, dwell_hours, 0.0, kind, leg))
+    return plan
+
+
+def simulate(plan, current_cycle_hours=0.0, start_time=START_TIME, clocks=None, fuel_interval=None,
+             start_mile=0.0, stop_at=None):
+    """
+    Run the HOS simulation over ``plan`` and return ``(events, clocks)``.
+
+    ``plan`` is a sequence of ``(status, hours, miles, kind)`` tasks where
+    status is ``DRIVING`` or ``ON_DUTY``, optionally followed by the leg
+    index copied onto the task's events (and the breaks and rests inserted
+    while driving it). Driving tasks are split by the breaks and rests they
+    need; on-duty tasks are never split. The clocks carry from each task
+    into the next, so a multi-leg trip is still one pass. ``clocks`` and
+    ``start_mile`` let a caller continue from an earlier simulation (or
+    from ``replay`` of what actually happened).
+
+    With ``fuel_interval`` (miles), driving is also split so the truck
+    never goes further than that between fuel stops; each fuel stop is
+    ``FUEL_HOURS`` on duty, which also counts as the 30-minute break.
+
+    ``stop_at(kind, mile, earliest)`` places the fuel stops, breaks and
+    rests that cut driving short: given the ``mile`` where the rules force a
+    stop of ``kind`` and the truck's current mile ``earliest``, it returns
+    the mile in ``(earliest, mile]`` to stop at (``mile`` itself when there
+    is nowhere better). The stop is taken there, early, and its clocks
+    count from there, so the next fuel stop is never more than
+    ``fuel_interval`` miles after the one actually taken.
+    """
+    if clocks is None:
+        clocks = DutyClocks(cycle=float(current_cycle_hours))
+
+    events = []
+    append = events.append
+    now = float(start_time)
+    mile = float(start_mile)
+    # Kind of the stop placed by ``stop_at`` that the truck has driven to
+    due = None
+
+    for task in plan:
+        status, hours, miles, kind = task[:4]
+        leg = task[4] if len(task) > 4 else 0
+        if status != DRIVING:
+            if hours <= EPSILON:
+                continue
+            if clocks.shift_start is None:
+                clocks.shift_start = now
+            append(DutyEvent(ON_DUTY, now, now + hours, mile, mile, kind, leg))
+            now += hours
+            clocks.cycle += hours
+            if hours >= BREAK_HOURS:
+                clocks.since_break = 0.0
+            continue
+
+        remaining = hours
+        speed = miles / hours if hours > EPSILON else 0.0
+        task_end_mile = mile + miles
+        while remaining > EPSILON:
+            if clocks.shift_start is None:
+                clocks.shift_start = now
+
+            cycle_left = CYCLE_LIMIT_HOURS - clocks.cycle
+            shift_left = min(
+                MAX_DRIVING_HOURS - clocks.driving,
+                clocks.shift_start + DUTY_WINDOW_HOURS - now,
+            )
+            break_left = BREAK_AFTER_DRIVING_HOURS - clocks.since_break
+            # Hours of driving left before the next fuel stop
+            fuel_left = (fuel_interval - clocks.since_fuel) / speed if fuel_interval and speed > 0 else math.inf
+
+            if cycle_left <= EPSILON or due == RESTART:
+                append(DutyEvent(OFF_DUTY, now, now + RESTART_HOURS, mile, mile, RESTART, leg))
+                now += RESTART_HOURS
+                clocks.reset_shift()
+                clocks.cycle = 0.0
+                due = None
+                continue
+            if shift_left <= EPSILON or due == REST:
+                append(DutyEvent(SLEEPER_BERTH, now, now + REST_HOURS, mile, mile, REST, leg))
+                now += REST_HOURS
+                clocks.reset_shift()
+                due = None
+                continue
+            if fuel_left <= EPSILON or due == FUEL:
+                append(DutyEvent(ON_DUTY, now, now + FUEL_HOURS, mile, mile, FUEL, leg))
+                now += FUEL_HOURS
+                clocks.cycle += FUEL_HOURS
+                clocks.since_break = 0.0
+                clocks.since_fuel = 0.0
+                due = None
+                continue
+            if break_left <= EPSILON or due == BREAK:
+                append(DutyEvent(OFF_DUTY, now, now + BREAK_HOURS, mile, mile, BREAK, leg))
+                now += BREAK_HOURS
+                clocks.since_break = 0.0
+                due = None
+                continue
+
+            drive = min(remaining, cycle_left, shift_left, break_left, fuel_left)
+            # The last chunk of a task lands exactly on the task's end mile
+            end_mile = mile + drive * speed if remaining - drive > EPSILON else task_end_mile
+            if stop_at is not None and remaining - drive > EPSILON and speed > 0:
+                # A stop cuts this stretch short: drive on to where it is placed
+                if drive == cycle_left:
+                    due = RESTART
+                elif drive == shift_left:
+                    due = REST
+                elif drive == fuel_left:
+                    due = FUEL
+                else:
+                    due = BREAK
+                placed = stop_at(due, end_mile, mile)
+                if placed < end_mile:
+                    end_mile = placed
+                    drive = (end_mile - mile) / speed
+            append(DutyEvent(DRIVING, now, now + drive, mile, end_mile, DRIVE, leg))
+            now += drive
+            clocks.since_fuel += end_mile - mile
+            mile = end_mile
+            remaining -= drive
+            clocks.driving += drive
+            clocks.since_break += drive
+            clocks.cycle += drive
+
+    return events, clocks
+
+
+def replay(events, clocks):
+    """
+    Advance ``clocks`` over duty events that already happened and return them.
+
+    ``events`` are in time order and may leave gaps, which count as off
+    duty. Consecutive off-duty and sleeper-berth time adds up: 30 minutes
+    of it is a break, ``REST_HOURS`` starts a new shift and
+    ``RESTART_HOURS`` also resets the cycle, as in ``simulate``.
+    """
+    off_start = None
+    now = None
+
+    def rest_until(end):
+        hours = end - off_start
+        if hours >= RESTART_HOURS - EPSILON:
+            clocks.cycle = 0.0
+        if hours >= REST_HOURS - EPSILON:
+            clocks.reset_shift()
+        elif hours >= BREAK_HOURS - EPSILON:
+            clocks.since_break = 0.0
+
+    for event in events:
+        if now is not None and event.start > now and off_start is None:
+            off_start = now
+        now = event.end
+        if event.status in (OFF_DUTY, SLEEPER_BERTH):
+            if off_start is None:
+                off_start = event.start
+            continue
+        if off_start is not None:
+            rest_until(event.start)
+            off_start = None
+
+        hours = event.end - event.start
+        if clocks.shift_start is None:
+            clocks.shift_start = event.start
+        clocks.cycle += hours
+        if event.status == DRIVING:
+            clocks.driving += hours
+            clocks.since_break += hours
+            clocks.since_fuel += event.end_mile - event.start_mile
+        elif hours >= BREAK_HOURS - EPSILON:
+            clocks.since_break = 0.0
+        if event.kind == FUEL:
+            clocks.since_fuel = 0.0
+
+    if off_start is not None:
+        rest_until(now)
+    return clocks
+
+
+def summarize(events, current_cycle_hours=0.0, start_time=START_TIME):
+    """Aggregate counts and totals of a simulated timeline."""
+    breaks = rests = restarts = fuel_stops = 0
+    on_duty = 0.0
+    for event in events:
+        if event.kind == FUEL:
+            fuel_stops += 1
+        if event.kind == BREAK:
+            breaks += 1
+        elif event.kind == REST:
+            rests += 1
+        elif event.kind == RESTART:
+            restarts += 1
+        elif event.status in (DRIVING, ON_DUTY):
+            on_duty += event.end - event.start
+
+    end = events[-1].end if events else float(start_time)
+    return {
+        'breaks': breaks,
+        'rests': rests,
+        'restarts': restarts,
+        'fuel_stops': fuel_stops,
+        'on_duty_hours': on_duty,
+        'cycle_overflow_hours': max(0.0, on_duty - (CYCLE_LIMIT_HOURS - current_cycle_hours)),
+        'total_trip_hours': end - start_time,
+        'total_trip_days': int((end - EPSILON) // 24) + 1,
+    }
+
+
+def simulate_single_leg_arrays(total_drive_time, current_cycle_hours, start_time=START_TIME,
+                               total_distance=0.0, fuel_interval=None):
+    """
+    Vectorized ``simulate`` of ``single_leg_plan`` trips, one row per trip.
+
+    Every row steps through the same decisions as the scalar loop, in
+    lockstep, with the same floating-point operations in the same order,
+    so results match ``simulate``/``summarize`` exactly. Rows leave the
+    working set as soon as their driving is done, so each step only costs
+    the trips still on the road. Requires NumPy.
+
+    ``total_distance`` and ``fuel_interval`` insert fuel stops as
+    ``simulate`` does. Returns a dict of arrays: ``breaks``, ``rests``,
+    ``restarts``, ``fuel_stops``, ``on_duty_hours`` and ``end`` (time the
+    dropoff finishes).
+    """
+    if np is None:
+        raise RuntimeError('NumPy is required for vectorized HOS simulation')
+
+    drive_time, cycle_hours, distance = np.broadcast_arrays(
+        np.asarray(total_drive_time, dtype=float), np.asarray(current_cycle_hours, dtype=float),
+        np.asarray(total_distance, dtype=float))
+    shape = drive_time.shape
+    size = drive_time.size
+
+    # Pickup: on duty from start_time, which also counts as the 30-minute break
+    start = float(start_time)
+    now = np.full(size, start + PICKUP_HOURS)
+    on_duty = np.full(size, 0.0 + ((start + PICKUP_HOURS) - start))
+    cycle = cycle_hours.ravel() + PICKUP_HOURS
+    shift_start = np.full(size, start)
+    driving = np.zeros(size)
+    since_break = np.zeros(size)
+    remaining = drive_time.ravel().copy()
+    task_end_mile = 0.0 + distance.ravel()
+    speed = np.zeros(size)
+    np.divide(distance.ravel(), remaining, out=speed, where=remaining > EPSILON)
+    mile = np.zeros(size)
+    since_fuel = np.zeros(size)
+    breaks = np.zeros(size, dtype=np.int64)
+    rests = np.zeros(size, dtype=np.int64)
+    restarts = np.zeros(size, dtype=np.int64)
+    fuel_stops = np.zeros(size, dtype=np.int64)
+
+    out_now = now.copy()
+    out_on_duty = on_duty.copy()
+    rows = np.arange(size)
+    state = (rows, now, on_duty, cycle, shift_start, driving, since_break, remaining,
+             task_end_mile, speed, mile, since_fuel)
+    live = remaining > EPSILON
+    (rows, now, on_duty, cycle, shift_start, driving, since_break, remaining,
+     task_end_mile, speed, mile, since_fuel) = (array[live] for array in state)
+
+    def hours_to_fuel():
+        if not fuel_interval:
+            return np.full(rows.size, math.inf)
+        left = np.full(rows.size, math.inf)
+        np.divide(fuel_interval - since_fuel, speed, out=left, where=speed > 0)
+        return left
+
+    # Each step applies at most one break/rest/restart/fuel stop and then one
+    # driving stretch to every live row, which is the order the scalar loop takes.
+    while rows.size:
+        restart = CYCLE_LIMIT_HOURS - cycle <= EPSILON
+        rest = ~restart & (np.minimum(
+            MAX_DRIVING_HOURS - driving, shift_start + DUTY_WINDOW_HOURS - now) <= EPSILON)
+        fuel = ~restart & ~rest & (hours_to_fuel() <= EPSILON)
+        take_break = ~restart & ~rest & ~fuel & (BREAK_AFTER_DRIVING_HOURS - since_break <= EPSILON)
+
+        if restart.any():
+            restarts[rows[restart]] += 1
+            now[restart] += RESTART_HOURS
+            cycle[restart] = 0.0
+        if rest.any():
+            rests[rows[rest]] += 1
+            now[rest] += REST_HOURS
+        if fuel.any():
+            fuel_stops[rows[fuel]] += 1
+            fueled_to = now[fuel] + FUEL_HOURS
+            on_duty[fuel] += fueled_to - now[fuel]
+            now[fuel] = fueled_to
+            cycle[fuel] += FUEL_HOURS
+            since_break[fuel] = 0.0
+            since_fuel[fuel] = 0.0
+        if take_break.any():
+            breaks[rows[take_break]] += 1
+            now[take_break] += BREAK_HOURS
+            since_break[take_break] = 0.0
+        reset = restart | rest
+        if reset.any():
+            driving[reset] = 0.0
+            since_break[reset] = 0.0
+            # The next shift starts when the driver comes back on duty
+            shift_start[reset] = now[reset]
+
+        cycle_left = CYCLE_LIMIT_HOURS - cycle
+        shift_left = np.minimum(MAX_DRIVING_HOURS - driving, shift_start + DUTY_WINDOW_HOURS - now)
+        break_left = BREAK_AFTER_DRIVING_HOURS - since_break
+        fuel_left = hours_to_fuel()
+        drive = (cycle_left > EPSILON) & (shift_left > EPSILON) & (break_left > EPSILON) & (fuel_left > EPSILON)
+
+        hours = np.minimum(np.minimum(np.minimum(np.minimum(
+            remaining, cycle_left), shift_left), break_left), fuel_left)
+        hours[~drive] = 0.0
+        driven_to = now + hours
+        on_duty += np.where(drive, driven_to - now, 0.0)
+        now = np.where(drive, driven_to, now)
+        # The last chunk lands exactly on the trip's end mile
+        end_mile = np.where(remaining - hours > EPSILON, mile + hours * speed, task_end_mile)
+        end_mile = np.where(drive, end_mile, mile)
+        since_fuel += end_mile - mile
+        mile = end_mile
+        remaining -= hours
+        driving += hours
+        since_break += hours
+        cycle += hours
+
+        done = remaining <= EPSILON
+        if done.any():
+            out_now[rows[done]] = now[done]
+            out_on_duty[rows[done]] = on_duty[done]
+            state = (rows, now, on_duty, cycle, shift_start, driving, since_break, remaining,
+                     task_end_mile, speed, mile, since_fuel)
+            live = ~done
+            (rows, now, on_duty, cycle, shift_start, driving, since_break, remaining,
+             task_end_mile, speed, mile, since_fuel) = (array[live] for array in state)
+
+    # Dropoff
+    end = out_now + DROPOFF_HOURS
+    on_duty = out_on_duty + (end - out_now)
+
+    return {
+        'breaks': breaks.reshape(shape),
+        'rests': rests.reshape(shape),
+        'restarts': restarts.reshape(shape),
+        'fuel_stops': fuel_stops.reshape(shape),
+        'on_duty_hours': on_duty.reshape(shape),
+        'end': end.reshape(shape),
+    }
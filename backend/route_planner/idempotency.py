@@ -0,0 +1,137 @@
+"""
+Idempotency-Key support for calculate_route.
+
+The first request with a key claims it by inserting an IdempotencyKey row
+(the unique index arbitrates between concurrent duplicates). Duplicates
+wait for the claimant to store its response and replay it, so retries
+never plan or write the trip graph twice. Claims whose request died are
+taken over after a lease; completed keys expire after a TTL.
+
+Keys are bound to the request body as the client sent it
+(``request_hash``), not to the payload after server-side defaults are
+filled in: those can change between attempts (the driver's cycle ledger
+moves once the first attempt saves its trip).
+"""
+import asyncio
+import hashlib
+import json
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+POLL_INTERVAL = 0.05
+
+
+class IdempotencyConflict(Exception):
+    """The key belongs to a different request, or its request is still running."""
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def request_hash(data):
+    """SHA-256 of a request body as the client sent it"""
+    canonical = json.dumps(data, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def try_claim(key, request_hash):
+    """
+    One attempt at claiming ``key``; returns ``(record, replay)`` as
+    ``claim`` does, or ``None`` while an identical request is still running.
+    """
+    while True:
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    key=key,
+                    request_hash=request_hash,
+                    expires_at=now + timedelta(seconds=settings.ROUTE_PLANNER_IDEMPOTENCY_TTL_SECONDS),
+                )
+            return record, None
+        except IntegrityError:
+            pass
+
+        record = IdempotencyKey.objects.filter(key=key).first()
+        if record is None:
+            # Released in the meantime
+            continue
+
+        lease_expired = (record.response is None and
+                         record.created_at <= now - timedelta(seconds=settings.ROUTE_PLANNER_IDEMPOTENCY_LEASE_SECONDS))
+        if record.expires_at <= now or lease_expired:
+            IdempotencyKey.objects.filter(pk=record.pk).delete()
+            continue
+
+        if record.request_hash != request_hash:
+            raise IdempotencyConflict('Idempotency-Key was already used with a different request', 422)
+        if record.response is not None:
+            return None, record
+        return None
+
+
+def claim(key, request_hash):
+    """
+    Claim ``key`` for the request identified by ``request_hash``.
+
+    Returns ``(record, None)`` when the caller should do the work and then
+    ``complete`` or ``release`` the record, or ``(None, record)`` with the
+    completed record of an earlier identical request to replay.
+    """
+    deadline = time.monotonic() + settings.ROUTE_PLANNER_IDEMPOTENCY_WAIT_SECONDS
+    while (claimed := try_claim(key, request_hash)) is None:
+        if time.monotonic() >= deadline:
+            raise IdempotencyConflict('A request with this Idempotency-Key is still in progress', 409)
+        time.sleep(POLL_INTERVAL)
+    return claimed
+
+
+async def aclaim(key, request_hash):
+    """
+    ``claim`` for async views.
+
+    Waits with ``asyncio.sleep`` and only runs single attempts on the sync
+    thread, so a waiting duplicate never holds the thread that the request
+    it waits for needs to ``complete`` its key.
+    """
+    deadline = time.monotonic() + settings.ROUTE_PLANNER_IDEMPOTENCY_WAIT_SECONDS
+    while (claimed := await sync_to_async(try_claim)(key, request_hash)) is None:
+        if time.monotonic() >= deadline:
+            raise IdempotencyConflict('A request with this Idempotency-Key is still in progress', 409)
+        await asyncio.sleep(POLL_INTERVAL)
+    return claimed
+
+
+def complete(record, status_code, body, trip_id=None):
+    """
+    Store the response of a claimed key so duplicates can replay it.
+
+    Returns False, storing nothing, when the claim's lease expired and
+    another request took the key over. Call it in the transaction that
+    saved the trip, so the trip can be rolled back then.
+    """
+    record.status_code = status_code
+    record.response = body
+    record.trip_id = trip_id
+    updated = IdempotencyKey.objects.filter(pk=record.pk, request_hash=record.request_hash).update(
+        status_code=status_code, response=body, trip_id=trip_id)
+    return bool(updated)
+
+
+def release(record):
+    """Give a claimed key back after a failure so the client can retry."""
+    IdempotencyKey.objects.filter(pk=record.pk).delete()
+
+
+def purge_expired():
+    """Delete expired keys; returns how many were removed."""
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
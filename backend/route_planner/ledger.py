@@ -0,0 +1,205 @@
+"""
+Per-driver ledger of daily on-duty hours for the 70-hour/8-day cycle.
+
+Each driver has one ``DriverCycleLedger`` row holding a fixed 8-slot ring
+buffer of daily on-duty totals and their running sum. Recording a day
+rolls the window forward (clearing at most 8 slots) and adjusts the sum,
+so the cycle hours of any driver are one indexed row read, with no query
+over trip or log history.
+
+Generated log sheets add their on-duty hours when a trip with a
+``driver_id`` is saved, starting on the day the trip starts (in its
+home terminal's zone) or, without a ``start_at``, was planned;
+actual log sheets submitted by the driver replace the totals of their
+days. Only days up to today move the window: hours planned for later days
+are kept apart in ``planned_hours`` and enter the ring when it reaches
+them, so a long planned trip never pushes recent days out of it.
+"""
+from datetime import date, timedelta
+
+from django.utils import timezone
+
+from . import hos, timezones
+from .models import DriverCycleLedger
+
+CYCLE_DAYS = 8
+ON_DUTY_STATUSES = (hos.DRIVING, hos.ON_DUTY)
+
+
+def on_duty_hours(activities):
+    """On-duty (driving and on duty not driving) hours of a log sheet's activities"""
+    return sum(
+        float(activity['endTime']) - float(activity['startTime'])
+        for activity in activities
+        if activity['status'] in ON_DUTY_STATUSES
+    )
+
+
+def _slot(day):
+    return day.toordinal() % CYCLE_DAYS
+
+
+def advance(ledger, day):
+    """Roll the ring forward so its window ends on ``day``, taking in the hours planned up to it"""
+    if ledger.last_day is not None and day <= ledger.last_day:
+        return
+    if ledger.last_day is None or (day - ledger.last_day).days >= CYCLE_DAYS:
+        ledger.day_hours = [0.0] * CYCLE_DAYS
+        ledger.total_hours = 0.0
+    else:
+        for offset in range(1, (day - ledger.last_day).days + 1):
+            slot = _slot(ledger.last_day + timedelta(days=offset))
+            ledger.total_hours -= ledger.day_hours[slot]
+            ledger.day_hours[slot] = 0.0
+    ledger.last_day = day
+
+    for key in [key for key in ledger.planned_hours if date.fromisoformat(key) <= day]:
+        hours = ledger.planned_hours.pop(key)
+        planned_day = date.fromisoformat(key)
+        if _in_window(ledger, planned_day):
+            ledger.day_hours[_slot(planned_day)] += hours
+            ledger.total_hours += hours
+
+
+def _in_window(ledger, day):
+    return (ledger.last_day is not None
+            and timedelta(0) <= ledger.last_day - day < timedelta(days=CYCLE_DAYS))
+
+
+def _is_planned(ledger, day, today):
+    return day > (today or timezone.localdate()) and (ledger.last_day is None or day > ledger.last_day)
+
+
+def add_hours(ledger, day, hours, today=None):
+    """
+    Add on-duty ``hours`` to ``day``.
+
+    Days already out of the window are ignored; days after ``today``
+    (default: the current date) are kept as planned.
+    """
+    if _is_planned(ledger, day, today):
+        key = day.isoformat()
+        ledger.planned_hours[key] = ledger.planned_hours.get(key, 0.0) + hours
+        return
+    advance(ledger, day)
+    if _in_window(ledger, day):
+        ledger.day_hours[_slot(day)] += hours
+        ledger.total_hours += hours
+
+
+def set_hours(ledger, day, hours):
+    """Replace the on-duty total of ``day``"""
+    advance(ledger, day)
+    if _in_window(ledger, day):
+        slot = _slot(day)
+        ledger.total_hours += hours - ledger.day_hours[slot]
+        ledger.day_hours[slot] = hours
+
+
+def day_hours(ledger, day):
+    """On-duty hours of ``day``, recorded in the window or planned after it"""
+    if _in_window(ledger, day):
+        return ledger.day_hours[_slot(day)]
+    if ledger.last_day is None or day > ledger.last_day:
+        return ledger.planned_hours.get(day.isoformat(), 0.0)
+    return 0.0
+
+
+def used_hours(ledger, today):
+    """On-duty hours in the 8 days ending ``today``"""
+    if today == ledger.last_day:
+        return max(0.0, ledger.total_hours)
+    # Window ends before or after today: sum the 8 days from the ring or the plans
+    return max(0.0, sum(day_hours(ledger, today - timedelta(days=offset)) for offset in range(CYCLE_DAYS)))
+
+
+def cycle_hours(driver_id, today=None):
+    """Cycle hours a driver has used as of ``today``; 0 for unknown drivers."""
+    ledger = DriverCycleLedger.objects.filter(driver_id=driver_id).first()
+    if ledger is None:
+        return 0.0
+    return used_hours(ledger, today or timezone.localdate())
+
+
+def summary(ledger, today=None):
+    """API representation of a driver's cycle."""
+    today = today or timezone.localdate()
+    used = used_hours(ledger, today)
+    return {
+        'driverId': ledger.driver_id,
+        'date': today.isoformat(),
+        'cycleHours': used,
+        'remainingHours': max(0.0, hos.CYCLE_LIMIT_HOURS - used),
+        'days': [
+            {
+                'date': (today - timedelta(days=offset)).isoformat(),
+                'hours': day_hours(ledger, today - timedelta(days=offset)),
+            }
+            for offset in reversed(range(CYCLE_DAYS))
+        ],
+    }
+
+
+def _locked_ledger(driver_id):
+    ledger, _ = DriverCycleLedger.objects.select_for_update().get_or_create(driver_id=driver_id)
+    return ledger
+
+
+def trip_start_date(trip):
+    """Date of a saved trip's first log sheet"""
+    if trip.start_at is not None:
+        return timezone.localdate(trip.start_at, timezones.get_zone(trip.time_zone))
+    return timezone.localdate(trip.created_at)
+
+
+def record_trip_sheets(trips):
+    """
+    Add generated log sheets to their drivers' ledgers.
+
+    ``trips`` is a list of ``(trip, log_sheets)`` for saved trips; those
+    without a ``driver_id`` are skipped. Must run inside a transaction.
+    """
+    by_driver = {}
+    for trip, log_sheets in trips:
+        if trip.driver_id:
+            by_driver.setdefault(trip.driver_id, []).append((trip, log_sheets))
+
+    for driver_id, driver_trips in by_driver.items():
+        ledger = _locked_ledger(driver_id)
+        for trip, log_sheets in driver_trips:
+            start = trip_start_date(trip)
+            for offset, sheet in enumerate(log_sheets):
+                add_hours(ledger, start + timedelta(days=offset), on_duty_hours(sheet['activities']))
+        ledger.save()
+
+
+def adjust_trip_sheets(trip, hours):
+    """
+    Add the change in on-duty hours of a re-planned trip's log sheets.
+
+    ``hours`` maps 1-based trip days to the hours gained (or lost, when
+    negative). Trips without a ``driver_id`` are skipped. Must run inside
+    a transaction.
+    """
+    hours = {day: delta for day, delta in hours.items() if delta}
+    if not trip.driver_id or not hours:
+        return
+    ledger = _locked_ledger(trip.driver_id)
+    start = trip_start_date(trip)
+    for day, delta in sorted(hours.items()):
+        add_hours(ledger, start + timedelta(days=day - 1), delta)
+    ledger.save()
+
+
+def record_actual_sheets(driver_id, sheets):
+    """
+    Replace the totals of the days covered by a driver's actual log sheets.
+
+    ``sheets`` is a list of ``(date, activities)``. Must run inside a
+    transaction. Returns the updated ledger.
+    """
+    ledger = _locked_ledger(driver_id)
+    for day, activities in sorted(sheets, key=lambda sheet: sheet[0]):
+        set_hours(ledger, day, on_duty_hours(activities))
+    ledger.save()
+    return ledger
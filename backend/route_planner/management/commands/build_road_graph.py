@@ -0,0 +1,23 @@
+from xml.etree.ElementTree import ParseError
+
+from django.core.management.base import BaseCommand, CommandError
+
+from route_planner.routing import parse_osm, save_graph
+
+
+class Command(BaseCommand):
+    help = 'Convert an OSM XML extract into the compact road graph used for server-side routing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='OpenStreetMap XML extract (.osm)')
+        parser.add_argument('output', help='Road graph file to write (.npz)')
+
+    def handle(self, *args, input, output, **options):
+        if not output.endswith('.npz'):
+            raise CommandError('The output file must end in .npz')
+        try:
+            graph = parse_osm(input)
+            save_graph(graph, output)
+        except (OSError, ParseError, RuntimeError) as e:
+            raise CommandError(str(e))
+        self.stdout.write(f'{len(graph)} nodes, {len(graph.targets)} edges written to {output}')
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from route_planner.exports import FORMATS, export_trips, parse_bound
+
+
+class Command(BaseCommand):
+    help = 'Stream stored trips and their ELD logs as NDJSON or CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', dest='export_format', choices=sorted(FORMATS), default='ndjson')
+        parser.add_argument('--start', help='Only trips created at or after this ISO date/datetime')
+        parser.add_argument('--end', help='Only trips created up to this ISO date (inclusive) or before this datetime')
+        parser.add_argument('--output', help='File to write to instead of stdout')
+
+    def handle(self, *args, export_format, start, end, output, **options):
+        try:
+            start = parse_bound(start) if start else None
+            end = parse_bound(end, end=True) if end else None
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        lines = export_trips(export_format, start, end)
+        if output:
+            with open(output, 'w', newline='', encoding='utf-8') as f:
+                f.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from route_planner.idempotency import purge_expired
+
+
+class Command(BaseCommand):
+    help = 'Delete expired calculate-route Idempotency-Key records'
+
+    def handle(self, *args, **options):
+        deleted = purge_expired()
+        self.stdout.write(f'Deleted {deleted} expired idempotency keys')
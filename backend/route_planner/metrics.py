@@ -0,0 +1,272 @@
+"""
+Per-request performance metrics in Prometheus text format.
+
+``MetricsMiddleware`` records, for every request, the wall time, the
+number of SQL queries, the bytes received and sent, and the time spent
+in each named ``stage()`` (validation, HOS computation, DB writes,
+serialization, ...). The current request's measurements live in a
+context variable, so stages can be timed from anywhere in the call
+stack, including code run through ``sync_to_async``/``asyncio.to_thread``.
+Stages timed in a batch pool worker are sent back with its result and
+added to the request that asked for it (``collect_stages``/``add_stages``).
+
+Values are aggregated into histograms held in process memory and served
+by ``metrics_view`` at ``/metrics``; each worker process reports its own
+series. Requests slower than ``ROUTE_PLANNER_SLOW_REQUEST_SECONDS`` are
+logged to ``route_planner.slow_requests`` with their stage timings and
+SQL.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+
+logger = logging.getLogger('route_planner.slow_requests')
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+BYTES_BUCKETS = (100, 1000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+
+_current = ContextVar('route_planner_request_metrics', default=None)
+
+
+class Histogram:
+    """A labelled Prometheus histogram with fixed buckets."""
+
+    def __init__(self, name, documentation, labels, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), sum of values
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._series.items())
+        for label_values, (counts, total) in series:
+            labels = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(self.labels, label_values))
+            prefix = f'{labels},' if labels else ''
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total:.6g}')
+            lines.append(f'{self.name}_count{{{labels}}} {cumulative}')
+        return '\n'.join(lines)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REQUEST_SECONDS = Histogram(
+    'route_planner_request_duration_seconds', 'Wall time of each request.',
+    ('view', 'method', 'status'), SECONDS_BUCKETS)
+STAGE_SECONDS = Histogram(
+    'route_planner_stage_duration_seconds', 'Time spent in each named stage of a request.',
+    ('view', 'stage'), SECONDS_BUCKETS)
+REQUEST_QUERIES = Histogram(
+    'route_planner_request_queries', 'SQL queries run by each request.',
+    ('view',), QUERY_BUCKETS)
+REQUEST_BYTES_IN = Histogram(
+    'route_planner_request_bytes_in', 'Request body size in bytes.',
+    ('view',), BYTES_BUCKETS)
+REQUEST_BYTES_OUT = Histogram(
+    'route_planner_response_bytes_out', 'Response body size in bytes.',
+    ('view',), BYTES_BUCKETS)
+
+HISTOGRAMS = (REQUEST_SECONDS, STAGE_SECONDS, REQUEST_QUERIES, REQUEST_BYTES_IN, REQUEST_BYTES_OUT)
+
+
+class RequestMetrics:
+    """Measurements collected while one request is handled."""
+    __slots__ = ('stages', 'queries')
+
+    def __init__(self):
+        self.stages = {}
+        # (sql, seconds) of every query
+        self.queries = []
+
+
+@contextmanager
+def stage(name):
+    """Time a named stage of the current request; free outside of a request."""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.stages[name] = metrics.stages.get(name, 0.0) + time.perf_counter() - start
+
+
+@contextmanager
+def collect_stages():
+    """Time ``stage()``s into a fresh dict, outside of any request (e.g. in a pool worker)."""
+    metrics = RequestMetrics()
+    token = _current.set(metrics)
+    try:
+        yield metrics.stages
+    finally:
+        _current.reset(token)
+
+
+def add_stages(stages):
+    """Add stage timings measured elsewhere to the current request, if any."""
+    metrics = _current.get()
+    if metrics is not None:
+        for name, seconds in stages.items():
+            metrics.stages[name] = metrics.stages.get(name, 0.0) + seconds
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper counting the queries of the current request."""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries.append((sql, time.perf_counter() - start))
+
+
+def install_query_recorder(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+connection_created.connect(install_query_recorder)
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else 'unmatched'
+
+
+class MetricsMiddleware:
+    """Record request metrics; first in ``MIDDLEWARE`` so it sees the whole request."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        install_query_recorder(connections['default'])
+        metrics, token, start = self._start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, metrics, start)
+
+    async def __acall__(self, request):
+        metrics, token, start = self._start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, metrics, start)
+
+    def _start(self):
+        metrics = RequestMetrics()
+        return metrics, _current.set(metrics), time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # Deferred-rendering responses (DRF) render after this returns; time it
+        metrics = _current.get()
+        if metrics is not None:
+            started = time.perf_counter()
+
+            def rendered(response):
+                metrics.stages['serialization'] = (
+                    metrics.stages.get('serialization', 0.0) + time.perf_counter() - started)
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def _finish(self, request, response, metrics, start):
+        elapsed = time.perf_counter() - start
+        view = _view_name(request)
+
+        REQUEST_SECONDS.observe(elapsed, view, request.method, str(response.status_code))
+        for name, seconds in metrics.stages.items():
+            STAGE_SECONDS.observe(seconds, view, name)
+        REQUEST_QUERIES.observe(len(metrics.queries), view)
+        REQUEST_BYTES_IN.observe(int(request.META.get('CONTENT_LENGTH') or 0), view)
+        if response.streaming:
+            response.streaming_content = _count_streamed(response, view)
+        else:
+            REQUEST_BYTES_OUT.observe(len(response.content), view)
+
+        threshold = settings.ROUTE_PLANNER_SLOW_REQUEST_SECONDS
+        if threshold and elapsed >= threshold:
+            logger.warning(
+                'Slow request %s %s took %.3fs (%d queries); stages: %s\n%s',
+                request.method, request.path, elapsed, len(metrics.queries),
+                ', '.join(f'{name}={seconds:.3f}s' for name, seconds in metrics.stages.items()),
+                '\n'.join(f'  [{seconds:.4f}s] {sql}' for sql, seconds in metrics.queries),
+            )
+        return response
+
+
+def _count_streamed(response, view):
+    """Re-yield a streaming body, observing its size once it has been sent."""
+    content = response.streaming_content
+
+    if response.is_async:
+        async def counted():
+            sent = 0
+            async for chunk in content:
+                sent += len(chunk)
+                yield chunk
+            REQUEST_BYTES_OUT.observe(sent, view)
+        return counted()
+
+    def counted():
+        sent = 0
+        for chunk in content:
+            sent += len(chunk)
+            yield chunk
+        REQUEST_BYTES_OUT.observe(sent, view)
+    return counted()
+
+
+def render():
+    """All histograms in the Prometheus text exposition format."""
+    return '\n'.join(histogram.render() for histogram in HISTOGRAMS) + '\n'
+
+
+def metrics_view(request):
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-17 12:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route_planner', '0002_remove_trip_driver_delete_driver'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trip',
+            name='route_polyline',
+            field=models.TextField(blank=True),
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    First step of moving the string time columns to numeric types: add
+    nullable numeric columns next to the old ones so existing rows keep
+    working while 0006 backfills them.
+    """
+
+    dependencies = [
+        ('route_planner', '0004_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stop',
+            name='arrival_hours',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='logsheet',
+            name='day',
+            field=models.PositiveSmallIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='logactivity',
+            name='start_hours',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='logactivity',
+            name='end_hours',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='trip',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,102 @@
+import re
+
+from django.db import migrations, transaction
+
+BATCH_SIZE = 1000
+
+CLOCK_TIME = re.compile(r'^\s*(\d{1,2}):(\d{2})\s*([AP]M)\s*$', re.IGNORECASE)
+DAY_LABEL = re.compile(r'(\d+)')
+
+
+def parse_clock_time(value):
+    """Hour of the day of a "2:30 PM" style time, None if unparseable"""
+    match = CLOCK_TIME.match(value or '')
+    if not match:
+        return None
+    hour, minute, period = int(match[1]) % 12, int(match[2]), match[3].upper()
+    return hour + (12 if period == 'PM' else 0) + minute / 60
+
+
+def parse_hours(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def batches(queryset):
+    batch = []
+    for row in queryset.iterator(chunk_size=BATCH_SIZE):
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def backfill_stops(apps, schema_editor):
+    """
+    Stop times only kept the clock time, so the trip day is recovered from
+    the stop order: every time the clock goes backwards a day has passed.
+    """
+    Stop = apps.get_model('route_planner', 'Stop')
+    queryset = Stop.objects.filter(arrival_hours__isnull=True).order_by('trip_id', 'sequence', 'id')
+    trip_id, previous, offset = None, None, 0
+    for batch in batches(queryset):
+        for stop in batch:
+            if stop.trip_id != trip_id:
+                trip_id, previous, offset = stop.trip_id, None, 0
+            hour = parse_clock_time(stop.arrival_time)
+            if hour is None:
+                hour = previous - offset if previous is not None else 0.0
+            if previous is not None and hour + offset < previous:
+                offset += 24
+            stop.arrival_hours = previous = hour + offset
+        with transaction.atomic():
+            Stop.objects.bulk_update(batch, ['arrival_hours'])
+
+
+def backfill_log_sheets(apps, schema_editor):
+    LogSheet = apps.get_model('route_planner', 'LogSheet')
+    queryset = LogSheet.objects.filter(day__isnull=True).order_by('trip_id', 'id')
+    trip_id, position = None, 0
+    for batch in batches(queryset):
+        for sheet in batch:
+            if sheet.trip_id != trip_id:
+                trip_id, position = sheet.trip_id, 0
+            position += 1
+            match = DAY_LABEL.search(sheet.date or '')
+            sheet.day = int(match[1]) if match else position
+        with transaction.atomic():
+            LogSheet.objects.bulk_update(batch, ['day'])
+
+
+def backfill_log_activities(apps, schema_editor):
+    LogActivity = apps.get_model('route_planner', 'LogActivity')
+    queryset = LogActivity.objects.filter(start_hours__isnull=True).order_by('id')
+    for batch in batches(queryset):
+        for activity in batch:
+            activity.start_hours = parse_hours(activity.start_time)
+            activity.end_hours = parse_hours(activity.end_time)
+        with transaction.atomic():
+            LogActivity.objects.bulk_update(batch, ['start_hours', 'end_hours'])
+
+
+class Migration(migrations.Migration):
+    """
+    Backfill the numeric time columns in batches, each committed on its
+    own, so the tables stay writable while large histories are converted.
+    Rows already converted are skipped, so the migration can be resumed.
+    """
+    atomic = False
+
+    dependencies = [
+        ('route_planner', '0005_numeric_time_columns'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_stops, migrations.RunPython.noop),
+        migrations.RunPython(backfill_log_sheets, migrations.RunPython.noop),
+        migrations.RunPython(backfill_log_activities, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,90 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Last step of the numeric time columns: drop the string columns, give the
+    numeric ones their final names and add the composite indexes.
+    """
+
+    dependencies = [
+        ('route_planner', '0006_backfill_numeric_time_columns'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='stop',
+            name='arrival_time',
+        ),
+        migrations.RenameField(
+            model_name='stop',
+            old_name='arrival_hours',
+            new_name='arrival_time',
+        ),
+        migrations.AlterField(
+            model_name='stop',
+            name='arrival_time',
+            field=models.FloatField(),
+        ),
+        migrations.RemoveField(
+            model_name='logsheet',
+            name='date',
+        ),
+        migrations.AlterField(
+            model_name='logsheet',
+            name='day',
+            field=models.PositiveSmallIntegerField(),
+        ),
+        migrations.RemoveField(
+            model_name='logactivity',
+            name='start_time',
+        ),
+        migrations.RemoveField(
+            model_name='logactivity',
+            name='end_time',
+        ),
+        migrations.RenameField(
+            model_name='logactivity',
+            old_name='start_hours',
+            new_name='start_time',
+        ),
+        migrations.RenameField(
+            model_name='logactivity',
+            old_name='end_hours',
+            new_name='end_time',
+        ),
+        migrations.AlterField(
+            model_name='logactivity',
+            name='start_time',
+            field=models.FloatField(),
+        ),
+        migrations.AlterField(
+            model_name='logactivity',
+            name='end_time',
+            field=models.FloatField(),
+        ),
+        migrations.AlterModelOptions(
+            name='stop',
+            options={'ordering': ['sequence']},
+        ),
+        migrations.AlterModelOptions(
+            name='logsheet',
+            options={'ordering': ['day']},
+        ),
+        migrations.AlterModelOptions(
+            name='logactivity',
+            options={'ordering': ['start_time']},
+        ),
+        migrations.AddIndex(
+            model_name='stop',
+            index=models.Index(fields=['trip', 'sequence'], name='stop_trip_sequence_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='logsheet',
+            index=models.Index(fields=['trip', 'day'], name='logsheet_trip_day_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='logactivity',
+            index=models.Index(fields=['log_sheet', 'start_time'], name='activity_sheet_start_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.3 on 2026-10-17 12:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route_planner', '0007_drop_string_time_columns'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='logsheet',
+            name='duty_grid',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='logsheet',
+            name='grid_notes',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.3 on 2026-10-17 12:45
+
+from django.db import migrations, models
+
+
+def number_single_leg_stops(apps, schema_editor):
+    """Trips saved so far are single-leg: only the origin pickup is leg 0"""
+    Stop = apps.get_model('route_planner', 'Stop')
+    Stop.objects.filter(sequence__gt=0).update(leg=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route_planner', '0008_logsheet_duty_grid'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stop',
+            name='leg',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.RunPython(number_single_leg_stops, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.3 on 2026-10-17 12:47
+
+import route_planner.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route_planner', '0009_stop_leg'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DriverCycleLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('driver_id', models.CharField(max_length=64, unique=True)),
+                ('day_hours', models.JSONField(default=route_planner.models.empty_cycle_days)),
+                ('last_day', models.DateField(blank=True, null=True)),
+                ('total_hours', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='driver_id',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.3 on 2026-10-17 13:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route_planner', '0010_driver_cycle_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stop',
+            name='arrival_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='stop',
+            name='time_zone',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='start_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='time_zone',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.3 on 2026-10-17 13:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route_planner', '0011_trip_start_at_stop_arrival_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stop',
+            name='lat',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='stop',
+            name='lon',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='stop',
+            name='mile',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
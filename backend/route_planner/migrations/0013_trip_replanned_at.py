@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-17 13:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route_planner', '0012_stop_position'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trip',
+            name='replanned_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
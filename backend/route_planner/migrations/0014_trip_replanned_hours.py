@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-17 13:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route_planner', '0013_trip_replanned_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trip',
+            name='replanned_hours',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
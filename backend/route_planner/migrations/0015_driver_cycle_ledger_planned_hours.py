@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-17 13:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route_planner', '0014_trip_replanned_hours'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='drivercycleledger',
+            name='planned_hours',
+            field=models.JSONField(default=dict),
+        ),
+    ]
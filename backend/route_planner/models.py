@@ -7,7 +7,13 @@ class Trip(models.Model):
     current_cycle_hours = models.FloatField(default=0)
     total_distance = models.FloatField(null=True, blank=True)
     total_drive_time = models.FloatField(null=True, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    route_polyline = models.TextField(blank=True)  # simplified route, Google encoded polyline
+    driver_id = models.CharField(max_length=64, blank=True, db_index=True)
+    start_at = models.DateTimeField(null=True, blank=True)  # real start, when the trip was scheduled on the clock
+    time_zone = models.CharField(max_length=64, blank=True)  # home terminal's zone, for start_at and log sheets
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    replanned_at = models.DateTimeField(null=True, blank=True)  # last re-plan; cached results of the first plan are stale
+    replanned_hours = models.FloatField(null=True, blank=True)  # trip hours of the last re-plan; earlier days are as driven
     
     def __str__(self):
         return f"Trip from {self.pickup_location} to {self.dropoff_location}"
@@ -25,24 +31,47 @@ class Stop(models.Model):
     location = models.CharField(max_length=255)
     stop_type = models.CharField(max_length=20, choices=STOP_TYPES)
     duration = models.FloatField()  # in hours
-    arrival_time = models.CharField(max_length=20)  # stored as string for simplicity
+    arrival_time = models.FloatField()  # hours since midnight of the first trip day
     sequence = models.IntegerField()  # order in the trip
+    leg = models.PositiveSmallIntegerField(default=0)  # 0 at the origin, then the leg arriving at the stop
+    arrival_at = models.DateTimeField(null=True, blank=True)  # real arrival, when the trip has a start_at
+    time_zone = models.CharField(max_length=64, blank=True)  # local zone at the stop
+    # Where the stop is, and how many miles into the trip, for re-planning
+    lat = models.FloatField(null=True, blank=True)
+    lon = models.FloatField(null=True, blank=True)
+    mile = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['sequence']
+        indexes = [
+            models.Index(fields=['trip', 'sequence'], name='stop_trip_sequence_idx'),
+        ]
     
     def __str__(self):
         return f"{self.get_stop_type_display()} at {self.location}"
 
 class LogSheet(models.Model):
     trip = models.ForeignKey(Trip, on_delete=models.CASCADE, related_name='log_sheets')
-    date = models.CharField(max_length=50)
+    day = models.PositiveSmallIntegerField()  # 1-based day of the trip
     from_location = models.CharField(max_length=255)
     to_location = models.CharField(max_length=255)
     total_miles = models.IntegerField()
     carrier = models.CharField(max_length=100)
     remarks = models.TextField(blank=True)
     shipping_documents = models.CharField(max_length=255, blank=True)
+    # Packed duty-status grid and its location/remarks sidecar (see duty_grid.py),
+    # used instead of LogActivity rows when ROUTE_PLANNER_LOG_STORAGE is 'packed'
+    duty_grid = models.BinaryField(null=True, blank=True)
+    grid_notes = models.JSONField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['day']
+        indexes = [
+            models.Index(fields=['trip', 'day'], name='logsheet_trip_day_idx'),
+        ]
     
     def __str__(self):
-        return f"Log Sheet for {self.date}"
+        return f"Log Sheet for Day {self.day}"
 
 class LogActivity(models.Model):
     ACTIVITY_TYPES = (
@@ -54,10 +83,56 @@ class LogActivity(models.Model):
     
     log_sheet = models.ForeignKey(LogSheet, on_delete=models.CASCADE, related_name='activities')
     status = models.CharField(max_length=20, choices=ACTIVITY_TYPES)
-    start_time = models.CharField(max_length=10)  # stored as string for simplicity (e.g., "8.5")
-    end_time = models.CharField(max_length=10)
+    start_time = models.FloatField()  # hours of the day, 0-24
+    end_time = models.FloatField()
     location = models.CharField(max_length=255)
     remarks = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['start_time']
+        indexes = [
+            models.Index(fields=['log_sheet', 'start_time'], name='activity_sheet_start_idx'),
+        ]
     
     def __str__(self):
-        return f"{self.get_status_display()} from {self.start_time} to {self.end_time}"
\ No newline at end of file
+        return f"{self.get_status_display()} from {self.start_time} to {self.end_time}"
+
+class IdempotencyKey(models.Model):
+    """
+    A client-supplied ``Idempotency-Key`` and the response it produced.
+
+    ``response`` stays null while the first request is still running, so
+    duplicates can wait for it instead of planning the trip again.
+    """
+    key = models.CharField(max_length=255, unique=True)
+    request_hash = models.CharField(max_length=64)
+    trip = models.ForeignKey(Trip, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Idempotency key {self.key}"
+
+def empty_cycle_days():
+    return [0.0] * 8
+
+class DriverCycleLedger(models.Model):
+    """
+    On-duty hours of a driver's last 8 days, for the 70-hour/8-day rule.
+
+    ``day_hours`` is a ring buffer of daily on-duty totals indexed by
+    ``date.toordinal() % 8``, ending on ``last_day``; ``total_hours`` is
+    its running sum. ``planned_hours`` maps ISO dates after ``last_day`` to
+    the hours planned trips put on them. See ``ledger.py``.
+    """
+    driver_id = models.CharField(max_length=64, unique=True)
+    day_hours = models.JSONField(default=empty_cycle_days)
+    last_day = models.DateField(null=True, blank=True)
+    total_hours = models.FloatField(default=0)
+    planned_hours = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Cycle ledger for driver {self.driver_id}"
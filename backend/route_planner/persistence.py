@@ -0,0 +1,265 @@
+import math
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import duty_grid, ledger
+from .models import Trip, Stop, LogSheet, LogActivity
+
+
+def pack_activities(activities):
+    """LogSheet fields holding generated activities as a packed duty grid."""
+    # Generated days run to their midnight, so the last activity ends the day
+    grid, notes = duty_grid.encode([
+        {
+            'status': activity['status'],
+            'start_time': activity['startTime'],
+            'end_time': activity['endTime'],
+            'location': activity['location'],
+            'remarks': activity['remarks'],
+        }
+        for activity in activities
+    ], hours=activities[-1]['endTime'] if activities else None)
+    return {'duty_grid': grid, 'grid_notes': notes}
+
+
+def stop_row(trip, sequence, stop_data):
+    """Unsaved Stop of a generated stop."""
+    return Stop(
+        trip=trip,
+        location=stop_data['location'],
+        stop_type=stop_data['type'].upper(),
+        duration=stop_data['duration'],
+        arrival_time=stop_data['arrivalHours'],
+        sequence=sequence,
+        leg=stop_data.get('leg', 0),
+        arrival_at=parse_datetime(stop_data['arrivalAt']) if stop_data.get('arrivalAt') else None,
+        time_zone=stop_data.get('timeZone') or '',
+        lat=stop_data.get('lat'),
+        lon=stop_data.get('lon'),
+        mile=stop_data.get('mile'),
+    )
+
+
+def log_sheet_row(trip, day, log_data, packed):
+    """Unsaved LogSheet of a generated log sheet, holding its activities if ``packed``."""
+    return LogSheet(
+        trip=trip,
+        day=day,
+        from_location=log_data['from'],
+        to_location=log_data['to'],
+        total_miles=int(float(log_data['totalMiles'])),
+        carrier=log_data['carrier'],
+        remarks=log_data['remarks'],
+        shipping_documents=log_data['shippingDocuments'],
+        **(pack_activities(log_data['activities']) if packed else {})
+    )
+
+
+def activity_rows(sheet, activities):
+    """Unsaved LogActivity rows of a saved log sheet's generated activities."""
+    return [
+        LogActivity(
+            log_sheet=sheet,
+            status=activity['status'],
+            start_time=float(activity['startTime']),
+            end_time=float(activity['endTime']),
+            location=activity['location'],
+            remarks=activity['remarks']
+        )
+        for activity in activities
+    ]
+
+
+def save_trip_plan(trip, processed_route, log_sheets):
+    """Persist one trip graph, see ``save_trip_plans``."""
+    save_trip_plans([(trip, processed_route, log_sheets)])
+    return trip
+
+
+def save_trip_plans(plans):
+    """
+    Persist trips together with their stops, log sheets and log activities.
+
+    ``plans`` is a list of ``(trip, processed_route, log_sheets)`` where
+    ``trip`` is unsaved. Everything is written inside one transaction with
+    a single bulk insert per table, so the number of queries does not grow
+    with the length or number of trips. Any error rolls all of them back.
+
+    With ``ROUTE_PLANNER_LOG_STORAGE = 'packed'`` each day's activities are
+    stored on its LogSheet as a packed duty grid instead of LogActivity rows.
+    Trips with a ``driver_id`` also add their on-duty hours to the driver's
+    cycle ledger.
+    """
+    if not plans:
+        return []
+
+    with transaction.atomic():
+        trips = Trip.objects.bulk_create([trip for trip, _, _ in plans])
+
+        Stop.objects.bulk_create([
+            stop_row(trip, index, stop_data)
+            for trip, processed_route, _ in plans
+            for index, stop_data in enumerate(processed_route['stops'])
+        ])
+
+        sheet_plans = [
+            (trip, day, log_data)
+            for trip, _, log_sheets in plans
+            for day, log_data in enumerate(log_sheets, start=1)
+        ]
+        packed = settings.ROUTE_PLANNER_LOG_STORAGE == 'packed'
+        sheets = LogSheet.objects.bulk_create([
+            log_sheet_row(trip, day, log_data, packed)
+            for trip, day, log_data in sheet_plans
+        ])
+
+        if not packed:
+            LogActivity.objects.bulk_create([
+                activity
+                for sheet, (_, _, log_data) in zip(sheets, sheet_plans)
+                for activity in activity_rows(sheet, log_data['activities'])
+            ])
+
+        ledger.record_trip_sheets([(trip, log_sheets) for trip, _, log_sheets in plans])
+
+    return trips
+
+
+STOP_FIELDS = ('location', 'stop_type', 'duration', 'arrival_time', 'leg', 'arrival_at', 'time_zone',
+               'lat', 'lon', 'mile')
+LOG_SHEET_FIELDS = ('from_location', 'to_location', 'total_miles', 'carrier', 'remarks',
+                    'shipping_documents', 'duty_grid', 'grid_notes')
+
+
+def _same_value(current, new):
+    # Binary columns read back as memoryview on some backends
+    if isinstance(current, memoryview):
+        current = bytes(current)
+    # Re-planned times and positions carry rounding noise
+    if isinstance(current, float) and isinstance(new, float):
+        return math.isclose(current, new, rel_tol=1e-9, abs_tol=1e-9)
+    return current == new
+
+
+def _copy_changes(current, row, fields):
+    """Copy the differing ``fields`` of ``row`` onto ``current``; True if any did"""
+    changed = [field for field in fields if not _same_value(getattr(current, field), getattr(row, field))]
+    for field in changed:
+        setattr(current, field, getattr(row, field))
+    return bool(changed)
+
+
+def _stored_activities(sheet):
+    """Activities of a saved log sheet as generated activity dicts"""
+    if sheet.duty_grid is not None:
+        activities = duty_grid.decode(bytes(sheet.duty_grid), sheet.grid_notes)
+    else:
+        activities = [vars(activity) for activity in sheet.activities.all()]
+    return [
+        {
+            'status': activity['status'],
+            'startTime': activity['start_time'],
+            'endTime': activity['end_time'],
+            'location': activity['location'],
+            'remarks': activity['remarks'],
+        }
+        for activity in activities
+    ]
+
+
+def _activity_keys(activities):
+    return [
+        (activity['status'], float(activity['startTime']), float(activity['endTime']),
+         activity['location'], activity['remarks'])
+        for activity in activities
+    ]
+
+
+def save_trip_replan(trip, replan):
+    """
+    Write a re-planned trip (see ``replan.replan_trip``) over its saved rows.
+
+    Only rows from the re-plan point on are read, and only those that
+    differ are written. The ``droppedStops`` are deleted. Stops from
+    ``firstSequence`` are matched by sequence and log sheets from
+    ``firstLogDay`` by day: surplus rows are deleted first, then differing
+    rows bulk-updated and missing ones created. A changed sheet's
+    LogActivity rows are replaced. The driver's cycle ledger gets the change
+    in on-duty hours of every day, and ``Trip.replanned_at`` is set so
+    cached calculate-route results of the trip are no longer served;
+    ``Trip.replanned_hours`` is where the next re-plan starts its sheets.
+    The number of queries does not depend on the trip's length.
+
+    Run it in the transaction that locked the trip (``select_for_update``)
+    before ``replan_trip`` read it, so concurrent re-plans of the trip are
+    serialized.
+
+    Returns the number of ``created``, ``updated`` and ``deleted`` rows of
+    ``stops`` and ``logSheets``.
+    """
+    first_sequence, first_day = replan['firstSequence'], replan['firstLogDay']
+    packed = settings.ROUTE_PLANNER_LOG_STORAGE == 'packed'
+    changes = {}
+
+    with transaction.atomic():
+        trip.replanned_at, trip.replanned_hours = timezone.now(), replan['replannedHours']
+        Trip.objects.filter(pk=trip.pk).update(replanned_at=trip.replanned_at,
+                                               replanned_hours=trip.replanned_hours)
+
+        stored = {stop.sequence: stop for stop in Stop.objects.filter(trip=trip, sequence__gte=first_sequence)}
+        created, updated = [], []
+        for sequence, stop_data in enumerate(replan['stops'], start=first_sequence):
+            row = stop_row(trip, sequence, stop_data)
+            current = stored.pop(sequence, None)
+            if current is None:
+                created.append(row)
+            elif _copy_changes(current, row, STOP_FIELDS):
+                updated.append(current)
+        deleted = [*replan['droppedStops'], *stored]
+        Stop.objects.filter(trip=trip, sequence__in=deleted).delete()
+        Stop.objects.bulk_update(updated, STOP_FIELDS)
+        Stop.objects.bulk_create(created)
+        changes['stops'] = {'created': len(created), 'updated': len(updated), 'deleted': len(deleted)}
+
+        stored = {sheet.day: sheet for sheet in
+                  LogSheet.objects.filter(trip=trip, day__gte=first_day).prefetch_related('activities')}
+        created, updated, replaced = [], [], []
+        hours = {}
+        for day, log_data in enumerate(replan['logSheets'], start=first_day):
+            row = log_sheet_row(trip, day, log_data, packed)
+            current = stored.pop(day, None)
+            new_hours = ledger.on_duty_hours(log_data['activities'])
+            if current is None:
+                created.append((row, log_data))
+                hours[day] = new_hours
+                continue
+            old_activities = _stored_activities(current)
+            activities_changed = (packed != (current.duty_grid is not None) or
+                                  (not packed and _activity_keys(old_activities) !=
+                                   _activity_keys(log_data['activities'])))
+            if _copy_changes(current, row, LOG_SHEET_FIELDS) or activities_changed:
+                updated.append(current)
+                hours[day] = new_hours - ledger.on_duty_hours(old_activities)
+                if activities_changed:
+                    replaced.append((current, log_data))
+        for day, sheet in stored.items():
+            hours[day] = -ledger.on_duty_hours(_stored_activities(sheet))
+
+        LogSheet.objects.filter(pk__in=[sheet.pk for sheet in stored.values()]).delete()
+        LogSheet.objects.bulk_update(updated, LOG_SHEET_FIELDS)
+        sheets = LogSheet.objects.bulk_create([row for row, _ in created])
+        LogActivity.objects.filter(log_sheet__in=[sheet for sheet, _ in replaced]).delete()
+        if not packed:
+            LogActivity.objects.bulk_create([
+                activity
+                for sheet, log_data in [*zip(sheets, [log_data for _, log_data in created]), *replaced]
+                for activity in activity_rows(sheet, log_data['activities'])
+            ])
+        changes['logSheets'] = {'created': len(created), 'updated': len(updated), 'deleted': len(stored)}
+
+        ledger.adjust_trip_sheets(trip, hours)
+
+    return changes
@@ -0,0 +1,302 @@
+"""
+Server-side rendering of ELD log sheets to SVG and PDF.
+
+Each log sheet is laid out once as a list of drawing primitives on a
+US Letter landscape page (792 x 612 points, origin top left): the header,
+the 24-hour duty grid with the duty-status line and per-status totals,
+and the remarks. The SVG and PDF writers only translate those
+primitives, so both formats look the same. Both are plain Python; PDF
+pages use the standard Helvetica fonts so nothing has to be embedded.
+
+Rendered documents are cached in the Django cache named by
+``ROUTE_PLANNER_RENDER_CACHE``, keyed by a hash of the sheets' content,
+so downloading an unchanged log again costs one cache read.
+"""
+import hashlib
+import json
+import zlib
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import hos
+from .exports import sheet_activities
+from .services import format_time
+
+# Bump when the layout changes so cached renders are not reused
+RENDER_VERSION = 1
+
+FORMATS = {
+    'svg': 'image/svg+xml',
+    'pdf': 'application/pdf',
+}
+
+PAGE_WIDTH = 792
+PAGE_HEIGHT = 612
+MARGIN = 36
+
+GRID_LEFT = 110
+GRID_TOP = 130
+HOUR_WIDTH = 24
+ROW_HEIGHT = 40
+GRID_RIGHT = GRID_LEFT + 24 * HOUR_WIDTH
+GRID_BOTTOM = GRID_TOP + 4 * ROW_HEIGHT
+
+# Grid rows, top to bottom, and the colours of the duty line on each
+ROWS = [
+    (hos.OFF_DUTY, 'Off Duty', '#64748b'),
+    (hos.SLEEPER_BERTH, 'Sleeper Berth', '#6366f1'),
+    (hos.DRIVING, 'Driving', '#2563eb'),
+    (hos.ON_DUTY, 'On Duty', '#16a34a'),
+]
+ROW_INDEX = {status: index for index, (status, _, _) in enumerate(ROWS)}
+
+TEXT_COLOR = '#1a1a1a'
+GRID_COLOR = '#999999'
+LIGHT_GRID_COLOR = '#dddddd'
+CONNECTOR_COLOR = '#999999'
+
+REMARKS_TOP = GRID_BOTTOM + 60
+LINE_HEIGHT = 14
+REMARKS_BOTTOM = PAGE_HEIGHT - 56
+
+DEFAULT_LOCATION = 'En route'
+
+
+def get_cache():
+    return caches[settings.ROUTE_PLANNER_RENDER_CACHE]
+
+
+def sheet_content(sheet):
+    """Everything drawn on a stored log sheet, as plain JSON-able data."""
+    return {
+        'day': sheet.day,
+        'from': sheet.from_location,
+        'to': sheet.to_location,
+        'miles': sheet.total_miles,
+        'carrier': sheet.carrier,
+        'remarks': sheet.remarks,
+        'shipping_documents': sheet.shipping_documents,
+        'activities': [
+            [activity['status'], float(activity['start_time']), float(activity['end_time']),
+             activity['location'], activity['remarks']]
+            for activity in sheet_activities(sheet)
+        ],
+    }
+
+
+def content_hash(contents):
+    """SHA-256 of the canonical content of a list of sheets."""
+    canonical = json.dumps([RENDER_VERSION, contents], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def format_duration(hours):
+    """Hours as ``H:MM``"""
+    minutes = int(round(hours * 60))
+    return f"{minutes // 60}:{minutes % 60:02d}"
+
+
+def layout(content):
+    """
+    Drawing primitives of one log sheet page.
+
+    Primitives are ``('text', x, y, size, bold, text)``,
+    ``('line', x1, y1, x2, y2, width, color)`` and
+    ``('path', points, width, color)``.
+    """
+    items = []
+    text = lambda x, y, size, value, bold=False: items.append(('text', x, y, size, bold, value))
+    line = lambda x1, y1, x2, y2, width=0.5, color=GRID_COLOR: items.append(
+        ('line', x1, y1, x2, y2, width, color))
+
+    # Header
+    text(MARGIN, 48, 18, f"Driver's Daily Log - Day {content['day']}", bold=True)
+    text(MARGIN, 68, 10, f"Carrier: {content['carrier']}    Shipping documents: {content['shipping_documents']}")
+    text(MARGIN, 100, 10, f"From: {content['from']}")
+    text(300, 100, 10, f"To: {content['to']}")
+    text(560, 100, 10, f"Total miles driving today: {content['miles']}")
+
+    # Grid: hour labels, hour lines and quarter-hour ticks
+    for hour in range(25):
+        x = GRID_LEFT + hour * HOUR_WIDTH
+        label = 'MN' if hour in (0, 24) else 'N' if hour == 12 else str(hour % 12)
+        text(x - 3 * len(label), GRID_TOP - 6, 8, label, bold=hour % 6 == 0)
+        line(x, GRID_TOP, x, GRID_BOTTOM, 1 if hour % 6 == 0 else 0.5)
+        if hour == 24:
+            break
+        for quarter in (1, 2, 3):
+            tick = 8 if quarter == 2 else 4
+            qx = x + quarter * HOUR_WIDTH / 4
+            for row in range(4):
+                line(qx, GRID_TOP + row * ROW_HEIGHT, qx, GRID_TOP + row * ROW_HEIGHT + tick, 0.5,
+                     LIGHT_GRID_COLOR)
+    for row in range(5):
+        y = GRID_TOP + row * ROW_HEIGHT
+        line(GRID_LEFT, y, GRID_RIGHT, y, 1)
+
+    # Duty-status line and per-status totals
+    totals = [0.0] * len(ROWS)
+    previous = None
+    for status, start, end, _, _ in content['activities']:
+        if status not in ROW_INDEX:
+            continue
+        row = ROW_INDEX[status]
+        totals[row] += end - start
+        y = GRID_TOP + row * ROW_HEIGHT + ROW_HEIGHT / 2
+        x1 = GRID_LEFT + start * HOUR_WIDTH
+        x2 = GRID_LEFT + end * HOUR_WIDTH
+        if previous is not None and previous != y:
+            line(x1, previous, x1, y, 1.5, CONNECTOR_COLOR)
+        items.append(('path', [(x1, y), (x2, y)], 2.5, ROWS[row][2]))
+        previous = y
+
+    text(GRID_RIGHT + 12, GRID_TOP - 6, 8, 'Total hours', bold=True)
+    for row, (_, label, _) in enumerate(ROWS):
+        y = GRID_TOP + row * ROW_HEIGHT + ROW_HEIGHT / 2 + 4
+        text(MARGIN, y, 10, label, bold=True)
+        text(GRID_RIGHT + 12, y, 10, format_duration(totals[row]))
+    text(GRID_RIGHT + 12, GRID_BOTTOM + 16, 10, format_duration(sum(totals)), bold=True)
+
+    # Remarks: where each stop happened, then the sheet's own remarks
+    text(MARGIN, REMARKS_TOP, 11, 'Remarks', bold=True)
+    remarks = [
+        f"{format_time(start)}  {location}" + (f" - {note}" if note else '')
+        for _, start, _, location, note in content['activities']
+        if location != DEFAULT_LOCATION or note
+    ]
+    if content['remarks']:
+        remarks.append(content['remarks'])
+    capacity = int((REMARKS_BOTTOM - REMARKS_TOP) // LINE_HEIGHT)
+    if len(remarks) > capacity:
+        remarks = remarks[:capacity - 1] + [f"... {len(remarks) - capacity + 1} more"]
+    for index, remark in enumerate(remarks, start=1):
+        text(MARGIN, REMARKS_TOP + index * LINE_HEIGHT, 9, remark)
+
+    line(MARGIN, PAGE_HEIGHT - 40, PAGE_WIDTH - MARGIN, PAGE_HEIGHT - 40, 0.5, LIGHT_GRID_COLOR)
+    text(MARGIN, PAGE_HEIGHT - 26, 8,
+         'I hereby certify that the entries and information contained herein are true and correct.')
+    return items
+
+
+def render_svg(contents):
+    """SVG document with the given sheets stacked one page below the other."""
+    height = PAGE_HEIGHT * len(contents)
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{PAGE_WIDTH}" height="{height}" '
+        f'viewBox="0 0 {PAGE_WIDTH} {height}" font-family="Helvetica, Arial, sans-serif">',
+        f'<rect width="{PAGE_WIDTH}" height="{height}" fill="#ffffff"/>',
+    ]
+    for page, content in enumerate(contents):
+        parts.append(f'<g transform="translate(0 {page * PAGE_HEIGHT})">')
+        for item in layout(content):
+            kind = item[0]
+            if kind == 'text':
+                _, x, y, size, bold, value = item
+                weight = ' font-weight="bold"' if bold else ''
+                parts.append(f'<text x="{x:g}" y="{y:g}" font-size="{size}"{weight} '
+                             f'fill="{TEXT_COLOR}">{escape(value)}</text>')
+            elif kind == 'line':
+                _, x1, y1, x2, y2, width, color = item
+                parts.append(f'<line x1="{x1:g}" y1="{y1:g}" x2="{x2:g}" y2="{y2:g}" '
+                             f'stroke="{color}" stroke-width="{width:g}"/>')
+            else:
+                _, points, width, color = item
+                coordinates = ' '.join(f'{x:g},{y:g}' for x, y in points)
+                parts.append(f'<polyline points="{coordinates}" fill="none" stroke="{color}" '
+                             f'stroke-width="{width:g}" stroke-linecap="round"/>')
+        parts.append('</g>')
+    parts.append('</svg>')
+    return '\n'.join(parts).encode()
+
+
+def _pdf_color(color):
+    return ' '.join(f'{int(color[i:i + 2], 16) / 255:.3f}' for i in (1, 3, 5))
+
+
+def _pdf_text(value):
+    encoded = value.encode('latin-1', errors='replace')
+    return encoded.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+
+def _pdf_page(content):
+    """PDF content stream of one sheet, flipping y to PDF's bottom-left origin."""
+    ops = [f'{_pdf_color(TEXT_COLOR)} rg 1 J'.encode()]
+    for item in layout(content):
+        kind = item[0]
+        if kind == 'text':
+            _, x, y, size, bold, value = item
+            font = 'F2' if bold else 'F1'
+            ops.append(b'BT /%s %d Tf %.2f %.2f Td (%s) Tj ET' % (
+                font.encode(), size, x, PAGE_HEIGHT - y, _pdf_text(value)))
+        elif kind == 'line':
+            _, x1, y1, x2, y2, width, color = item
+            ops.append(b'%s RG %.2f w %.2f %.2f m %.2f %.2f l S' % (
+                _pdf_color(color).encode(), width, x1, PAGE_HEIGHT - y1, x2, PAGE_HEIGHT - y2))
+        else:
+            _, points, width, color = item
+            (x, y), rest = points[0], points[1:]
+            segments = b' '.join(b'%.2f %.2f l' % (px, PAGE_HEIGHT - py) for px, py in rest)
+            ops.append(b'%s RG %.2f w %.2f %.2f m %s S' % (
+                _pdf_color(color).encode(), width, x, PAGE_HEIGHT - y, segments))
+    return b'\n'.join(ops)
+
+
+def render_pdf(contents):
+    """PDF document with one Letter landscape page per sheet."""
+    # Objects 1-4 are the catalog, page tree and fonts; each page adds a
+    # page object and its compressed content stream.
+    page_ids = [5 + 2 * index for index in range(len(contents))]
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+            b' '.join(b'%d 0 R' % page_id for page_id in page_ids), len(contents)),
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>',
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>',
+    ]
+    for page_id, content in zip(page_ids, contents):
+        stream = zlib.compress(_pdf_page(content))
+        objects.append(
+            b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] '
+            b'/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents %d 0 R >>' % (
+                PAGE_WIDTH, PAGE_HEIGHT, page_id + 1))
+        objects.append(b'<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream' % (
+            len(stream), stream))
+
+    output = bytearray(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b'%d 0 obj\n%s\nendobj\n' % (number, body)
+    xref = len(output)
+    output += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    output += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    output += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (
+        len(objects) + 1, xref)
+    return bytes(output)
+
+
+RENDERERS = {
+    'svg': render_svg,
+    'pdf': render_pdf,
+}
+
+
+def render(sheets, render_format):
+    """
+    Render stored log sheets, reusing a cached document when possible.
+
+    Returns ``(document, digest, hit)`` where ``digest`` is the content
+    hash the document is cached under.
+    """
+    contents = [sheet_content(sheet) for sheet in sheets]
+    digest = content_hash(contents)
+    key = f'log-render:{render_format}:{digest}'
+    cache = get_cache()
+    document = cache.get(key)
+    if document is not None:
+        return document, digest, True
+    document = RENDERERS[render_format](contents)
+    cache.set(key, document)
+    return document, digest, False
@@ -0,0 +1,215 @@
+"""
+Re-planning of trips that are already under way.
+
+A delayed driver reports the duty events that actually happened since the
+trip started and where the truck is now. ``replan_trip`` seeds the HOS
+clocks by replaying those events (``hos.replay``), then simulates only the
+legs that are left, starting from the truck's mile. Stops are regenerated
+(placed at facilities, geocoded and localized) for that remaining suffix
+only. Stops already behind the truck are kept as stored, except the
+planned breaks, rests and fuel stops no actual event reports, which did
+not happen. Log sheets are rebuilt from the actual events followed by the
+new plan, from the day of the trip's previous re-plan on: days before it
+already hold the events that actually happened.
+``persistence.save_trip_replan`` then writes only the rows that differ
+from what is stored, so re-planning costs about as much as what is left
+of the trip.
+"""
+from collections import Counter
+
+from . import hos, timezones
+from .geometry import RouteLine, parse_geometry, point_coordinates
+from .services import STOP_TYPES, LogSheetBuilder, StopPlacer, generate_stops, localize_stops
+
+# Stop types of the pickups and dropoffs that end each leg
+LEG_STOP_TYPES = {'PICKUP': hos.PICKUP, 'DROPOFF': hos.DROPOFF}
+
+DUTY_STATUSES = (hos.OFF_DUTY, hos.SLEEPER_BERTH, hos.DRIVING, hos.ON_DUTY)
+EVENT_KINDS = (hos.PICKUP, hos.DROPOFF, hos.DRIVE, hos.BREAK, hos.REST, hos.RESTART, hos.FUEL)
+
+# Stops this close to the truck's mile are where the truck is
+MILE_TOLERANCE = 1e-6
+
+
+def parse_actual_events(events, current_mile):
+    """
+    ``(events, locations)`` of the actual duty events of a re-plan request.
+
+    Each event is ``{"status", "start", "end"}`` in trip hours (as stop
+    arrival times) with optional ``miles`` driven, ``kind`` (``pickup``,
+    ``dropoff``, ``fuel``...) and, for stops, ``location``. Events must be
+    in order and must not overlap. When no driving event gives its miles,
+    ``current_mile`` is spread over the driving time. ``locations`` holds
+    the ``location`` of each event.
+    """
+    if not isinstance(events, list):
+        raise ValueError('events must be a list')
+
+    parsed = []
+    previous_end = None
+    for index, event in enumerate(events):
+        status = event.get('status')
+        if status not in DUTY_STATUSES:
+            raise ValueError(f'Event {index}: status must be one of {", ".join(DUTY_STATUSES)}')
+        kind = event.get('kind') or (hos.DRIVE if status == hos.DRIVING else None)
+        if kind is not None and kind not in EVENT_KINDS:
+            raise ValueError(f'Event {index}: unknown kind {kind!r}')
+        start, end = float(event['start']), float(event['end'])
+        if end < start or (previous_end is not None and start < previous_end - hos.EPSILON):
+            raise ValueError(f'Event {index}: events must be in order and must not overlap')
+        miles = event.get('miles')
+        parsed.append((status, start, end, None if miles is None else float(miles), kind,
+                       event.get('location') or None))
+        previous_end = end
+
+    driving_hours = sum(end - start for status, start, end, *_ in parsed if status == hos.DRIVING)
+    spread = all(miles is None for status, _, _, miles, _, _ in parsed if status == hos.DRIVING)
+
+    duty_events, locations = [], []
+    mile = 0.0
+    completed = 0
+    for status, start, end, miles, kind, location in parsed:
+        if status != hos.DRIVING:
+            miles = 0.0
+        elif spread:
+            miles = current_mile * (end - start) / driving_hours if driving_hours else 0.0
+        # Pickups and dropoffs end the leg they belong to (see hos.DutyEvent)
+        duty_events.append(hos.DutyEvent(status, start, end, mile, mile + (miles or 0.0), kind, completed))
+        locations.append(location)
+        mile += miles or 0.0
+        if kind in (hos.PICKUP, hos.DROPOFF):
+            completed += 1
+    return duty_events, locations
+
+
+def current_trip_mile(trip, leg_stops, position):
+    """Miles into ``trip`` of the point of its route closest to ``position``"""
+    # Older trips saved without a road geometry have no polyline
+    if trip.route_polyline:
+        line = RouteLine(parse_geometry(trip.route_polyline))
+    else:
+        line = RouteLine([(stop.lat, stop.lon) for stop in leg_stops])
+    if not line.length or not trip.total_distance:
+        return 0.0
+    return min(trip.total_distance, line.project(*position) / line.length * trip.total_distance)
+
+
+def remaining_plan(trip, leg_stops, current_mile):
+    """HOS task list of the leg stops not done yet, driving from ``current_mile``"""
+    speed = trip.total_distance / trip.total_drive_time if trip.total_drive_time else 0.0
+    plan = []
+    mile = current_mile
+    for stop in leg_stops:
+        if stop.leg > 0:
+            distance = max(0.0, stop.mile - mile)
+            plan.append((hos.DRIVING, distance / speed if speed else 0.0, distance, hos.DRIVE, stop.leg))
+            mile = max(mile, stop.mile)
+        plan.append((hos.ON_DUTY, stop.duration, 0.0, LEG_STOP_TYPES[stop.stop_type], stop.leg))
+    return plan
+
+
+def replan_trip(trip, position, events, fuel_interval=hos.FUEL_INTERVAL_MILES):
+    """
+    Re-plan what is left of a saved ``trip``.
+
+    ``position`` is the truck's (lat, lon) and ``events`` the duty events
+    that actually happened since the trip started (see
+    ``parse_actual_events``). The leg stops done are counted from the
+    events' pickups and dropoffs. Returns a dict of ``keptStops`` (how many
+    stored stops stay as they are), the ``droppedStops`` (sequences of the
+    stored stops passed that did not happen), the new ``stops`` numbered
+    from ``firstSequence``, the re-planned ``events`` and the trip's
+    ``logSheets`` from day ``firstLogDay`` on (that of the previous re-plan,
+    or the first) and the trip hour ``replannedHours`` of this one.
+
+    Raises ``ValueError`` for malformed events or trips saved without stop
+    positions.
+    """
+    stops = list(trip.stops.all())
+    if any(stop.mile is None or stop.lat is None for stop in stops):
+        raise ValueError('This trip was saved without stop positions and cannot be re-planned')
+    leg_stops = [stop for stop in stops if stop.stop_type in LEG_STOP_TYPES]
+    if not leg_stops:
+        raise ValueError('This trip has no pickup or dropoff to re-plan')
+
+    current_mile = current_trip_mile(trip, leg_stops, point_coordinates(position))
+    actual, locations = parse_actual_events(events, current_mile)
+    completed = sum(1 for event in actual if event.kind in (hos.PICKUP, hos.DROPOFF))
+    if completed > len(leg_stops):
+        raise ValueError(f'The trip has {len(leg_stops)} pickups and dropoffs, {completed} were reported')
+    # The truck is never behind the last stop it worked at
+    if completed:
+        current_mile = max(current_mile, leg_stops[completed - 1].mile)
+
+    points = [{'name': stop.location, 'lat': stop.lat, 'lon': stop.lon} for stop in leg_stops]
+    route_data = {
+        'total_distance': trip.total_distance,
+        'total_drive_time': trip.total_drive_time,
+        'points': points,
+        'legs': points[1:],
+        'geometry': trip.route_polyline or None,
+    }
+    placer = StopPlacer(route_data)
+
+    clocks = hos.replay(actual, hos.DutyClocks(cycle=trip.current_cycle_hours))
+    now = actual[-1].end if actual else stops[0].arrival_time
+    remaining, _ = hos.simulate(
+        remaining_plan(trip, leg_stops[completed:], current_mile), start_time=now, clocks=clocks,
+        fuel_interval=fuel_interval, start_mile=current_mile, stop_at=placer.stop_at)
+
+    # Stored stops stay up to the first leg stop not done or stop still
+    # ahead; one where the truck is now stays if it was to be over by now.
+    # Other stops passed stay only as far as actual events report them
+    reported = Counter(STOP_TYPES[event.kind].upper() for event in actual
+                       if event.kind in STOP_TYPES and event.kind not in (hos.PICKUP, hos.DROPOFF))
+    kept, dropped = [], []
+    legs_kept = 0
+    first_sequence = stops[-1].sequence + 1
+    for stop in stops:
+        if stop.stop_type in LEG_STOP_TYPES:
+            if legs_kept == completed:
+                first_sequence = stop.sequence
+                break
+            legs_kept += 1
+        elif stop.mile > current_mile + MILE_TOLERANCE or (
+                stop.mile > current_mile - MILE_TOLERANCE and stop.arrival_time + stop.duration > now):
+            first_sequence = stop.sequence
+            break
+        elif not reported[stop.stop_type]:
+            dropped.append(stop)
+            continue
+        else:
+            reported[stop.stop_type] -= 1
+        kept.append(stop)
+
+    schedule = None
+    if trip.start_at is not None:
+        schedule = timezones.Schedule(trip.start_at, timezones.get_zone(trip.time_zone))
+    new_stops = generate_stops(route_data, remaining, first_sequence=first_sequence, placer=placer)
+    localize_stops(new_stops, schedule)
+
+    # Stop-kind actual events are logged at their reported location, or at
+    # that of the next kept stop of the same type
+    log_stops = []
+    unmatched = iter(kept)
+    for event, location in zip(actual, locations):
+        if event.kind not in STOP_TYPES:
+            continue
+        stop_type = STOP_TYPES[event.kind].upper()
+        stored = next((stop for stop in unmatched if stop.stop_type == stop_type), None)
+        log_stops.append({'location': location or (stored.location if stored else 'En route')})
+    from_hours = min(now, trip.replanned_hours) if trip.replanned_hours is not None else 0.0
+    builder = LogSheetBuilder(log_stops + new_stops, schedule=schedule, from_hours=from_hours)
+    for event in actual + remaining:
+        builder.add(event)
+
+    return {
+        'keptStops': len(kept),
+        'droppedStops': [stop.sequence for stop in dropped],
+        'firstSequence': first_sequence,
+        'stops': new_stops,
+        'events': remaining,
+        'firstLogDay': builder.first_day + 1,
+        'logSheets': builder.finish(),
+        'replannedHours': now,
+    }
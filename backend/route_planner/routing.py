@@ -0,0 +1,272 @@
+"""
+Server-side routing over a local road graph.
+
+The graph is read from an OpenStreetMap XML extract (streamed with
+``iterparse``, so only nodes and drivable ways are kept in memory) into
+compressed sparse row (CSR) arrays: ``offsets[u]:offsets[u + 1]`` are
+the edges leaving node ``u``, whose ``targets``, ``hours`` (travel time)
+and ``miles`` live in parallel flat arrays. ``save_graph`` writes those
+arrays to ``.npz`` (``manage.py build_road_graph``) so large extracts are
+parsed once; ``load_graph`` reads either format. Servers load the
+configured graph when they start (``core/wsgi.py``, ``core/asgi.py``).
+
+Shortest (fastest) paths are found with A*, using the straight-line
+distance at the graph's top speed as an admissible heuristic. Endpoints
+are snapped to the nearest graph node through a ``spatial.PointGrid``,
+and the routes between node pairs are kept in an in-process LRU cache.
+"""
+import heapq
+import math
+import os
+import threading
+import xml.etree.ElementTree as ElementTree
+from array import array
+from collections import OrderedDict, defaultdict, namedtuple
+
+from django.conf import settings
+
+from . import spatial
+from .geometry import haversine
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - NumPy is optional
+    np = None
+
+# Assumed speed (mph) of each drivable highway class without a maxspeed tag
+HIGHWAY_SPEEDS = {
+    'motorway': 65, 'motorway_link': 45,
+    'trunk': 55, 'trunk_link': 40,
+    'primary': 50, 'primary_link': 35,
+    'secondary': 45, 'secondary_link': 30,
+    'tertiary': 35, 'tertiary_link': 25,
+    'unclassified': 30, 'residential': 25,
+}
+KMH_PER_MPH = 1.609344
+
+Route = namedtuple('Route', ['miles', 'hours', 'coordinates'])
+
+
+def parse_maxspeed(value, default):
+    """mph of an OSM ``maxspeed`` tag ("55 mph", "90" km/h); ``default`` if unparsable"""
+    try:
+        number, _, unit = value.strip().partition(' ')
+        speed = float(number)
+    except (AttributeError, ValueError):
+        return default
+    return speed if unit.strip() == 'mph' else speed / KMH_PER_MPH
+
+
+class RoadGraph:
+    """A directed road graph in CSR form."""
+
+    def __init__(self, lats, lons, offsets, targets, hours, miles):
+        self.lats = lats
+        self.lons = lons
+        self.offsets = offsets
+        self.targets = targets
+        self.hours = hours
+        self.miles = miles
+        self.max_speed = max((m / h for m, h in zip(miles, hours) if h > 0), default=1.0)
+        self.index = spatial.PointGrid(lats, lons)
+
+    def __len__(self):
+        return len(self.lats)
+
+    @classmethod
+    def from_edges(cls, lats, lons, edges):
+        """Build from ``(source, target, hours, miles)`` edges over nodes 0..n-1"""
+        outgoing = defaultdict(list)
+        for source, target, hours, miles in edges:
+            outgoing[source].append((target, hours, miles))
+        offsets, targets, edge_hours, edge_miles = array('q', [0]), array('q'), array('d'), array('d')
+        for node in range(len(lats)):
+            for target, hours, miles in outgoing.get(node, ()):
+                targets.append(target)
+                edge_hours.append(hours)
+                edge_miles.append(miles)
+            offsets.append(len(targets))
+        return cls(array('d', lats), array('d', lons), offsets, targets, edge_hours, edge_miles)
+
+    def shortest_path(self, source, target):
+        """``Route`` of the fastest path between two nodes, None if unreachable"""
+        lats, lons = self.lats, self.lons
+        offsets, targets, hours = self.offsets, self.targets, self.hours
+        target_lat, target_lon = lats[target], lons[target]
+        max_speed = self.max_speed
+
+        best = {source: 0.0}
+        previous = {}
+        settled = set()
+        queue = [(0.0, 0.0, source)]
+        while queue:
+            _, elapsed, node = heapq.heappop(queue)
+            if node == target:
+                break
+            if node in settled:
+                continue
+            settled.add(node)
+            for edge in range(offsets[node], offsets[node + 1]):
+                neighbour = targets[edge]
+                arrival = elapsed + hours[edge]
+                if arrival < best.get(neighbour, math.inf):
+                    best[neighbour] = arrival
+                    previous[neighbour] = (node, edge)
+                    estimate = haversine(lats[neighbour], lons[neighbour], target_lat, target_lon) / max_speed
+                    heapq.heappush(queue, (arrival + estimate, arrival, neighbour))
+        if target not in best:
+            return None
+
+        nodes, miles = [target], 0.0
+        while nodes[-1] != source:
+            node, edge = previous[nodes[-1]]
+            miles += self.miles[edge]
+            nodes.append(node)
+        nodes.reverse()
+        return Route(miles, best[target], [(lats[node], lons[node]) for node in nodes])
+
+
+def parse_osm(path):
+    """``RoadGraph`` of the drivable ways of an OSM XML extract"""
+    coordinates = {}
+    ways = []
+    for _, element in ElementTree.iterparse(path, events=('end',)):
+        if element.tag == 'node':
+            coordinates[element.get('id')] = (float(element.get('lat')), float(element.get('lon')))
+        elif element.tag == 'way':
+            tags = {tag.get('k'): tag.get('v') for tag in element.iter('tag')}
+            highway = tags.get('highway')
+            if highway in HIGHWAY_SPEEDS:
+                oneway = tags.get('oneway', 'yes' if highway == 'motorway' else 'no')
+                ways.append((
+                    [nd.get('ref') for nd in element.iter('nd')],
+                    parse_maxspeed(tags.get('maxspeed'), HIGHWAY_SPEEDS[highway]),
+                    oneway,
+                ))
+        if element.tag in ('node', 'way', 'relation'):
+            element.clear()
+
+    # Number only the nodes drivable ways use
+    numbers = {}
+    lats, lons, edges = [], [], []
+    for refs, speed, oneway in ways:
+        refs = [ref for ref in refs if ref in coordinates]
+        if oneway == '-1':
+            refs.reverse()
+        for ref in refs:
+            if ref not in numbers:
+                numbers[ref] = len(lats)
+                lat, lon = coordinates[ref]
+                lats.append(lat)
+                lons.append(lon)
+        for a, b in zip(refs, refs[1:]):
+            source, target = numbers[a], numbers[b]
+            miles = haversine(lats[source], lons[source], lats[target], lons[target])
+            edges.append((source, target, miles / speed, miles))
+            if oneway not in ('yes', 'true', '1', '-1'):
+                edges.append((target, source, miles / speed, miles))
+    return RoadGraph.from_edges(lats, lons, edges)
+
+
+GRAPH_ARRAYS = ('lats', 'lons', 'offsets', 'targets', 'hours', 'miles')
+
+
+def save_graph(graph, path):
+    """Write the CSR arrays of ``graph`` to a ``.npz`` file. Requires NumPy."""
+    if np is None:
+        raise RuntimeError('NumPy is required to save road graphs')
+    np.savez_compressed(path, **{name: np.asarray(getattr(graph, name)) for name in GRAPH_ARRAYS})
+
+
+def load_graph(path):
+    """``RoadGraph`` of a ``.npz`` file written by ``save_graph`` or of an OSM XML extract"""
+    if not path.endswith('.npz'):
+        return parse_osm(path)
+    if np is None:
+        raise RuntimeError('NumPy is required to load road graphs')
+    # Memoryviews over the arrays index to plain Python numbers as fast as
+    # lists do, without a Python object per node and edge
+    with np.load(path) as arrays:
+        return RoadGraph(*(memoryview(np.ascontiguousarray(arrays[name])) for name in GRAPH_ARRAYS))
+
+
+class Router:
+    """Routes between coordinates over a ``RoadGraph``, cached by node pair."""
+
+    def __init__(self, graph, snap_miles=5.0, cache_size=10_000, version=None):
+        self.graph = graph
+        # Identifies the graph file the router was loaded from
+        self.version = version
+        self.snap_miles = snap_miles
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def snap(self, lat, lon):
+        """Graph node nearest to (lat, lon), None if none is within ``snap_miles``"""
+        found = self.graph.index.nearest_index(lat, lon, self.snap_miles)
+        return found[0] if found is not None else None
+
+    def route(self, origin, destination):
+        """
+        Fastest ``Route`` between two (lat, lon) pairs.
+
+        Raises ``ValueError`` when an endpoint is off the graph or no road
+        connects them.
+        """
+        source, target = self.snap(*origin), self.snap(*destination)
+        for point, node in ((origin, source), (destination, target)):
+            if node is None:
+                raise ValueError(f'No road within {self.snap_miles:g} miles of {point[0]:.5f}, {point[1]:.5f}')
+
+        key = (source, target)
+        with self._lock:
+            route = self._cache.get(key)
+            if route is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return route
+
+        route = self.graph.shortest_path(source, target)
+        if route is None:
+            raise ValueError('No road connects these locations')
+        with self._lock:
+            self._cache[key] = route
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            self.misses += 1
+        return route
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._cache)}
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router():
+    """
+    The process-wide ``Router`` over ``ROUTE_PLANNER_ROAD_GRAPH_PATH``, or
+    None when no graph is configured. Reloaded when the file changes.
+    """
+    global _router
+    path = settings.ROUTE_PLANNER_ROAD_GRAPH_PATH
+    if not path:
+        return None
+    version = (path, os.stat(path).st_mtime_ns)
+    router = _router
+    if router is not None and router.version == version:
+        return router
+    with _router_lock:
+        if _router is None or _router.version != version:
+            _router = Router(
+                load_graph(path),
+                snap_miles=settings.ROUTE_PLANNER_ROUTING_SNAP_MILES,
+                cache_size=settings.ROUTE_PLANNER_ROUTING_CACHE_SIZE,
+                version=version,
+            )
+        return _router
@@ -1,12 +1,32 @@
 from rest_framework import serializers
+from . import duty_grid
 from .models import Trip, Stop, LogSheet, LogActivity
+from .services import format_hours, format_time
+from .timezones import local_isoformat
+
+
+class HoursOfDayField(serializers.FloatField):
+    """Hours of the day, rendered as log activities always have been ("8.5")"""
+    def to_representation(self, value):
+        return format_hours(value)
+
+
+class ClockTimeField(serializers.FloatField):
+    """Hours since midnight of the first trip day, rendered as a clock time ("2:30 PM")"""
+    def to_representation(self, value):
+        return format_time(value)
+
 
 class LogActivitySerializer(serializers.ModelSerializer):
+    start_time = HoursOfDayField()
+    end_time = HoursOfDayField()
+
     class Meta:
         model = LogActivity
         fields = ['status', 'start_time', 'end_time', 'location', 'remarks']
 
 class LogSheetSerializer(serializers.ModelSerializer):
+    date = serializers.SerializerMethodField()
     activities = LogActivitySerializer(many=True, read_only=True)
     
     class Meta:
@@ -14,20 +34,79 @@ class LogSheetSerializer(serializers.ModelSerializer):
         fields = ['date', 'from_location', 'to_location', 'total_miles', 
                   'carrier', 'remarks', 'shipping_documents', 'activities']
 
+    def get_date(self, obj):
+        return f"Day {obj.day}"
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if instance.duty_grid is not None:
+            # Packed storage: decode the day's grid instead of activity rows
+            data['activities'] = [
+                {
+                    'status': activity['status'],
+                    'start_time': format_hours(activity['start_time']),
+                    'end_time': format_hours(activity['end_time']),
+                    'location': activity['location'],
+                    'remarks': activity['remarks'],
+                }
+                for activity in duty_grid.decode(bytes(instance.duty_grid), instance.grid_notes)
+            ]
+        return data
+
 class StopSerializer(serializers.ModelSerializer):
+    arrival_time = ClockTimeField()
+    arrival_at = serializers.SerializerMethodField()
+
     class Meta:
         model = Stop
-        fields = ['location', 'stop_type', 'duration', 'arrival_time', 'sequence']
+        fields = ['location', 'stop_type', 'duration', 'arrival_time', 'arrival_at', 'time_zone',
+                  'sequence', 'leg']
+
+    def get_arrival_at(self, obj):
+        return local_isoformat(obj.arrival_at, obj.time_zone)
 
 class TripSerializer(serializers.ModelSerializer):
+    """
+    Trip with its nested stops and log sheets.
+
+    Accepts optional ``fields`` and ``expand`` collections to project the
+    output: ``fields`` keeps only the named fields, ``expand`` keeps only
+    the named nested relations. Leaving both out returns everything.
+    """
+    EXPANDABLE_FIELDS = ('stops', 'log_sheets')
+
     stops = StopSerializer(many=True, read_only=True)
     log_sheets = LogSheetSerializer(many=True, read_only=True)
+    start_at = serializers.SerializerMethodField()
     
     class Meta:
         model = Trip
         fields = ['id', 'current_location', 'pickup_location', 'dropoff_location', 
                   'current_cycle_hours', 'total_distance', 'total_drive_time', 
-                  'created_at', 'stops', 'log_sheets']
+                  'route_polyline', 'driver_id', 'start_at', 'time_zone', 'created_at',
+                  'stops', 'log_sheets']
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        expand = kwargs.pop('expand', None)
+        super().__init__(*args, **kwargs)
+
+        for name in list(self.fields):
+            if fields is not None and name not in fields:
+                self.fields.pop(name)
+            elif expand is not None and name in self.EXPANDABLE_FIELDS and name not in expand:
+                self.fields.pop(name)
+
+    def get_start_at(self, obj):
+        return local_isoformat(obj.start_at, obj.time_zone)
+
+    @classmethod
+    def selected_relations(cls, fields=None, expand=None):
+        """Nested relations that will be serialized for the given projection."""
+        return [
+            name for name in cls.EXPANDABLE_FIELDS
+            if (fields is None or name in fields) and (expand is None or name in expand)
+        ]
 
 class TripInputSerializer(serializers.Serializer):
     current_location = serializers.CharField(max_length=255)
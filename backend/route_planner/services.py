@@ -1,95 +1,343 @@
-import math
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+
+from . import geocoding, hos, spatial, timezones
+from .metrics import stage
+from .geometry import (
+    SIMPLIFY_TOLERANCE_MILES, RouteLine, encode_polyline, parse_geometry, point_coordinates, simplify,
+)
+
+# Event kind of the work done at the end of each type of leg
+LEG_STOP_KINDS = {
+    'pickup': hos.PICKUP,
+    'dropoff': hos.DROPOFF,
+}
+
+# Stop type shown for each kind of event that stops the truck
+STOP_TYPES = {
+    hos.PICKUP: 'Pickup',
+    hos.DROPOFF: 'Dropoff',
+    hos.BREAK: 'Required Break',
+    hos.REST: 'Required Rest Period',
+    hos.RESTART: 'Required Rest Period',
+    hos.FUEL: 'Fuel',
+}
+
+
+def plan_trip(route_data, current_cycle_hours):
+    """
+    Process HOS regulations and generate ELD logs for one trip.
+
+    The HOS event timeline only feeds the log sheets; it is left out of
+    the returned route, which is what responses and caches hold.
+    """
+    processed_route = process_route_data(route_data, current_cycle_hours)
+    events = processed_route.pop('events')
+    with stage('generate_eld_logs'):
+        log_sheets = generate_eld_logs(processed_route, events)
+    return processed_route, log_sheets
 
 
 def process_route_data(route_data, current_cycle_hours):
     """
     Process pre-computed route data (from the frontend) to determine
     stops and rest periods based on HOS regulations.
+
+    Stops and log sheets are both derived from the duty-status timeline
+    produced by the HOS simulation in ``hos.py``. With ``legs`` (dicts of
+    ``distance``, ``drive_time``, ``dwell_hours``, ``type``, ``name`` and
+    optional ``lat``/``lon``) the trip is a pickup at the first point
+    followed by each leg's drive and dwell, simulated in one pass;
+    otherwise it is a single pickup -> dropoff leg. A fuel stop is planned
+    at least every ``fuel_interval`` miles (0 disables them).
+
+    With a ``start_time`` the timeline starts at that moment instead of
+    8 AM (see ``trip_schedule``) and every stop gets an ``arrivalAt``
+    timestamp in its local time zone.
     """
     total_distance = route_data['total_distance']
     total_distance_km = route_data.get('total_distance_km', total_distance * 1.60934)
     total_drive_time = route_data['total_drive_time']
 
-    # 30 min break every 8 hours of driving
-    required_breaks = math.floor(total_drive_time / 8)
-
-    # 10 hour rest after 11 hours of driving
-    required_rest_periods = math.floor(total_drive_time / 11)
-
-    # 70-hour / 8-day cycle check
-    remaining_cycle_hours = 70 - current_cycle_hours
-    if total_drive_time > remaining_cycle_hours:
-        additional = math.ceil((total_drive_time - remaining_cycle_hours) / 70 * 8)
-        required_rest_periods += additional
-
-    stops = generate_stops(route_data, required_breaks, required_rest_periods)
+    # Simplify the road geometry once; stops are placed along the result
+    geometry = route_data.get('geometry')
+    if geometry:
+        with stage('simplify_geometry'):
+            geometry = simplify(
+                parse_geometry(geometry, route_data.get('geometry_precision', 5)),
+                route_data.get('simplify_tolerance', SIMPLIFY_TOLERANCE_MILES),
+            )
+        route_data = {**route_data, 'geometry': geometry}
+
+    legs = route_data.get('legs')
+    if legs:
+        plan = hos.multi_leg_plan(
+            (leg['drive_time'], leg['distance'], leg['dwell_hours'], LEG_STOP_KINDS[leg['type']])
+            for leg in legs
+        )
+    else:
+        plan = hos.single_leg_plan(total_drive_time, total_distance)
+
+    schedule = trip_schedule(route_data)
+    start_time = schedule.start_hours if schedule is not None else hos.START_TIME
+
+    placer = StopPlacer(route_data)
+    with stage('hos_simulation'):
+        events, _ = hos.simulate(
+            plan, current_cycle_hours, start_time,
+            fuel_interval=route_data.get('fuel_interval', hos.FUEL_INTERVAL_MILES), stop_at=placer.stop_at)
+        summary = hos.summarize(events, current_cycle_hours, start_time)
+
+    with stage('generate_stops'):
+        stops = generate_stops(route_data, events, placer=placer)
+        localize_stops(stops, schedule)
 
     return {
         'totalDistance': total_distance,
         'totalDistanceKm': total_distance_km,
         'totalDriveTime': total_drive_time,
-        'requiredBreaks': required_breaks,
-        'requiredRestPeriods': required_rest_periods,
+        'requiredBreaks': summary['breaks'],
+        'requiredRestPeriods': summary['rests'] + summary['restarts'],
+        'requiredRestarts': summary['restarts'],
+        'requiredFuelStops': summary['fuel_stops'],
+        'cycleOverflowHours': summary['cycle_overflow_hours'],
+        'totalTripHours': summary['total_trip_hours'],
+        'totalTripDays': summary['total_trip_days'],
+        'startTime': schedule.at(start_time).isoformat() if schedule is not None else None,
+        'timeZone': schedule.zone.key if schedule is not None else None,
         'stops': stops,
+        'events': events,
         'points': route_data['points'],
+        'geometry': encode_polyline(geometry) if geometry else None,
     }
 
 
-def generate_stops(route_data, required_breaks, required_rest_periods):
-    """Generate stops with coordinates based on HOS requirements"""
-    total_drive_time = route_data['total_drive_time']
+def trip_schedule(route_data):
+    """
+    ``timezones.Schedule`` of a trip with a ``start_time``, None otherwise.
+
+    Trip hours count from midnight of the first day in the home terminal's
+    zone: ``time_zone`` when given, else the zone of the first point. A
+    ``start_time`` without an offset is read in that zone.
+    """
+    start = parse_datetime(route_data['start_time']) if route_data.get('start_time') else None
+    if start is None:
+        return None
+    zone = timezones.get_zone(route_data.get('time_zone'))
+    if zone is None:
+        zone = timezones.get_time_zone_index().zone_at(*point_coordinates(route_data['points'][0]))
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=zone)
+    return timezones.Schedule(start, zone)
+
+
+def localize_stops(stops, schedule):
+    """Set the ``arrivalAt`` and ``timeZone`` of stops on a trip with a ``schedule``"""
+    if schedule is None:
+        return
+    zone_index = timezones.get_time_zone_index()
+    for stop in stops:
+        zone = zone_index.zone_at(stop['lat'], stop['lon'])
+        stop['arrivalAt'] = schedule.at(stop['arrivalHours'], zone).isoformat()
+        stop['timeZone'] = zone.key
+
+
+def process_route_arrays(total_drive_time, total_distance, current_cycle_hours,
+                         fuel_interval=hos.FUEL_INTERVAL_MILES):
+    """
+    Array-in/array-out ``process_route_data`` for bulk what-if analysis.
+
+    Takes broadcastable NumPy arrays (or scalars) of drive times, distances
+    and cycle hours and returns the HOS columns of ``process_route_data``
+    for every combination, computed with the vectorized HOS simulation.
+    Results match the scalar path exactly. Requires NumPy.
+    """
+    result = hos.simulate_single_leg_arrays(
+        total_drive_time, current_cycle_hours, total_distance=total_distance, fuel_interval=fuel_interval)
+    np = hos.np
+    drive_time, distance, cycle_hours = np.broadcast_arrays(
+        np.asarray(total_drive_time, dtype=float),
+        np.asarray(total_distance, dtype=float),
+        np.asarray(current_cycle_hours, dtype=float),
+    )
+    end = result['end']
+
+    return {
+        'totalDistance': distance,
+        'totalDriveTime': drive_time,
+        'requiredBreaks': result['breaks'],
+        'requiredRestPeriods': result['rests'] + result['restarts'],
+        'requiredRestarts': result['restarts'],
+        'requiredFuelStops': result['fuel_stops'],
+        'cycleOverflowHours': np.maximum(
+            0.0, result['on_duty_hours'] - (hos.CYCLE_LIMIT_HOURS - cycle_hours)),
+        'totalTripHours': end - hos.START_TIME,
+        'totalTripDays': ((end - hos.EPSILON) // 24).astype(np.int64) + 1,
+    }
+
+
+class StopPlacer:
+    """
+    Places the fuel stops, breaks and rests of a trip at known facilities.
+
+    ``stop_at`` is passed to ``hos.simulate``, so the timeline stops the
+    truck where the facility is rather than where the HOS rules force the
+    stop: fuel stops at a station of ``ROUTE_PLANNER_FUEL_STATIONS_PATH``
+    within ``ROUTE_PLANNER_FUEL_SEARCH_MILES`` before that point, breaks and
+    rests at a rest area or truck stop of ``ROUTE_PLANNER_REST_AREAS_PATH``
+    within ``ROUTE_PLANNER_REST_AREA_TOLERANCE_HOURS`` of driving before it.
+    Stops are placed at the mile of the route closest to the facility, and
+    ``place`` returns the facility of each stop placed.
+    """
+
+    def __init__(self, route_data):
+        total_distance = route_data['total_distance']
+        total_drive_time = route_data['total_drive_time']
+        points = route_data['points']
+        geometry = route_data.get('geometry')
+        self.total_distance = total_distance
+        if geometry:
+            self.line = RouteLine(parse_geometry(geometry, route_data.get('geometry_precision', 5)))
+        else:
+            self.line = RouteLine(points) if points else None
+
+        # Kind of event -> (index, miles searched back, radius around the route)
+        speed = total_distance / total_drive_time if total_drive_time else 0.0
+        fuel_snap = (spatial.get_index(settings.ROUTE_PLANNER_FUEL_STATIONS_PATH),
+                     settings.ROUTE_PLANNER_FUEL_SEARCH_MILES, settings.ROUTE_PLANNER_FUEL_STATION_RADIUS_MILES)
+        rest_snap = (spatial.get_index(settings.ROUTE_PLANNER_REST_AREAS_PATH),
+                     settings.ROUTE_PLANNER_REST_AREA_TOLERANCE_HOURS * speed,
+                     settings.ROUTE_PLANNER_REST_AREA_RADIUS_MILES)
+        self.snaps = {hos.FUEL: fuel_snap, hos.BREAK: rest_snap, hos.REST: rest_snap, hos.RESTART: rest_snap}
+        # (kind, mile) of each stop placed -> its facility
+        self.places = {}
+
+    def position(self, mile):
+        """(lat, lon) ``mile`` miles along the route"""
+        return self.line.locate_fraction(mile / self.total_distance if self.total_distance else 0)
+
+    def mile_of(self, lat, lon):
+        """Miles along the route of the point closest to ``(lat, lon)``"""
+        if not self.line.length:
+            return 0.0
+        return self.line.project(lat, lon) / self.line.length * self.total_distance
+
+    def stop_at(self, kind, mile, earliest):
+        """Mile to take a stop of ``kind`` forced at ``mile`` (see ``hos.simulate``)"""
+        if kind not in self.snaps or self.line is None or len(self.line) < 2:
+            return mile
+        index, window_miles, radius_miles = self.snaps[kind]
+        point = snap_to_place(index, self.position, mile, min(window_miles, mile - earliest), radius_miles)
+        if point is None:
+            return mile
+        # Never past the forced mile, never back where the truck already is
+        placed = min(mile, self.mile_of(point['lat'], point['lon']))
+        if placed <= earliest:
+            return mile
+        self.places[kind, placed] = point
+        return placed
+
+    def place(self, event):
+        """Facility the stop of ``event`` was placed at, None if there is none"""
+        return self.places.get((event.kind, event.start_mile))
+
+
+def generate_stops(route_data, events, first_sequence=0, placer=None):
+    """
+    Generate stops with coordinates from the HOS event timeline.
+
+    Pickups and dropoffs are placed at the point of the leg they end (the
+    first point for the origin pickup). Fuel stops, breaks and rests are at
+    the facility ``placer`` (the ``StopPlacer`` the events were simulated
+    with) placed them at. Those without one, and leg stops without
+    coordinates, are placed along the route geometry (``geometry`` points
+    or polyline encoded at ``geometry_precision`` when given, otherwise the
+    ``points`` waypoints) by the miles driven when they start, using the
+    cumulative distance index of ``RouteLine``.
+
+    With a gazetteer configured every stop gets the nearest-city label of
+    its coordinates as ``city`` (reverse geocoded in one batch), which also
+    names the stops left without a place. Otherwise they are numbered from
+    ``first_sequence``.
+    """
     points = route_data['points']
 
     if len(points) < 2:
         return []
 
-    start_point = points[0]
-    end_point = points[-1]
-
-    stops = [{
-        'location': start_point['name'],
-        'type': 'Pickup',
-        'duration': 1,
-        'arrivalTime': format_time(8),
-        'lat': start_point['lat'],
-        'lon': start_point.get('lon', start_point.get('lng')),
-    }]
-
-    total_stops = required_breaks + required_rest_periods
-
-    if total_stops > 0:
-        for i in range(total_stops):
-            position = (i + 1) / (total_stops + 1)
-
-            lat = start_point['lat'] + position * (end_point['lat'] - start_point['lat'])
-            lon_start = start_point.get('lon', start_point.get('lng'))
-            lon_end = end_point.get('lon', end_point.get('lng'))
-            lon = lon_start + position * (lon_end - lon_start)
-
-            stop_type = 'Required Break' if i < required_breaks else 'Required Rest Period'
-            duration = 0.5 if i < required_breaks else 10
-
-            stops.append({
-                'location': f'Stop {i + 1}',
-                'type': stop_type,
-                'duration': duration,
-                'arrivalTime': format_time(8 + position * total_drive_time),
-                'lat': lat,
-                'lon': lon,
-            })
+    if placer is None:
+        placer = StopPlacer(route_data)
+    # Point each leg ends at, indexed by leg (0 is the origin)
+    stop_points = [points[0]] + (route_data.get('legs') or [points[-1]])
+
+    stops = []
+    unnamed = []
+    for event in events:
+        stop_type = STOP_TYPES.get(event.kind)
+        if stop_type is None:
+            continue
+
+        if event.kind in (hos.PICKUP, hos.DROPOFF):
+            point = stop_points[event.leg]
+        else:
+            point = placer.place(event)
+        if point is not None:
+            location = point['name']
+        else:
+            location = f'Stop {first_sequence + len(stops)}'
+            unnamed.append(len(stops))
+        if point is not None and point.get('lat') is not None:
+            lat, lon = point_coordinates(point)
+        else:
+            lat, lon = placer.position(event.start_mile)
+
+        stops.append({
+            'location': location,
+            'type': stop_type,
+            'duration': event.end - event.start,
+            'arrivalTime': format_time(event.start),
+            'arrivalHours': event.start,
+            'lat': lat,
+            'lon': lon,
+            'mile': event.start_mile,
+            'leg': event.leg,
+            'city': None,
+            'arrivalAt': None,
+            'timeZone': None,
+        })
 
-    stops.append({
-        'location': end_point['name'],
-        'type': 'Dropoff',
-        'duration': 1,
-        'arrivalTime': format_time(8 + total_drive_time),
-        'lat': end_point['lat'],
-        'lon': end_point.get('lon', end_point.get('lng')),
-    })
+    geocoder = geocoding.get_geocoder()
+    cities = geocoder.lookup_many([(stop['lat'], stop['lon']) for stop in stops]) if geocoder else ()
+    for stop, city in zip(stops, cities):
+        stop['city'] = city
+    for index in unnamed:
+        stops[index]['location'] = stops[index]['city'] or stops[index]['location']
 
     return stops
 
 
+def snap_to_place(index, position, mile, window_miles, radius_miles):
+    """
+    Place of ``index`` to stop at instead of ``mile`` miles along the route.
+
+    Walks back from ``mile`` over the last ``window_miles`` in steps of
+    ``radius_miles`` (``position`` maps miles to (lat, lon)) and returns,
+    as a ``{'name', 'lat', 'lon'}`` point, the nearest place within
+    ``radius_miles`` of the first sample that has one. None when there is
+    no index or no place near the route.
+    """
+    if index is None or radius_miles <= 0:
+        return None
+    sample = mile
+    while sample >= mile - window_miles and sample >= 0:
+        found = index.nearest(*position(sample), max_miles=radius_miles)
+        if found is not None:
+            place = found[0]
+            return {'name': place.name, 'lat': place.lat, 'lon': place.lon}
+        sample -= radius_miles
+    return None
+
+
 def format_time(hours):
     """Format decimal hours to time string"""
     hour = int(hours) % 24
@@ -102,74 +350,144 @@ def format_time(hours):
     return f"{hour}:{minute:02d} {period}"
 
 
-def generate_eld_logs(processed_route):
-    """Generate ELD log sheets based on the processed route"""
-    total_drive_time = processed_route['totalDriveTime']
-    required_breaks = processed_route['requiredBreaks']
-    required_rest_periods = processed_route['requiredRestPeriods']
-    stops = processed_route['stops']
+def format_hours(hours):
+    """Format decimal hours of a day the way log activities store them ("8", "13.25")"""
+    return f"{round(hours, 2):g}"
 
-    total_trip_hours = (
-        float(total_drive_time) +
-        required_breaks * 0.5 +
-        required_rest_periods * 10 +
-        2
-    )
-    total_trip_days = max(1, math.ceil(total_trip_hours / 24))
-
-    log_sheets = []
-    for day in range(total_trip_days):
-        if day == 0:
-            activities = generate_first_day_activities(stops)
-        elif day == total_trip_days - 1:
-            activities = generate_last_day_activities(stops)
-        else:
-            activities = generate_middle_day_activities()
-
-        from_location = stops[0]['location'] if day == 0 else 'En route'
-        to_location = stops[-1]['location'] if day == total_trip_days - 1 else 'En route'
-
-        log_sheets.append({
-            'date': f"Day {day + 1}",
-            'from': from_location,
-            'to': to_location,
-            'totalMiles': str(int(processed_route['totalDistance'] / total_trip_days)),
-            'carrier': 'ABC Trucking Co.',
-            'activities': activities,
-            'remarks': 'Trip started' if day == 0 else 'Trip completed' if day == total_trip_days - 1 else 'En route',
-            'shippingDocuments': 'BOL #12345'
-        })
 
-    return log_sheets
-
-
-def generate_first_day_activities(stops):
-    return [
-        {'status': 'onDuty', 'startTime': '8', 'endTime': '8.5', 'location': stops[0]['location'], 'remarks': 'Pre-trip inspection'},
-        {'status': 'driving', 'startTime': '8.5', 'endTime': '10.5', 'location': 'En route to pickup', 'remarks': ''},
-        {'status': 'onDuty', 'startTime': '10.5', 'endTime': '11.5', 'location': stops[0]['location'], 'remarks': 'Loading'},
-        {'status': 'driving', 'startTime': '11.5', 'endTime': '14', 'location': 'En route', 'remarks': ''},
-        {'status': 'offDuty', 'startTime': '14', 'endTime': '14.5', 'location': 'Rest area', 'remarks': '30-minute break'},
-        {'status': 'driving', 'startTime': '14.5', 'endTime': '19.5', 'location': 'En route', 'remarks': ''},
-        {'status': 'sleeperBerth', 'startTime': '19.5', 'endTime': '24', 'location': 'Truck stop', 'remarks': 'Rest period'},
-    ]
-
-
-def generate_last_day_activities(stops):
-    return [
-        {'status': 'sleeperBerth', 'startTime': '0', 'endTime': '5.5', 'location': 'Truck stop', 'remarks': 'Rest period continued'},
-        {'status': 'driving', 'startTime': '5.5', 'endTime': '9.5', 'location': 'En route to delivery', 'remarks': ''},
-        {'status': 'onDuty', 'startTime': '9.5', 'endTime': '10.5', 'location': stops[-1]['location'], 'remarks': 'Unloading'},
-        {'status': 'onDuty', 'startTime': '10.5', 'endTime': '11', 'location': stops[-1]['location'], 'remarks': 'Post-trip inspection'},
-        {'status': 'offDuty', 'startTime': '11', 'endTime': '24', 'location': 'Off duty', 'remarks': ''},
-    ]
-
-
-def generate_middle_day_activities():
-    return [
-        {'status': 'sleeperBerth', 'startTime': '0', 'endTime': '5.5', 'location': 'Truck stop', 'remarks': 'Rest period continued'},
-        {'status': 'driving', 'startTime': '5.5', 'endTime': '13.5', 'location': 'En route', 'remarks': ''},
-        {'status': 'offDuty', 'startTime': '13.5', 'endTime': '14', 'location': 'Rest area', 'remarks': '30-minute break'},
-        {'status': 'driving', 'startTime': '14', 'endTime': '19', 'location': 'En route', 'remarks': ''},
-        {'status': 'sleeperBerth', 'startTime': '19', 'endTime': '24', 'location': 'Truck stop', 'remarks': 'Rest period'},
-    ]
+# Location and remarks logged for each kind of event
+ACTIVITY_LABELS = {
+    hos.PICKUP: (None, 'Loading'),
+    hos.DROPOFF: (None, 'Unloading'),
+    hos.DRIVE: ('En route', ''),
+    hos.BREAK: (None, '30-minute break'),
+    hos.REST: (None, 'Rest period'),
+    hos.RESTART: (None, '34-hour restart'),
+    hos.FUEL: (None, 'Fueling'),
+}
+
+
+class LogSheetBuilder:
+    """
+    Incrementally split a duty-status event stream into daily log sheets.
+
+    Events are consumed in order in a single pass. Activities crossing
+    midnight are split, and driven miles are attributed to the day they
+    were driven on. Gaps before the first and after the last event are
+    logged off duty. With a ``schedule`` days end at the home terminal's
+    midnights (so a day is 23 or 25 hours long across DST changes, with
+    activity times counted from its midnight) and each activity also gets
+    ``startAt``/``endAt`` timestamps in the home terminal's zone, the
+    clock ELD logs are kept in.
+
+    With ``from_hours`` only the days from the one containing that trip
+    hour on are logged; earlier events still count towards the miles.
+    """
+
+    def __init__(self, stops, carrier='ABC Trucking Co.', shipping_documents='BOL #12345', schedule=None,
+                 from_hours=0.0):
+        self.schedule = schedule
+        self.carrier = carrier
+        self.shipping_documents = shipping_documents
+        self.first_location = stops[0]['location'] if stops else ''
+        self.last_location = stops[-1]['location'] if stops else ''
+        # Stops are generated in event order, one per stop-kind event
+        self.stop_locations = iter([stop['location'] for stop in stops])
+        self.sheets = []
+        self.activities = []
+        self.day = 0
+        self.clock = 0.0
+        # Cumulative miles, and how many of them earlier sheets reported
+        self.miles = 0.0
+        self.reported_miles = 0
+        # Days before this one are not logged
+        self.first_day = 0
+        while self._midnight(self.first_day + 1) <= from_hours:
+            self.first_day += 1
+
+    def add(self, event):
+        location, remarks = ACTIVITY_LABELS.get(event.kind, ('En route', ''))
+        if event.kind in STOP_TYPES:
+            location = next(self.stop_locations, location)
+        if event.start > self.clock:
+            self._log(hos.OFF_DUTY, self.clock, event.start, 0.0, 'Off duty', '')
+        self._log(event.status, event.start, event.end, event.end_mile - event.start_mile,
+                  location or 'En route', remarks)
+
+    def finish(self):
+        """Pad the last day off duty and return the log sheets."""
+        if self.activities or not self.sheets:
+            self._log(hos.OFF_DUTY, self.clock, self._midnight(self.day + 1), 0.0, 'Off duty', '')
+
+        last = self.sheets[-1]
+        last['to'] = self.last_location
+        if self.day > 1:
+            last['remarks'] = 'Trip completed'
+        return self.sheets
+
+    def _log(self, status, start, end, miles, location, remarks):
+        duration = end - start
+        continued = False
+        if self.day < self.first_day:
+            # Only the miles of days that are not logged count
+            first_midnight = self._midnight(self.first_day)
+            skipped_end = min(end, first_midnight)
+            self.miles += miles * (skipped_end - start) / duration if duration else 0.0
+            continued = skipped_end > start
+            self.clock = start = skipped_end
+            if skipped_end < first_midnight:
+                return
+            self.day = self.first_day
+            self.reported_miles = int(round(self.miles))
+        while end - start > hos.EPSILON:
+            day_start, midnight = self._midnight(self.day), self._midnight(self.day + 1)
+            piece_end = min(end, midnight)
+            piece_miles = miles * (piece_end - start) / duration if duration else 0.0
+            self.activities.append({
+                'status': status,
+                'startTime': format_hours(start - day_start),
+                'endTime': format_hours(piece_end - day_start),
+                'location': location,
+                'remarks': f'{remarks} continued' if continued and remarks else remarks,
+                'startAt': self.schedule.at(start).isoformat() if self.schedule is not None else None,
+                'endAt': self.schedule.at(piece_end).isoformat() if self.schedule is not None else None,
+            })
+            self.miles += piece_miles
+            self.clock = start = piece_end
+            if piece_end >= midnight:
+                self._close_day()
+                continued = True
+
+    def _midnight(self, day):
+        """Trip hours of the midnight that starts ``day``"""
+        return self.schedule.midnight(day) if self.schedule is not None else day * 24
+
+    def _close_day(self):
+        first = self.day == 0
+        # Round the running total so the daily miles add up to the trip
+        day_miles = int(round(self.miles)) - self.reported_miles
+        self.reported_miles += day_miles
+        self.sheets.append({
+            'date': f"Day {self.day + 1}",
+            'from': self.first_location if first else 'En route',
+            'to': 'En route',
+            'totalMiles': str(day_miles),
+            'carrier': self.carrier,
+            'activities': self.activities,
+            'remarks': 'Trip started' if first else 'En route',
+            'shippingDocuments': self.shipping_documents,
+        })
+        self.activities = []
+        self.day += 1
+
+
+def generate_eld_logs(processed_route, events=None):
+    """Generate ELD log sheets from the HOS event timeline (default: that of the processed route)"""
+    schedule = None
+    if processed_route.get('startTime'):
+        schedule = timezones.Schedule(parse_datetime(processed_route['startTime']),
+                                      timezones.get_zone(processed_route['timeZone']))
+    builder = LogSheetBuilder(processed_route['stops'], schedule=schedule)
+    for event in processed_route['events'] if events is None else events:
+        builder.add(event)
+    return builder.finish()
@@ -0,0 +1,276 @@
+"""
+In-memory spatial index over point datasets (fuel stations, rest areas...).
+
+Places are loaded from a CSV file with ``name``, ``lat`` and ``lon``
+(or ``latitude``/``longitude``/``lng``) columns, from a GeoJSON
+FeatureCollection of Point features with a ``name`` property, or from a
+GeoNames table (tab-separated ``.txt``, e.g. ``cities15000.txt``). Any
+other columns/properties are kept on the place.
+
+``GridIndex`` buckets places into fixed-size lat/lon cells, so a nearest
+lookup only visits the rings of cells around the query point until no
+closer place can exist; with 100k+ places that is a few dozen distance
+computations. ``PointGrid`` is the same search over coordinate arrays
+(road graph nodes), with its cells kept in flat integer arrays. Indexes are built once per dataset file and reused until
+the file's modification time changes (see ``get_index``).
+"""
+import csv
+import json
+import math
+import os
+import threading
+from array import array
+from bisect import bisect_left
+from collections import defaultdict, namedtuple
+
+from .geometry import MILES_PER_DEGREE, haversine
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - NumPy is optional
+    np = None
+
+# Side of a grid cell in degrees (~17 miles of latitude)
+CELL_DEGREES = 0.25
+
+# Columns of a GeoNames table kept as properties, by position
+GEONAMES_COLUMNS = {'country': 8, 'admin1': 10, 'population': 14, 'timezone': 17}
+
+LAT_COLUMNS = ('lat', 'latitude')
+LON_COLUMNS = ('lon', 'lng', 'longitude')
+
+# ``properties`` holds the dataset's other columns
+Place = namedtuple('Place', ['name', 'lat', 'lon', 'properties'])
+
+
+class _Grid:
+    """Nearest-neighbour search over points bucketed by lat/lon grid cell."""
+
+    def _cell(self, lat, lon):
+        return math.floor(lat / self.cell_degrees), math.floor(lon / self.cell_degrees)
+
+    def _ring(self, row, col, k):
+        """Cells at Chebyshev distance ``k`` from (row, col)"""
+        if k == 0:
+            yield row, col
+            return
+        for c in range(col - k, col + k + 1):
+            yield row - k, c
+            yield row + k, c
+        for r in range(row - k + 1, row + k):
+            yield r, col - k
+            yield r, col + k
+
+    def _cell_points(self, cell):
+        """``(lat, lon, index)`` of the points in ``cell``"""
+        raise NotImplementedError
+
+    def nearest_index(self, lat, lon, max_miles=math.inf):
+        """``(index, miles)`` of the point closest to (lat, lon), or None if none is within ``max_miles``"""
+        if not len(self):
+            return None
+        row, col = self._cell(lat, lon)
+        min_row, max_row, min_col, max_col = self.bounds
+        last_ring = max(row - min_row, max_row - row, col - min_col, max_col - col)
+
+        best, best_miles = None, max_miles
+        for k in range(last_ring + 1):
+            if k > 1:
+                # Every cell of ring k is at least k - 1 cells away along one
+                # axis; a degree of longitude is shortest at the ring's
+                # poleward edge
+                edge = min(90.0, abs(lat) + (k + 1) * self.cell_degrees)
+                bound = ((k - 1) * self.cell_degrees * MILES_PER_DEGREE *
+                         math.cos(math.radians(edge)))
+                if bound > best_miles:
+                    break
+            for cell in self._ring(row, col, k):
+                for point_lat, point_lon, index in self._cell_points(cell):
+                    # The latitude gap alone is a lower bound on the distance
+                    if abs(point_lat - lat) * MILES_PER_DEGREE > best_miles:
+                        continue
+                    miles = haversine(lat, lon, point_lat, point_lon)
+                    if miles <= best_miles:
+                        best, best_miles = index, miles
+
+        if best is None:
+            return None
+        return best, best_miles
+
+
+class GridIndex(_Grid):
+    """Places bucketed by lat/lon grid cell for nearest-neighbour lookups."""
+
+    def __init__(self, places, cell_degrees=CELL_DEGREES):
+        self.places = list(places)
+        self.cell_degrees = cell_degrees
+        self.cells = defaultdict(list)
+        for index, place in enumerate(self.places):
+            self.cells[self._cell(place.lat, place.lon)].append((place.lat, place.lon, index))
+        self.cells = dict(self.cells)
+
+        rows = [row for row, _ in self.cells] or [0]
+        cols = [col for _, col in self.cells] or [0]
+        self.bounds = (min(rows), max(rows), min(cols), max(cols))
+
+    def __len__(self):
+        return len(self.places)
+
+    def _cell_points(self, cell):
+        return self.cells.get(cell, ())
+
+    def nearest(self, lat, lon, max_miles=math.inf):
+        """``(place, miles)`` of the place closest to (lat, lon), or None if none is within ``max_miles``"""
+        found = self.nearest_index(lat, lon, max_miles)
+        if found is None:
+            return None
+        return self.places[found[0]], found[1]
+
+
+# Cell (row, col) -> row * KEY_STRIDE + col, both biased to stay positive
+KEY_STRIDE = 1 << 20
+KEY_BIAS = 1 << 19
+
+
+class PointGrid(_Grid):
+    """
+    Grid cells over parallel ``lats``/``lons`` arrays, kept in flat arrays.
+
+    For large point sets (road graph nodes): point indexes are sorted by
+    cell into ``points``, the sorted keys of the non-empty cells are in
+    ``keys`` and ``offsets[i]:offsets[i + 1]`` is the slice of ``points``
+    in cell ``keys[i]``, found with a binary search. The index costs three
+    integer arrays rather than Python objects per point.
+    """
+
+    def __init__(self, lats, lons, cell_degrees=CELL_DEGREES):
+        self.lats = lats
+        self.lons = lons
+        self.cell_degrees = cell_degrees
+        if np is not None:
+            cells = (np.floor(np.asarray(lats, dtype=float) / cell_degrees).astype(np.int64) + KEY_BIAS) * KEY_STRIDE
+            cells += np.floor(np.asarray(lons, dtype=float) / cell_degrees).astype(np.int64) + KEY_BIAS
+            order = np.argsort(cells, kind='stable')
+            keys, starts = np.unique(cells[order], return_index=True)
+            self.points = memoryview(order.astype(np.int64))
+            self.keys = memoryview(keys.astype(np.int64))
+            self.offsets = memoryview(np.append(starts, len(order)).astype(np.int64))
+        else:
+            cells = array('q', ((row + KEY_BIAS) * KEY_STRIDE + col + KEY_BIAS
+                                for row, col in map(self._cell, lats, lons)))
+            self.points = array('q', sorted(range(len(cells)), key=cells.__getitem__))
+            self.keys, self.offsets = array('q'), array('q')
+            for position, point in enumerate(self.points):
+                if not self.keys or self.keys[-1] != cells[point]:
+                    self.keys.append(cells[point])
+                    self.offsets.append(position)
+            self.offsets.append(len(self.points))
+
+        if len(self.keys):
+            # Keys sort by row first; columns are spread over every cell
+            self.bounds = (self.keys[0] // KEY_STRIDE - KEY_BIAS, self.keys[-1] // KEY_STRIDE - KEY_BIAS,
+                           min(key % KEY_STRIDE for key in self.keys) - KEY_BIAS,
+                           max(key % KEY_STRIDE for key in self.keys) - KEY_BIAS)
+        else:
+            self.bounds = (0, 0, 0, 0)
+
+    def __len__(self):
+        return len(self.points)
+
+    def _cell_points(self, cell):
+        key = (cell[0] + KEY_BIAS) * KEY_STRIDE + cell[1] + KEY_BIAS
+        i = bisect_left(self.keys, key)
+        if i == len(self.keys) or self.keys[i] != key:
+            return
+        lats, lons, points = self.lats, self.lons, self.points
+        for position in range(self.offsets[i], self.offsets[i + 1]):
+            point = points[position]
+            yield lats[point], lons[point], point
+
+
+def population(place):
+    """The ``population`` property of a place as a number (0 when missing)"""
+    try:
+        return int((place.properties or {}).get('population') or 0)
+    except ValueError:
+        return 0
+
+
+def _coordinate(row, columns):
+    for column in columns:
+        value = row.get(column)
+        if value not in (None, ''):
+            return float(value)
+    raise ValueError(f'missing {columns[0]}')
+
+
+def _csv_places(f):
+    for row in csv.DictReader(f):
+        row = {key.strip().lower(): value for key, value in row.items() if key}
+        try:
+            lat, lon = _coordinate(row, LAT_COLUMNS), _coordinate(row, LON_COLUMNS)
+        except ValueError:
+            continue
+        properties = {key: value for key, value in row.items()
+                      if key != 'name' and key not in LAT_COLUMNS + LON_COLUMNS}
+        yield Place(row.get('name') or '', lat, lon, properties)
+
+
+def _geojson_places(f):
+    for feature in json.load(f).get('features', ()):
+        geometry = feature.get('geometry') or {}
+        if geometry.get('type') != 'Point':
+            continue
+        lon, lat = geometry['coordinates'][:2]
+        properties = dict(feature.get('properties') or {})
+        yield Place(properties.pop('name', '') or '', float(lat), float(lon), properties)
+
+
+def _geonames_places(f):
+    for line in f:
+        columns = line.rstrip('\n').split('\t')
+        if len(columns) <= max(GEONAMES_COLUMNS.values()):
+            continue
+        try:
+            lat, lon = float(columns[4]), float(columns[5])
+        except ValueError:
+            continue
+        yield Place(columns[1], lat, lon, {key: columns[i] for key, i in GEONAMES_COLUMNS.items()})
+
+
+def load_places(path):
+    """
+    Places of a CSV, GeoJSON (``.geojson``/``.json``) or GeoNames (``.txt``)
+    file; rows without coordinates are skipped.
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        name = path.lower()
+        if name.endswith(('.geojson', '.json')):
+            return list(_geojson_places(f))
+        if name.endswith('.txt'):
+            return list(_geonames_places(f))
+        return list(_csv_places(f))
+
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+def get_index(path):
+    """
+    ``GridIndex`` over the places in ``path``, shared across requests.
+
+    The index is rebuilt only when the file's modification time changes.
+    Returns None when ``path`` is empty.
+    """
+    if not path:
+        return None
+    mtime = os.stat(path).st_mtime_ns
+    cached = _indexes.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with _lock:
+        cached = _indexes.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = _indexes[path] = (mtime, GridIndex(load_places(path)))
+    return cached[1]
@@ -1,6 +1,33 @@
-from django.test import TestCase, Client
+import asyncio
+import json
+import os
+import tempfile
+from array import array
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+from io import StringIO
+from unittest import skipIf
+from unittest.mock import patch
+
+from asgiref.sync import sync_to_async
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, Client, override_settings
 from django.urls import reverse
-from .models import Trip
+from django.utils import timezone
+from . import (
+    batch, duty_grid, geometry, hos, idempotency, geocoding, ledger, metrics, rendering, replan, routing, spatial,
+    timezones,
+)
+from . import cache as result_cache
+from .models import Trip, Stop, LogSheet, LogActivity, IdempotencyKey, DriverCycleLedger
+from .services import (
+    LogSheetBuilder, format_time, generate_eld_logs, generate_stops, plan_trip, process_route_arrays,
+    process_route_data,
+)
+from .persistence import pack_activities
+from .views import build_route_data
 
 class RoutePlannerTests(TestCase):
     def setUp(self):
@@ -24,9 +51,1682 @@ class RoutePlannerTests(TestCase):
     def test_get_trips(self):
         response = self.client.get('/trips/')
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(len(response.json()), 1)
-        self.assertEqual(response.json()[0]['current_location'], "New York, NY")
+        self.assertEqual(len(response.json()['results']), 1)
+        self.assertEqual(response.json()['results'][0]['current_location'], "New York, NY")
 
     def test_calculate_route_invalid_data(self):
         response = self.client.post('/calculate-route/', {})
         self.assertEqual(response.status_code, 400)
+
+
+def route_payload(total_distance=200.0, total_drive_time=4.5, current_cycle_hours=10.0):
+    return {
+        'current_location': "New York, NY",
+        'pickup_location': "Philadelphia, PA",
+        'dropoff_location': "Washington, DC",
+        'current_cycle_hours': current_cycle_hours,
+        'total_distance': total_distance,
+        'total_drive_time': total_drive_time,
+        'points': [
+            {'lat': 40.7128, 'lon': -74.0060, 'name': "New York, NY", 'type': 'start'},
+            {'lat': 39.9526, 'lon': -75.1652, 'name': "Philadelphia, PA", 'type': 'pickup'},
+            {'lat': 38.9072, 'lon': -77.0369, 'name': "Washington, DC", 'type': 'dropoff'},
+        ],
+    }
+
+
+class CalculateRoutePersistenceTests(TestCase):
+    def setUp(self):
+        result_cache.get_cache().clear()
+
+    def post_route(self, payload):
+        return self.client.post('/calculate-route/', payload, content_type='application/json')
+
+    def test_query_count_is_independent_of_trip_length(self):
+        # Trip insert, one bulk insert per child table, plus the savepoint pair
+        with self.assertNumQueries(6):
+            response = self.post_route(route_payload(total_distance=200.0, total_drive_time=4.5))
+        self.assertEqual(response.status_code, 200)
+
+        with self.assertNumQueries(6):
+            response = self.post_route(route_payload(total_distance=3000.0, total_drive_time=55.0))
+        self.assertEqual(response.status_code, 200)
+
+        trip = Trip.objects.get(pk=response.json()['tripId'])
+        self.assertEqual(trip.total_drive_time, 55.0)
+        self.assertEqual(trip.stops.count(), len(response.json()['route']['stops']))
+        self.assertEqual(trip.log_sheets.count(), len(response.json()['logSheets']))
+        # The HOS timeline is internal to planning
+        self.assertNotIn('events', response.json()['route'])
+
+    def test_failed_write_rolls_back_whole_trip(self):
+        with patch('route_planner.persistence.LogActivity.objects.bulk_create', side_effect=RuntimeError('boom')):
+            response = self.post_route(route_payload())
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(Trip.objects.exists())
+        self.assertFalse(Stop.objects.exists())
+        self.assertFalse(LogSheet.objects.exists())
+
+
+class TripListingTests(TestCase):
+    def create_trips(self, count):
+        trips = Trip.objects.bulk_create([
+            Trip(current_location=f"Origin {i}", pickup_location="Philadelphia, PA",
+                 dropoff_location="Washington, DC", total_distance=200.0, total_drive_time=4.5)
+            for i in range(count)
+        ])
+        Stop.objects.bulk_create([
+            Stop(trip=trip, location="Philadelphia, PA", stop_type='PICKUP', duration=1,
+                 arrival_time=8, sequence=0)
+            for trip in trips
+        ])
+        sheets = LogSheet.objects.bulk_create([
+            LogSheet(trip=trip, day=1, from_location="Philadelphia, PA",
+                     to_location="Washington, DC", total_miles=200, carrier="ABC Trucking Co.")
+            for trip in trips
+        ])
+        LogActivity.objects.bulk_create([
+            LogActivity(log_sheet=sheet, status='driving', start_time=8, end_time=12.5,
+                        location="En route")
+            for sheet in sheets
+        ])
+
+    def test_list_query_count_is_constant(self):
+        # Page of trips, stops, log sheets and their activities
+        for count in (1, 100, 10000):
+            with self.subTest(count=count):
+                Trip.objects.all().delete()
+                self.create_trips(count)
+                for url in ('/trips/', '/trip/'):
+                    with self.assertNumQueries(4):
+                        response = self.client.get(url)
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(len(response.json()['results']), min(count, 50))
+
+    def test_fields_and_expand_skip_nested_relations(self):
+        self.create_trips(3)
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/trips/?fields=id,pickup_location')
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'pickup_location'})
+
+        with self.assertNumQueries(2):
+            response = self.client.get('/trip/?expand=stops')
+        trip = response.json()['results'][0]
+        self.assertIn('stops', trip)
+        self.assertNotIn('log_sheets', trip)
+
+    def test_cursor_pagination_walks_all_trips(self):
+        self.create_trips(7)
+        seen = []
+        url = '/trips/?page_size=3&expand='
+        while url:
+            page = self.client.get(url).json()
+            seen.extend(trip['id'] for trip in page['results'])
+            url = page['next']
+        self.assertEqual(sorted(seen), sorted(Trip.objects.values_list('id', flat=True)))
+
+    def test_cursor_pagination_orders_trips_with_equal_timestamps(self):
+        self.create_trips(7)
+        Trip.objects.update(created_at=timezone.now())
+        seen = []
+        url = '/trips/?page_size=2&expand='
+        while url:
+            page = self.client.get(url).json()
+            seen.extend(trip['id'] for trip in page['results'])
+            url = page['next']
+        self.assertEqual(seen, sorted(Trip.objects.values_list('id', flat=True), reverse=True))
+
+    def test_detail_view_supports_projection(self):
+        self.create_trips(1)
+        trip = Trip.objects.get()
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/trips/{trip.id}/?expand=')
+        self.assertNotIn('stops', response.json())
+        self.assertEqual(response.json()['id'], trip.id)
+
+
+class HOSSimulationTests(SimpleTestCase):
+    def simulate(self, drive_time, distance=None, cycle=0.0):
+        distance = drive_time * 55 if distance is None else distance
+        events, _ = hos.simulate(hos.single_leg_plan(drive_time, distance), cycle)
+        return events
+
+    def kinds(self, events):
+        return [event.kind for event in events]
+
+    def test_short_trip_needs_no_breaks(self):
+        events = self.simulate(4.5)
+        self.assertEqual(self.kinds(events), [hos.PICKUP, hos.DRIVE, hos.DROPOFF])
+        self.assertEqual(events[-1].end, 8 + 1 + 4.5 + 1)
+
+    def test_break_after_eight_hours_of_driving(self):
+        events = self.simulate(10)
+        self.assertEqual(self.kinds(events), [hos.PICKUP, hos.DRIVE, hos.BREAK, hos.DRIVE, hos.DROPOFF])
+        self.assertEqual(events[1].end - events[1].start, 8)
+        self.assertEqual(events[2].end - events[2].start, hos.BREAK_HOURS)
+
+    def test_rest_after_eleven_hours_of_driving(self):
+        events = self.simulate(20)
+        self.assertEqual(
+            self.kinds(events),
+            [hos.PICKUP, hos.DRIVE, hos.BREAK, hos.DRIVE, hos.REST, hos.DRIVE, hos.BREAK, hos.DRIVE, hos.DROPOFF],
+        )
+        driving = [event.end - event.start for event in events if event.kind == hos.DRIVE]
+        self.assertEqual(driving, [8, 3, 8, 1])
+        self.assertEqual(events[-1].end_mile, 20 * 55)
+
+    def test_duty_window_limits_driving(self):
+        # Long on-duty work before driving leaves less of the 14-hour window
+        plan = [(hos.ON_DUTY, 6, 0.0, hos.PICKUP), (hos.DRIVING, 11, 600.0, hos.DRIVE)]
+        events, _ = hos.simulate(plan)
+        self.assertEqual(events[1].end - events[1].start, 8)
+        self.assertEqual(events[2].kind, hos.REST)
+
+    def test_cycle_exhaustion_forces_restart(self):
+        events = self.simulate(10, cycle=65)
+        self.assertIn(hos.RESTART, self.kinds(events))
+        restart = events[self.kinds(events).index(hos.RESTART)]
+        self.assertEqual(restart.start, 8 + 1 + 4)
+        self.assertEqual(restart.end - restart.start, hos.RESTART_HOURS)
+        summary = hos.summarize(events, 65)
+        self.assertEqual(summary['cycle_overflow_hours'], 7)
+
+    def test_event_count_is_independent_of_speed(self):
+        # Same hours, very different mileage: same number of events
+        self.assertEqual(len(self.simulate(60, distance=100)), len(self.simulate(60, distance=5000)))
+
+    def test_process_route_data_uses_timeline(self):
+        route = process_route_data(route_payload(total_distance=1100, total_drive_time=20), 0)
+        # The fuel stop at mile 1000 doubles as the second 30-minute break
+        self.assertEqual(route['requiredBreaks'], 1)
+        self.assertEqual(route['requiredRestPeriods'], 1)
+        self.assertEqual(route['requiredFuelStops'], 1)
+        self.assertEqual(
+            [stop['type'] for stop in route['stops']],
+            ['Pickup', 'Required Break', 'Required Rest Period', 'Fuel', 'Dropoff'],
+        )
+        self.assertEqual(route['stops'][1]['arrivalTime'], format_time(17))
+
+
+class LogSheetBuilderTests(SimpleTestCase):
+    def log_sheets(self, distance, drive_time, cycle=0.0):
+        route = process_route_data(route_payload(total_distance=distance, total_drive_time=drive_time), cycle)
+        return route, generate_eld_logs(route)
+
+    def test_sheets_keep_json_shape_and_cover_whole_days(self):
+        route, sheets = self.log_sheets(1100, 20)
+        self.assertEqual(len(sheets), route['totalTripDays'])
+        for sheet in sheets:
+            self.assertEqual(
+                set(sheet),
+                {'date', 'from', 'to', 'totalMiles', 'carrier', 'activities', 'remarks', 'shippingDocuments'},
+            )
+            self.assertEqual(sheet['activities'][0]['startTime'], '0')
+            self.assertEqual(sheet['activities'][-1]['endTime'], '24')
+            for previous, current in zip(sheet['activities'], sheet['activities'][1:]):
+                self.assertEqual(previous['endTime'], current['startTime'])
+
+    def test_miles_are_attributed_to_the_day_driven(self):
+        _, sheets = self.log_sheets(1100, 20)
+        # Day 1 drives 11 hours, day 2 the remaining 9, at 55 mph
+        self.assertEqual([sheet['totalMiles'] for sheet in sheets], ['605', '495'])
+
+    def test_rest_split_at_midnight(self):
+        _, sheets = self.log_sheets(1100, 20)
+        self.assertEqual(sheets[0]['activities'][-1]['status'], hos.SLEEPER_BERTH)
+        self.assertEqual(sheets[1]['activities'][0]['status'], hos.SLEEPER_BERTH)
+        self.assertEqual(sheets[1]['activities'][0]['remarks'], 'Rest period continued')
+
+    def test_multi_week_trip(self):
+        route, sheets = self.log_sheets(7000, 130, cycle=30)
+        self.assertEqual(len(sheets), route['totalTripDays'])
+        self.assertGreater(len(sheets), 10)
+        self.assertEqual(sum(int(sheet['totalMiles']) for sheet in sheets), 7000)
+        self.assertEqual(sheets[0]['from'], "New York, NY")
+        self.assertEqual(sheets[-1]['to'], "Washington, DC")
+
+
+class RouteLineTests(SimpleTestCase):
+    # An L-shaped route: north along a meridian, then east along a parallel
+    CORNER = [[0.0, 0.0], [1.0, 0.0], [1.0, 1.0]]
+
+    def test_cumulative_distance_index(self):
+        line = geometry.RouteLine(self.CORNER)
+        leg = geometry.haversine(0, 0, 1, 0)
+        self.assertAlmostEqual(line.cumulative[1], leg)
+        self.assertAlmostEqual(line.length, leg + geometry.haversine(1, 0, 1, 1))
+
+    def test_locate_follows_the_polyline(self):
+        line = geometry.RouteLine(self.CORNER)
+        lat, lon = line.locate(line.cumulative[1] / 2)
+        self.assertAlmostEqual(lat, 0.5)
+        self.assertAlmostEqual(lon, 0.0)
+        self.assertEqual(line.locate(-1), (0.0, 0.0))
+        self.assertEqual(line.locate(line.length + 1), (1.0, 1.0))
+
+    def test_pure_python_index_matches_numpy(self):
+        coordinates = [[30 + i * 0.01, -90 + (i % 7) * 0.02] for i in range(500)]
+        with patch.object(geometry, 'np', None):
+            expected = geometry.RouteLine(coordinates).cumulative
+        for a, b in zip(geometry.RouteLine(coordinates).cumulative, expected):
+            self.assertAlmostEqual(a, b, places=9)
+
+    def test_rest_stops_land_on_route_geometry(self):
+        payload = route_payload(total_distance=1100, total_drive_time=20)
+        payload['geometry'] = [{'lat': lat, 'lon': lon} for lat, lon in self.CORNER]
+        route = process_route_data(payload, 0)
+        for stop in route['stops'][1:-1]:
+            on_first_leg = abs(stop['lon']) < 1e-9 and 0 <= stop['lat'] <= 1
+            on_second_leg = abs(stop['lat'] - 1) < 1e-9 and 0 <= stop['lon'] <= 1
+            self.assertTrue(on_first_leg or on_second_leg, stop)
+
+
+class PolylineTests(SimpleTestCase):
+    # Example from Google's encoded polyline algorithm documentation
+    COORDINATES = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+    ENCODED = '_p~iF~ps|U_ulLnnqC_mqNvxq`@'
+
+    def test_encode_and_decode(self):
+        self.assertEqual(geometry.encode_polyline(self.COORDINATES), self.ENCODED)
+        self.assertEqual(geometry.decode_polyline(self.ENCODED), self.COORDINATES)
+        with self.assertRaises(ValueError):
+            geometry.decode_polyline(self.ENCODED[:-1])
+
+    def test_simplify_drops_points_within_tolerance(self):
+        # A straight line with a small wiggle and one real corner
+        line = [(0.0, i * 0.01) for i in range(101)] + [(i * 0.01, 1.0) for i in range(1, 101)]
+        line[50] = (0.0001, 0.5)
+        simplified = geometry.simplify(line, tolerance=0.05)
+        self.assertEqual(simplified, [(0.0, 0.0), (0.0, 1.0), (1.0, 1.0)])
+        self.assertIn((0.0001, 0.5), geometry.simplify(line, tolerance=0.001))
+
+    def test_pure_python_simplify_matches_numpy(self):
+        line = [(30 + i * 0.001, -90 + ((i * 37) % 11) * 0.0005) for i in range(2000)]
+        with patch.object(geometry, 'np', None):
+            expected = geometry.simplify(line, 0.02)
+        self.assertEqual(geometry.simplify(line, 0.02), expected)
+
+
+class CalculateRouteGeometryTests(TestCase):
+    def setUp(self):
+        result_cache.get_cache().clear()
+
+    def test_encoded_geometry_is_simplified_and_stored(self):
+        corner = [(0.0, i * 0.01) for i in range(101)] + [(i * 0.01, 1.0) for i in range(1, 101)]
+        payload = route_payload(total_distance=1100, total_drive_time=20)
+        payload['geometry'] = geometry.encode_polyline(corner)
+        response = self.client.post('/calculate-route/', payload, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+        encoded = response.json()['route']['geometry']
+        self.assertEqual(geometry.decode_polyline(encoded), [(0.0, 0.0), (0.0, 1.0), (1.0, 1.0)])
+        self.assertEqual(Trip.objects.get(pk=response.json()['tripId']).route_polyline, encoded)
+
+
+    def test_stops_follow_geometry_encoded_at_custom_precision(self):
+        # Due north along a meridian, 200 miles long
+        line = [(40.0, -75.0), (40.0 + 200 / geometry.MILES_PER_DEGREE, -75.0)]
+        route_data = {
+            **build_route_data(route_payload(total_distance=200, total_drive_time=9)),
+            'geometry': geometry.encode_polyline(line, precision=6),
+            'geometry_precision': 6,
+        }
+        events, _ = hos.simulate(hos.single_leg_plan(9, 200), 0, fuel_interval=0)
+        stop = next(stop for stop in generate_stops(route_data, events) if stop['type'] == 'Required Break')
+        self.assertAlmostEqual(stop['lon'], -75.0)
+        self.assertAlmostEqual(stop['lat'], 40.0 + stop['mile'] / geometry.MILES_PER_DEGREE, places=2)
+
+
+class BatchPlanningTests(TestCase):
+    def post_batch(self, trips):
+        return self.client.post('/calculate-routes/batch/', {'trips': trips}, content_type='application/json')
+
+    def test_per_trip_errors_do_not_fail_the_batch(self):
+        missing = route_payload()
+        del missing['points']
+        trips = [route_payload(), missing, route_payload(total_distance=3000, total_drive_time=55), 'bad']
+
+        response = self.post_batch(trips)
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body['created'], body['failed']), (2, 2))
+        self.assertEqual(body['results'][1]['error'], 'Missing required field: points')
+        self.assertIn('error', body['results'][3])
+        self.assertEqual(
+            sorted(Trip.objects.values_list('id', flat=True)),
+            sorted([body['results'][0]['tripId'], body['results'][2]['tripId']]),
+        )
+        trip = Trip.objects.get(pk=body['results'][2]['tripId'])
+        self.assertEqual(trip.stops.count(), len(body['results'][2]['route']['stops']))
+
+    def test_query_count_is_independent_of_batch_size(self):
+        # One bulk insert per table plus the savepoint pair
+        with self.assertNumQueries(6):
+            self.post_batch([route_payload()])
+        with self.assertNumQueries(6):
+            self.post_batch([route_payload(total_drive_time=10 + i) for i in range(12)])
+        self.assertEqual(Trip.objects.count(), 13)
+
+    @override_settings(ROUTE_PLANNER_BATCH_POOL_MIN_TRIPS=2, ROUTE_PLANNER_BATCH_WORKERS=2)
+    def test_process_pool_matches_in_process_planning(self):
+        jobs = [(build_route_data(route_payload(total_drive_time=5 + i * 7)), 20.0) for i in range(6)]
+        self.assertEqual(batch.plan_trips(jobs), [batch._plan(job) for job in jobs])
+
+    @override_settings(ROUTE_PLANNER_BATCH_POOL_MIN_TRIPS=2, ROUTE_PLANNER_BATCH_WORKERS=2)
+    def test_process_pool_reports_worker_stages(self):
+        jobs = [(build_route_data(route_payload()), 20.0)] * 2
+        with metrics.collect_stages() as stages:
+            batch.plan_trips(jobs)
+        self.assertIn('generate_eld_logs', stages)
+
+        with metrics.collect_stages() as stages:
+            plan = asyncio.run(batch.plan_trip_async(*jobs[0]))
+        self.assertEqual(plan, batch._plan(jobs[0]))
+        self.assertIn('generate_eld_logs', stages)
+        # Both went through the (still healthy) pool
+        self.assertIsNotNone(batch._executor)
+
+    @override_settings(ROUTE_PLANNER_BATCH_MAX_TRIPS=2)
+    def test_rejects_oversized_and_empty_batches(self):
+        self.assertEqual(self.post_batch([route_payload()] * 3).status_code, 400)
+        self.assertEqual(self.post_batch([]).status_code, 400)
+
+
+@skipIf(hos.np is None, 'NumPy is not installed')
+class VectorizedHOSTests(SimpleTestCase):
+    def corpus(self):
+        """Drive times and cycle hours around every HOS threshold"""
+        drive_times = [0, 0.25, 4.5, 7.99, 8, 8.01, 10.5, 11, 11.5, 19, 22, 33, 47.3, 60, 88.8, 130, 200]
+        drive_times += [i * 0.37 for i in range(300)]
+        cycles = [0, 3.5, 10, 35.25, 58, 59, 60, 61, 66.5, 69, 69.999, 70]
+        return [(d, c) for d in drive_times for c in cycles]
+
+    def test_matches_scalar_path_exactly(self):
+        corpus = self.corpus()
+        drive_times = hos.np.array([d for d, _ in corpus])
+        cycles = hos.np.array([c for _, c in corpus])
+        columns = process_route_arrays(drive_times, drive_times * 55, cycles)
+
+        for i, (drive_time, cycle) in enumerate(corpus):
+            route = process_route_data(route_payload(total_distance=drive_time * 55, total_drive_time=drive_time), cycle)
+            for key in ('requiredBreaks', 'requiredRestPeriods', 'requiredRestarts', 'requiredFuelStops',
+                        'cycleOverflowHours', 'totalTripHours', 'totalTripDays'):
+                self.assertEqual(columns[key][i], route[key], (key, drive_time, cycle))
+
+    def test_inputs_broadcast(self):
+        columns = process_route_arrays(hos.np.array([[5.0], [25.0]]), 1000.0, hos.np.array([0.0, 65.0]))
+        self.assertEqual(columns['requiredRestarts'].shape, (2, 2))
+        self.assertEqual(columns['requiredRestarts'].tolist(), [[0, 1], [0, 1]])
+        self.assertEqual(columns['requiredBreaks'].tolist(), [[0, 0], [2, 2]])
+
+
+class ResultCacheTests(TestCase):
+    def setUp(self):
+        result_cache.get_cache().clear()
+        result_cache.reset_stats()
+
+    def post_route(self, payload):
+        return self.client.post('/calculate-route/', payload, content_type='application/json')
+
+    def test_identical_payload_is_served_from_cache(self):
+        first = self.post_route(route_payload(total_drive_time=20))
+        self.assertEqual(first['X-Cache'], 'MISS')
+
+        # Only the existence check of the cached trip hits the database
+        with self.assertNumQueries(1):
+            second = self.post_route(route_payload(total_drive_time=20))
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(Trip.objects.count(), 1)
+
+        stats = self.client.get('/calculate-route/cache-stats/').json()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+        # Counts outlive the cached entries
+        result_cache.get_cache().clear()
+        self.post_route(route_payload(total_drive_time=20))
+        stats = self.client.get('/calculate-route/cache-stats/').json()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+
+    def test_key_is_canonical(self):
+        payload = route_payload()
+        reordered = dict(reversed(list(payload.items())))
+        reordered['total_distance'] = str(payload['total_distance'])
+        key = result_cache.payload_hash(payload, build_route_data(payload))
+        self.assertEqual(key, result_cache.payload_hash(reordered, build_route_data(reordered)))
+
+        changed = route_payload(current_cycle_hours=11)
+        self.assertNotEqual(key, result_cache.payload_hash(changed, build_route_data(changed)))
+
+    def test_deleted_trip_is_recomputed(self):
+        first = self.post_route(route_payload())
+        Trip.objects.filter(pk=first.json()['tripId']).delete()
+        second = self.post_route(route_payload())
+        self.assertEqual(second['X-Cache'], 'MISS')
+        self.assertNotEqual(second.json()['tripId'], first.json()['tripId'])
+
+
+class IdempotencyKeyTests(TestCase):
+    def setUp(self):
+        result_cache.get_cache().clear()
+
+    def post_route(self, payload, key='retry-1'):
+        return self.client.post('/calculate-route/', payload, content_type='application/json',
+                                HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retries_replay_the_first_response(self):
+        first = self.post_route(route_payload(total_drive_time=20))
+        result_cache.get_cache().clear()
+        second = self.post_route(route_payload(total_drive_time=20))
+
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(Trip.objects.count(), 1)
+        self.assertEqual(IdempotencyKey.objects.get().trip_id, first.json()['tripId'])
+
+    def test_retry_replays_when_cycle_hours_come_from_the_ledger(self):
+        payload = {**route_payload(), 'driver_id': 'driver-3'}
+        del payload['current_cycle_hours']
+        first = self.post_route(payload)
+        result_cache.get_cache().clear()
+        # The first attempt added its hours to the ledger the retry would read
+        second = self.post_route(payload)
+
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(second.json(), first.json())
+
+    def test_key_reused_with_different_payload_is_rejected(self):
+        self.post_route(route_payload())
+        response = self.post_route(route_payload(current_cycle_hours=30))
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Trip.objects.count(), 1)
+
+    @override_settings(ROUTE_PLANNER_IDEMPOTENCY_WAIT_SECONDS=5)
+    def test_duplicate_waits_for_in_flight_request(self):
+        payload = route_payload()
+        request_hash = idempotency.request_hash(payload)
+        record = IdempotencyKey.objects.create(
+            key='retry-1', request_hash=request_hash, expires_at=timezone.now() + timedelta(hours=1))
+
+        def finish_in_flight_request(seconds):
+            idempotency.complete(record, 200, {'tripId': None, 'route': {}, 'logSheets': []})
+
+        with patch('route_planner.idempotency.time.sleep', side_effect=finish_in_flight_request) as sleep:
+            response = self.post_route(payload)
+        sleep.assert_called_once()
+        self.assertEqual(response.json()['logSheets'], [])
+        self.assertFalse(Trip.objects.exists())
+
+    @override_settings(ROUTE_PLANNER_IDEMPOTENCY_WAIT_SECONDS=5)
+    def test_async_duplicate_waits_without_blocking_the_sync_thread(self):
+        payload = route_payload()
+        record = IdempotencyKey.objects.create(
+            key='retry-1', request_hash=idempotency.request_hash(payload),
+            expires_at=timezone.now() + timedelta(hours=1))
+
+        async def finish_in_flight_request(seconds):
+            # Runs on the sync thread the waiting request would otherwise hold
+            await sync_to_async(idempotency.complete)(record, 200, {'tripId': None, 'route': {}, 'logSheets': []})
+
+        with patch('route_planner.idempotency.asyncio.sleep', side_effect=finish_in_flight_request) as sleep, \
+                patch('route_planner.idempotency.time.sleep') as blocking_sleep:
+            response = self.client.post('/async/calculate-route/', payload, content_type='application/json',
+                                        HTTP_IDEMPOTENCY_KEY='retry-1')
+        sleep.assert_called_once()
+        blocking_sleep.assert_not_called()
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertEqual(response.json()['logSheets'], [])
+
+    @override_settings(ROUTE_PLANNER_IDEMPOTENCY_WAIT_SECONDS=0)
+    def test_in_flight_conflict_and_abandoned_claims(self):
+        payload = route_payload()
+        request_hash = idempotency.request_hash(payload)
+        record = IdempotencyKey.objects.create(
+            key='retry-1', request_hash=request_hash, expires_at=timezone.now() + timedelta(hours=1))
+        self.assertEqual(self.post_route(payload).status_code, 409)
+
+        # A claim older than the lease is taken over
+        IdempotencyKey.objects.filter(pk=record.pk).update(created_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(self.post_route(payload).status_code, 200)
+        self.assertEqual(Trip.objects.count(), 1)
+
+    def test_lease_expiring_during_planning_saves_the_trip_once(self):
+        payload = route_payload()
+        responses = []
+
+        def take_over_while_planning(route_data, cycle_hours):
+            if take_over_while_planning.first:
+                take_over_while_planning.first = False
+                # The first request outlives its lease; a retry takes the key over
+                IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(hours=1))
+                responses.append(self.post_route(payload))
+            return plan_trip(route_data, cycle_hours)
+        take_over_while_planning.first = True
+
+        with patch('route_planner.views.plan_trip', side_effect=take_over_while_planning):
+            first = self.post_route(payload)
+        takeover = responses[0]
+
+        self.assertEqual(takeover.status_code, 200)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first['Idempotent-Replayed'], 'true')
+        self.assertEqual(first.json(), takeover.json())
+        self.assertEqual(Trip.objects.count(), 1)
+        self.assertEqual(IdempotencyKey.objects.get().trip_id, takeover.json()['tripId'])
+
+    def test_failed_request_releases_key(self):
+        with patch('route_planner.views.plan_trip', side_effect=RuntimeError('boom')):
+            self.assertEqual(self.post_route(route_payload()).status_code, 500)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.post_route(route_payload()).status_code, 200)
+
+    def test_expired_keys_are_purged(self):
+        IdempotencyKey.objects.create(key='old', request_hash='x', expires_at=timezone.now() - timedelta(seconds=1))
+        IdempotencyKey.objects.create(key='new', request_hash='x', expires_at=timezone.now() + timedelta(hours=1))
+        self.assertEqual(idempotency.purge_expired(), 1)
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['new'])
+
+
+class NumericTimeColumnTests(TestCase):
+    def setUp(self):
+        result_cache.get_cache().clear()
+
+    def test_api_output_formats_are_unchanged(self):
+        planned = self.client.post('/calculate-route/', route_payload(total_distance=1100, total_drive_time=20),
+                                   content_type='application/json').json()
+        trip = self.client.get(f"/trips/{planned['tripId']}/").json()
+
+        self.assertEqual([stop['arrival_time'] for stop in trip['stops']],
+                         [stop['arrivalTime'] for stop in planned['route']['stops']])
+        self.assertEqual([sheet['date'] for sheet in trip['log_sheets']], ['Day 1', 'Day 2'])
+        for stored, sheet in zip(trip['log_sheets'], planned['logSheets']):
+            self.assertEqual(
+                [(a['status'], a['start_time'], a['end_time']) for a in stored['activities']],
+                [(a['status'], a['startTime'], a['endTime']) for a in sheet['activities']],
+            )
+
+    def test_time_range_queries_run_in_the_database(self):
+        self.client.post('/calculate-route/', route_payload(total_distance=1100, total_drive_time=20),
+                         content_type='application/json')
+        late_driving = LogActivity.objects.filter(status='driving', start_time__gte=17)
+        self.assertEqual([(a.log_sheet.day, a.start_time) for a in late_driving], [(1, 17.5)])
+        self.assertEqual(Stop.objects.filter(arrival_time__gte=24).count(), 2)
+
+
+class DutyGridTests(TestCase):
+    def setUp(self):
+        result_cache.get_cache().clear()
+
+    def test_round_trip_keeps_quarter_hour_activities(self):
+        activities = [
+            {'status': 'offDuty', 'start_time': 0, 'end_time': 8, 'location': 'En route', 'remarks': ''},
+            {'status': 'onDuty', 'start_time': 8, 'end_time': 9, 'location': 'New York', 'remarks': 'Pickup'},
+            {'status': 'driving', 'start_time': 9, 'end_time': 17.25, 'location': 'En route', 'remarks': ''},
+            {'status': 'sleeperBerth', 'start_time': 17.25, 'end_time': 24, 'location': 'Stop 1', 'remarks': 'Rest'},
+        ]
+        grid, notes = duty_grid.encode(activities)
+
+        self.assertEqual(len(grid), 24)
+        self.assertEqual(len(notes), 2)
+        self.assertEqual(duty_grid.decode(grid, notes), activities)
+
+    def test_packed_storage_reads_back_without_activity_rows(self):
+        # Without fuel stops every activity falls on a quarter hour
+        payload = {**route_payload(total_distance=1100, total_drive_time=20), 'fuel_interval_miles': 0}
+        rows = self.client.post('/calculate-route/', payload, content_type='application/json').json()
+        result_cache.get_cache().clear()
+        with override_settings(ROUTE_PLANNER_LOG_STORAGE='packed'):
+            packed = self.client.post('/calculate-route/', payload, content_type='application/json').json()
+
+        self.assertFalse(LogActivity.objects.filter(log_sheet__trip_id=packed['tripId']).exists())
+        expected = self.client.get(f"/trips/{rows['tripId']}/").json()['log_sheets']
+        actual = self.client.get(f"/trips/{packed['tripId']}/").json()['log_sheets']
+        self.assertEqual([sheet['activities'] for sheet in actual],
+                         [[{k: v for k, v in a.items() if k != 'id'} for a in sheet['activities']]
+                          for sheet in expected])
+
+
+class NumericTimeColumnMigrationTests(TransactionTestCase):
+    migrate_from = [('route_planner', '0004_idempotencykey')]
+    migrate_to = [('route_planner', '0007_drop_string_time_columns')]
+
+    def test_backfill_converts_legacy_strings(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_from)
+        apps = executor.loader.project_state(self.migrate_from).apps
+        OldTrip = apps.get_model('route_planner', 'Trip')
+        trip = OldTrip.objects.create(current_location='A', pickup_location='A', dropoff_location='B')
+        for sequence, arrival in enumerate(['8:00 AM', '5:00 PM', '8:30 PM', '6:30 AM', '4:00 PM']):
+            apps.get_model('route_planner', 'Stop').objects.create(
+                trip=trip, location='A', stop_type='BREAK', duration=1, arrival_time=arrival, sequence=sequence)
+        sheet = apps.get_model('route_planner', 'LogSheet').objects.create(
+            trip=trip, date='Day 2', from_location='A', to_location='B', total_miles=10, carrier='C')
+        apps.get_model('route_planner', 'LogActivity').objects.create(
+            log_sheet=sheet, status='driving', start_time='14.5', end_time='19', location='En route')
+
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(self.migrate_to)
+        apps = executor.loader.project_state(self.migrate_to).apps
+
+        stops = apps.get_model('route_planner', 'Stop').objects.order_by('sequence')
+        self.assertEqual([stop.arrival_time for stop in stops], [8, 17, 20.5, 30.5, 40])
+        self.assertEqual(apps.get_model('route_planner', 'LogSheet').objects.get().day, 2)
+        activity = apps.get_model('route_planner', 'LogActivity').objects.get()
+        self.assertEqual((activity.start_time, activity.end_time), (14.5, 19.0))
+
+        # Leave the schema at the latest migration for the other tests
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+
+class TripExportTests(TestCase):
+    def setUp(self):
+        result_cache.get_cache().clear()
+        for distance in (300, 1100, 2000):
+            self.client.post('/calculate-route/', route_payload(total_distance=distance, total_drive_time=distance / 55),
+                             content_type='application/json')
+
+    def export(self, **params):
+        response = self.client.get('/trips/export/', params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_matches_trip_detail(self):
+        lines = self.export().splitlines()
+        self.assertEqual(len(lines), 3)
+        first = json.loads(lines[0])
+        self.assertEqual(first, self.client.get(f"/trips/{first['id']}/").json())
+
+    def test_csv_has_one_row_per_activity(self):
+        rows = self.export(format='csv').splitlines()
+        self.assertEqual(rows[0].split(',')[:3], ['trip_id', 'created_at', 'current_location'])
+        self.assertEqual(len(rows) - 1, LogActivity.objects.count())
+
+    def test_date_range_filters_on_creation_time(self):
+        old = Trip.objects.order_by('id').first()
+        Trip.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=30))
+        since = (timezone.now() - timedelta(days=1)).date().isoformat()
+
+        self.assertEqual(len(self.export(start=since).splitlines()), 2)
+        self.assertEqual(len(self.export(end=since).splitlines()), 1)
+        self.assertEqual(self.client.get('/trips/export/', {'start': 'yesterday'}).status_code, 400)
+
+    @override_settings(ROUTE_PLANNER_EXPORT_CHUNK_SIZE=2)
+    def test_queries_are_per_chunk(self):
+        # One trip query read in two chunks, each prefetching log sheets and activities
+        with self.assertNumQueries(5):
+            self.export(format='csv')
+
+    async def test_async_export_streams_from_an_async_iterator(self):
+        response = await self.async_client.get('/async/trips/export/', {'format': 'csv'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        rows = [line async for line in response.streaming_content]
+        sync_rows = await sync_to_async(self.export)(format='csv')
+        self.assertEqual(b''.join(rows).decode(), sync_rows)
+
+    def test_management_command(self):
+        out = StringIO()
+        call_command('export_trips', format='csv', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()) - 1, LogActivity.objects.count())
+
+
+class LogSheetRenderingTests(TestCase):
+    def setUp(self):
+        result_cache.get_cache().clear()
+        rendering.get_cache().clear()
+        self.trip_id = self.client.post(
+            '/calculate-route/', route_payload(total_distance=1100, total_drive_time=20),
+            content_type='application/json').json()['tripId']
+
+    def test_svg_draws_every_activity(self):
+        response = self.client.get(f'/trips/{self.trip_id}/logs/1.svg')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+        svg = response.content.decode()
+        self.assertTrue(svg.startswith('<svg'))
+        self.assertEqual(svg.count('<polyline'), LogActivity.objects.filter(log_sheet__day=1).count())
+
+    def test_trip_pdf_has_a_page_per_sheet(self):
+        response = self.client.get(f'/trips/{self.trip_id}/logs.pdf')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(response.content.startswith(b'%PDF-1.4'))
+        self.assertTrue(response.content.rstrip().endswith(b'%%EOF'))
+        self.assertIn(b'/Count 2', response.content)
+
+    def test_repeat_downloads_are_served_from_cache(self):
+        url = f'/trips/{self.trip_id}/logs.svg'
+        first = self.client.get(url)
+        with patch.object(rendering, 'render_svg') as render_svg:
+            second = self.client.get(url)
+        render_svg.assert_not_called()
+        self.assertEqual((first['X-Cache'], second['X-Cache']), ('MISS', 'HIT'))
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+    def test_edited_sheet_is_rendered_again(self):
+        url = f'/trips/{self.trip_id}/logs/1.pdf'
+        etag = self.client.get(url)['ETag']
+        LogSheet.objects.filter(trip_id=self.trip_id, day=1).update(remarks='Corrected')
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_unknown_sheet_or_format(self):
+        self.assertEqual(self.client.get(f'/trips/{self.trip_id}/logs/9.svg').status_code, 404)
+        self.assertEqual(self.client.get(f'/trips/{self.trip_id}/logs.png').status_code, 404)
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        result_cache.get_cache().clear()
+
+    def test_async_calculate_route_matches_sync(self):
+        payload = route_payload(total_distance=1100, total_drive_time=20)
+        async_response = self.client.post('/async/calculate-route/', payload, content_type='application/json')
+        result_cache.get_cache().clear()
+        sync_body = self.client.post('/calculate-route/', payload, content_type='application/json').json()
+
+        self.assertEqual(async_response.status_code, 200)
+        self.assertEqual(async_response['X-Cache'], 'MISS')
+        async_body = async_response.json()
+        self.assertNotEqual(async_body.pop('tripId'), sync_body.pop('tripId'))
+        self.assertEqual(async_body, sync_body)
+
+    def test_async_calculate_route_errors(self):
+        response = self.client.post('/async/calculate-route/', {'current_location': 'NY'},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.post('/async/calculate-route/', 'nope',
+                                          content_type='application/json').status_code, 400)
+        self.assertEqual(self.client.get('/async/calculate-route/').status_code, 405)
+
+    def test_async_trip_reads_match_sync(self):
+        trip_id = self.client.post('/async/calculate-route/', route_payload(),
+                                   content_type='application/json').json()['tripId']
+
+        self.assertEqual(self.client.get(f'/async/trips/{trip_id}/').json(),
+                         self.client.get(f'/trips/{trip_id}/').json())
+        self.assertEqual(self.client.get(f'/async/trips/{trip_id}/?fields=id,stops').json(),
+                         self.client.get(f'/trips/{trip_id}/?fields=id,stops').json())
+        self.assertEqual(self.client.get('/async/trips/').json()['results'],
+                         self.client.get('/trips/').json()['results'])
+        self.assertEqual(self.client.get('/async/trips/999999/').status_code, 404)
+
+    def test_async_trip_pages_follow_sync_cursors(self):
+        Trip.objects.bulk_create(
+            Trip(current_location='A', pickup_location='B', dropoff_location='C') for _ in range(5))
+        # Equal timestamps make the cursors carry offsets as well as positions
+        Trip.objects.update(created_at=timezone.now())
+
+        query = 'page_size=2&fields=id'
+        while query:
+            sync_page = self.client.get(f'/trips/?{query}').json()
+            async_page = self.client.get(f'/async/trips/?{query}').json()
+            self.assertEqual(async_page['results'], sync_page['results'])
+            self.assertEqual(async_page['previous'] is None, sync_page['previous'] is None)
+            self.assertEqual(async_page['next'] is None, sync_page['next'] is None)
+            query = async_page['next'] and async_page['next'].split('?', 1)[1]
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        result_cache.get_cache().clear()
+        for histogram in metrics.HISTOGRAMS:
+            histogram.clear()
+
+    def scrape(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode()
+
+    def test_calculate_route_stages_queries_and_bytes(self):
+        self.client.post('/calculate-route/', route_payload(), content_type='application/json')
+        text = self.scrape()
+
+        self.assertIn('route_planner_request_duration_seconds_count'
+                      '{view="calculate-route",method="POST",status="200"} 1', text)
+        for name in ('validation', 'cache_lookup', 'hos', 'hos_simulation', 'generate_stops',
+                     'generate_eld_logs', 'db_write', 'serialization'):
+            self.assertIn(f'route_planner_stage_duration_seconds_count{{view="calculate-route",stage="{name}"}} 1',
+                          text)
+        # Trip, stops, sheets and activities inserted inside a savepoint pair
+        self.assertIn('route_planner_request_queries_sum{view="calculate-route"} 6', text)
+        self.assertIn('route_planner_request_bytes_in_bucket{view="calculate-route",le="1000"} 1', text)
+        self.assertIn('route_planner_response_bytes_out_count{view="calculate-route"} 1', text)
+
+    def test_streamed_bytes_are_counted_when_sent(self):
+        self.client.post('/calculate-route/', route_payload(), content_type='application/json')
+        response = self.client.get('/trips/export/')
+        size = len(b''.join(response.streaming_content))
+        self.assertIn(f'route_planner_response_bytes_out_sum{{view="trip-export"}} {size}', self.scrape())
+
+    def test_async_views_are_measured(self):
+        self.client.post('/async/calculate-route/', route_payload(), content_type='application/json')
+        text = self.scrape()
+        self.assertIn('route_planner_stage_duration_seconds_count{view="calculate-route-async",stage="hos"} 1', text)
+        self.assertIn('route_planner_request_queries_sum{view="calculate-route-async"} 6', text)
+
+    @override_settings(ROUTE_PLANNER_SLOW_REQUEST_SECONDS=1e-9)
+    def test_slow_requests_log_their_sql(self):
+        with self.assertLogs('route_planner.slow_requests', 'WARNING') as logs:
+            self.client.post('/calculate-route/', route_payload(), content_type='application/json')
+        self.assertIn('POST /calculate-route/', logs.output[0])
+        self.assertIn('INSERT INTO "route_planner_trip"', logs.output[0])
+
+
+def multi_leg_payload(legs):
+    payload = route_payload()
+    del payload['total_distance'], payload['total_drive_time']
+    payload['legs'] = legs
+    return payload
+
+
+class MultiLegTripTests(TestCase):
+    LEGS = [
+        {'name': "Trenton, NJ", 'distance': 330, 'drive_time': 6, 'dwell_hours': 0.5, 'lat': 40.22, 'lon': -74.76},
+        {'name': "Baltimore, MD", 'distance': 440, 'drive_time': 8, 'dwell_hours': 2, 'type': 'pickup'},
+        {'name': "Washington, DC", 'distance': 55, 'drive_time': 1},
+    ]
+
+    def setUp(self):
+        result_cache.get_cache().clear()
+
+    def test_clocks_carry_across_legs(self):
+        plan = hos.multi_leg_plan([(6, 330, 0.5, hos.DROPOFF), (8, 440, 2, hos.PICKUP), (1, 55, 1, hos.DROPOFF)])
+        events, clocks = hos.simulate(plan)
+
+        self.assertEqual([event.kind for event in events], [
+            hos.PICKUP, hos.DRIVE, hos.DROPOFF, hos.DRIVE, hos.REST, hos.DRIVE, hos.PICKUP, hos.DRIVE, hos.DROPOFF,
+        ])
+        # Leg 1's 6 hours of driving leave 5 of the 11 for leg 2 before the rest
+        self.assertEqual(events[3].end - events[3].start, 5)
+        self.assertEqual([event.leg for event in events], [0, 1, 1, 2, 2, 2, 2, 3, 3])
+        self.assertEqual(events[-1].end_mile, 825)
+        self.assertEqual(clocks.cycle, 1 + 6 + 0.5 + 8 + 2 + 1 + 1)
+
+    def test_single_leg_plan_is_a_one_leg_trip(self):
+        single, _ = hos.simulate(hos.single_leg_plan(20, 1100))
+        multi, _ = hos.simulate(hos.multi_leg_plan([(20, 1100, hos.DROPOFF_HOURS, hos.DROPOFF)]))
+        self.assertEqual(single, multi)
+
+    def test_calculate_route_persists_leg_of_every_stop(self):
+        response = self.client.post('/calculate-route/', multi_leg_payload(self.LEGS),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        route = response.json()['route']
+        self.assertEqual(route['totalDistance'], 825)
+        self.assertEqual(route['totalDriveTime'], 15)
+
+        stops = [(stop['location'], stop['type'], stop['leg']) for stop in route['stops']]
+        self.assertEqual(stops, [
+            ("New York, NY", 'Pickup', 0),
+            ("Trenton, NJ", 'Dropoff', 1),
+            ("Stop 2", 'Required Rest Period', 2),
+            ("Baltimore, MD", 'Pickup', 2),
+            ("Washington, DC", 'Dropoff', 3),
+        ])
+        self.assertEqual((route['stops'][1]['lat'], route['stops'][1]['lon']), (40.22, -74.76))
+
+        trip = Trip.objects.get(pk=response.json()['tripId'])
+        self.assertEqual(list(trip.stops.values_list('leg', flat=True)), [0, 1, 2, 2, 3])
+        self.assertEqual(self.client.get(f'/trips/{trip.id}/').json()['stops'][3]['leg'], 2)
+
+    def test_invalid_legs(self):
+        for legs in ([{'distance': 10}], [{'distance': 10, 'drive_time': 1, 'type': 'fuel'}], ['x']):
+            with self.subTest(legs=legs):
+                response = self.client.post('/calculate-routes/batch/', {'trips': [multi_leg_payload(legs)]},
+                                            content_type='application/json')
+                self.assertIn('Leg 0', response.json()['results'][0]['error'])
+
+    def test_invalid_payloads_are_rejected_by_both_views(self):
+        payloads = [
+            multi_leg_payload([{'distance': 10}]),
+            {**route_payload(), 'start_time': 'tomorrow'},
+            {**route_payload(), 'time_zone': 'Mars/Olympus_Mons'},
+            route_payload(total_distance='far'),
+        ]
+        for url in ('/calculate-route/', '/async/calculate-route/'):
+            for payload in payloads:
+                with self.subTest(url=url, payload=payload):
+                    response = self.client.post(url, payload, content_type='application/json')
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn('error', response.json())
+
+
+class DriverCycleLedgerTests(TestCase):
+    def setUp(self):
+        result_cache.get_cache().clear()
+
+    def test_ring_buffer_keeps_a_rolling_eight_day_sum(self):
+        cycle = DriverCycleLedger(driver_id='D1')
+        start = date(2026, 1, 1)
+        for offset in range(10):
+            ledger.add_hours(cycle, start + timedelta(days=offset), offset + 1)
+
+        # Days 3..10 (hours 3..10) are in the window ending on day 10
+        self.assertEqual(cycle.total_hours, sum(range(3, 11)))
+        self.assertEqual(ledger.used_hours(cycle, start + timedelta(days=9)), sum(range(3, 11)))
+        self.assertEqual(ledger.used_hours(cycle, start + timedelta(days=11)), sum(range(5, 11)))
+        self.assertEqual(ledger.used_hours(cycle, start + timedelta(days=20)), 0)
+
+        ledger.add_hours(cycle, start, 5)  # long out of the window
+        ledger.set_hours(cycle, start + timedelta(days=9), 4)
+        self.assertEqual(cycle.total_hours, sum(range(3, 10)) + 4)
+
+        ledger.add_hours(cycle, start + timedelta(days=30), 2)
+        self.assertEqual(cycle.total_hours, 2)
+
+    def test_planned_trips_feed_the_ledger_and_default_cycle_hours(self):
+        payload = route_payload(total_distance=1100, total_drive_time=20)
+        del payload['current_cycle_hours']
+        payload['driver_id'] = 'D7'
+
+        first = self.client.post('/calculate-route/', payload, content_type='application/json').json()
+        self.assertEqual(Trip.objects.get(pk=first['tripId']).current_cycle_hours, 0)
+        cycle = self.client.get('/drivers/D7/cycle/').json()
+        # Day 1 of the trip is today; day 2 is still ahead of it
+        today = first['logSheets'][0]
+        self.assertEqual(cycle['cycleHours'], ledger.on_duty_hours(today['activities']))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(ledger.cycle_hours('D7'), cycle['cycleHours'])
+
+        second = self.client.post('/calculate-route/', payload, content_type='application/json').json()
+        self.assertEqual(Trip.objects.get(pk=second['tripId']).current_cycle_hours, cycle['cycleHours'])
+
+    def test_long_planned_trips_do_not_hide_actual_days(self):
+        cycle = DriverCycleLedger(driver_id='D3')
+        today = date(2026, 3, 2)
+        # A twelve-day trip planned from yesterday
+        for offset in range(12):
+            ledger.add_hours(cycle, today + timedelta(days=offset - 1), 10, today=today)
+        self.assertEqual(cycle.last_day, today)
+        self.assertEqual(ledger.used_hours(cycle, today), 20)
+
+        # Actual sheets for yesterday and today replace their planned hours
+        ledger.set_hours(cycle, today - timedelta(days=1), 6)
+        ledger.set_hours(cycle, today, 4)
+        self.assertEqual(ledger.used_hours(cycle, today), 10)
+        # Planned days count once they are in the window, and move the ring when reached
+        self.assertEqual(ledger.used_hours(cycle, today + timedelta(days=2)), 30)
+        ledger.set_hours(cycle, today + timedelta(days=1), 8)
+        self.assertEqual(ledger.used_hours(cycle, today + timedelta(days=1)), 18)
+        self.assertEqual(ledger.used_hours(cycle, today + timedelta(days=10)), 80)
+
+    def test_actual_logs_replace_their_days(self):
+        today = timezone.localdate()
+        activities = [
+            {'status': 'driving', 'startTime': '6', 'endTime': '14'},
+            {'status': 'onDuty', 'startTime': '14', 'endTime': '16'},
+            {'status': 'offDuty', 'startTime': '16', 'endTime': '24'},
+        ]
+        sheets = [{'date': (today - timedelta(days=offset)).isoformat(), 'activities': activities}
+                  for offset in range(3)]
+        response = self.client.post('/drivers/D9/logs/', {'logSheets': sheets}, content_type='application/json')
+        self.assertEqual(response.json()['cycleHours'], 30)
+        self.assertEqual(response.json()['remainingHours'], 40)
+
+        sheets[0]['activities'] = activities[2:]
+        response = self.client.post('/drivers/D9/logs/', {'logSheets': sheets[:1]}, content_type='application/json')
+        self.assertEqual(response.json()['cycleHours'], 20)
+        self.assertEqual(self.client.post('/drivers/D9/logs/', {'logSheets': [{'date': 'soon'}]},
+                                          content_type='application/json').status_code, 400)
+
+
+class SpatialIndexTests(SimpleTestCase):
+    def places(self):
+        return [spatial.Place(f'P{lat}/{lon}', lat, lon, {})
+                for lat in range(30, 45, 2) for lon in range(-110, -75, 3)]
+
+    def test_nearest_matches_brute_force(self):
+        places = self.places()
+        index = spatial.GridIndex(places)
+        for lat, lon in [(40.7, -74.0), (31.2, -108.9), (36.0, -90.5), (50.0, -120.0)]:
+            place, miles = index.nearest(lat, lon)
+            best = min(geometry.haversine(lat, lon, p.lat, p.lon) for p in places)
+            self.assertAlmostEqual(miles, best)
+        self.assertIsNone(index.nearest(40.5, -74.0, max_miles=10))
+
+    def test_point_grid_matches_grid_index(self):
+        places = self.places()
+        lats, lons = array('d', [p.lat for p in places]), array('d', [p.lon for p in places])
+        index = spatial.GridIndex(places)
+        queries = [(40.7, -74.0), (31.2, -108.9), (36.0, -90.5), (50.0, -120.0), (-10.0, 20.0)]
+        for numpy in (spatial.np, None):
+            with self.subTest(numpy=numpy is not None), patch('route_planner.spatial.np', numpy):
+                grid = spatial.PointGrid(lats, lons)
+                self.assertEqual(grid.bounds, index.bounds)
+                for lat, lon in queries:
+                    self.assertEqual(grid.nearest_index(lat, lon), index.nearest_index(lat, lon))
+                self.assertIsNone(grid.nearest_index(40.5, -74.0, max_miles=10))
+        self.assertIsNone(spatial.PointGrid(array('d'), array('d')).nearest_index(40.0, -75.0))
+
+    def test_loads_csv_and_geojson(self):
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = os.path.join(directory, 'stations.csv')
+            with open(csv_path, 'w') as f:
+                f.write('name,latitude,longitude,brand\nPilot 1,40.1,-75.2,Pilot\nNo coords,,,\n')
+            geojson_path = os.path.join(directory, 'stations.geojson')
+            with open(geojson_path, 'w') as f:
+                json.dump({'type': 'FeatureCollection', 'features': [{
+                    'type': 'Feature', 'properties': {'name': 'Loves 2'},
+                    'geometry': {'type': 'Point', 'coordinates': [-75.2, 40.1]},
+                }]}, f)
+
+            self.assertEqual(spatial.load_places(csv_path), [spatial.Place('Pilot 1', 40.1, -75.2, {'brand': 'Pilot'})])
+            self.assertEqual(spatial.load_places(geojson_path), [spatial.Place('Loves 2', 40.1, -75.2, {})])
+            self.assertIs(spatial.get_index(csv_path), spatial.get_index(csv_path))
+
+
+class FuelStopTests(SimpleTestCase):
+    def test_fuel_stop_at_least_every_interval(self):
+        route = process_route_data(route_payload(total_distance=2750, total_drive_time=50), 0)
+        fuel_stops = [event for event in route['events'] if event.kind == hos.FUEL]
+
+        self.assertEqual([event.start_mile for event in fuel_stops], [1000, 2000])
+        self.assertEqual(route['requiredFuelStops'], 2)
+        self.assertEqual([stop['type'] for stop in route['stops']].count('Fuel'), 2)
+
+    def test_fuel_stops_can_be_disabled(self):
+        route = process_route_data(build_route_data(
+            {**route_payload(total_distance=2750, total_drive_time=50), 'fuel_interval_miles': 0}), 0)
+        self.assertEqual(route['requiredFuelStops'], 0)
+
+    def test_fuel_stop_snaps_to_station_before_threshold(self):
+        payload = route_payload(total_distance=1100, total_drive_time=20)
+        # Mile 1000 of 1100 along New York -> Washington, and a station a
+        # little before it, just off the route
+        fuel_lat, fuel_lon = geometry.RouteLine(payload['points']).locate_fraction(980 / 1100)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'stations.csv')
+            with open(path, 'w') as f:
+                f.write(f'name,lat,lon\nTruck Fuel Plaza,{fuel_lat + 0.01},{fuel_lon}\nFar Away,45.0,-100.0\n')
+            with override_settings(ROUTE_PLANNER_FUEL_STATIONS_PATH=path):
+                route = process_route_data(payload, 0)
+
+        fuel = next(stop for stop in route['stops'] if stop['type'] == 'Fuel')
+        self.assertEqual(fuel['location'], 'Truck Fuel Plaza')
+        self.assertEqual((fuel['lat'], fuel['lon']), (fuel_lat + 0.01, fuel_lon))
+
+    def test_timeline_follows_the_station_a_fuel_stop_snaps_to(self):
+        payload = route_payload(total_distance=2750, total_drive_time=50)
+        fuel_lat, fuel_lon = geometry.RouteLine(payload['points']).locate_fraction(980 / 2750)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'stations.csv')
+            with open(path, 'w') as f:
+                f.write(f'name,lat,lon\nTruck Fuel Plaza,{fuel_lat},{fuel_lon}\n')
+            with override_settings(ROUTE_PLANNER_FUEL_STATIONS_PATH=path):
+                route = process_route_data(payload, 0)
+
+        first, second = [stop for stop in route['stops'] if stop['type'] == 'Fuel']
+        self.assertEqual(first['location'], 'Truck Fuel Plaza')
+        self.assertAlmostEqual(first['mile'], 980, places=3)
+        # The stop is where the timeline has the truck, and the next
+        # interval counts from it
+        fuel_event = next(event for event in route['events'] if event.kind == hos.FUEL)
+        self.assertEqual((first['mile'], first['arrivalHours']), (fuel_event.start_mile, fuel_event.start))
+        self.assertEqual(first['arrivalTime'], format_time(fuel_event.start))
+        self.assertAlmostEqual(second['mile'], first['mile'] + 1000)
+
+
+class RestAreaSnappingTests(SimpleTestCase):
+    def write_rest_areas(self, path, rows):
+        with open(path, 'w') as f:
+            f.write('name,lat,lon,kind\n')
+            for name, lat, lon in rows:
+                f.write(f'{name},{lat},{lon},rest_area\n')
+
+    def test_breaks_and_rests_take_the_facility_name(self):
+        payload = route_payload(total_distance=1100, total_drive_time=20)
+        line = geometry.RouteLine(payload['points'])
+        # The break is forced at mile 440, the rest at mile 605 (55 mph)
+        break_lat, break_lon = line.locate_fraction(430 / 1100)
+        rest_lat, rest_lon = line.locate_fraction(600 / 1100)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'rest_areas.csv')
+            self.write_rest_areas(path, [
+                ('Welcome Center', break_lat, break_lon),
+                ('Big Rig Truck Stop', rest_lat, rest_lon),
+                # Beyond the tolerance of the second break (30 minutes = 27.5 miles before mile 1045)
+                ('Too Early Rest Area', *line.locate_fraction(900 / 1100)),
+            ])
+            with override_settings(ROUTE_PLANNER_REST_AREAS_PATH=path):
+                route = process_route_data(build_route_data({**payload, 'fuel_interval_miles': 0}), 0)
+
+        self.assertEqual(
+            [(stop['type'], stop['location']) for stop in route['stops'][1:-1]],
+            [('Required Break', 'Welcome Center'), ('Required Rest Period', 'Big Rig Truck Stop'),
+             ('Required Break', 'Stop 3')],
+        )
+        self.assertEqual(route['stops'][1]['lat'], break_lat)
+        log_locations = {activity['location'] for sheet in generate_eld_logs(route) for activity in sheet['activities']}
+        self.assertIn('Big Rig Truck Stop', log_locations)
+
+    def test_index_is_reloaded_when_the_file_changes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'rest_areas.csv')
+            self.write_rest_areas(path, [('Old', 40.0, -75.0)])
+            first = spatial.get_index(path)
+            self.assertIs(spatial.get_index(path), first)
+
+            self.write_rest_areas(path, [('New', 40.0, -75.0)])
+            stat = os.stat(path)
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+            second = spatial.get_index(path)
+
+        self.assertIsNot(second, first)
+        self.assertEqual(second.nearest(40.0, -75.0)[0].name, 'New')
+
+
+def geonames_row(name, lat, lon, country='US', admin1='', timezone_name='America/New_York'):
+    """A line of a GeoNames cities table"""
+    columns = ['1', name, name, '', str(lat), str(lon), 'P', 'PPL', country, '', admin1,
+               '', '', '', '1000', '', '10', timezone_name, '2024-01-01']
+    return '\t'.join(columns) + '\n'
+
+
+class ReverseGeocodingTests(TestCase):
+    CITIES = [
+        ('New York', 40.7128, -74.0060, 'NY'),
+        ('Philadelphia', 39.9526, -75.1652, 'PA'),
+        ('Harrisburg', 40.2732, -76.8867, 'PA'),
+        ('Baltimore', 39.2904, -76.6122, 'MD'),
+    ]
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'cities.txt')
+        with open(self.path, 'w') as f:
+            for name, lat, lon, state in self.CITIES:
+                f.write(geonames_row(name, lat, lon, admin1=state))
+        self.index = spatial.get_index(self.path)
+
+    def test_labels_nearest_city_with_region(self):
+        geocoder = geocoding.ReverseGeocoder(self.index)
+        self.assertEqual(geocoder.lookup(39.95, -75.16), 'Philadelphia, PA')
+        self.assertEqual(geocoder.lookup(39.3, -76.6), 'Baltimore, MD')
+        self.assertIsNone(geocoder.lookup(45.0, -100.0))
+
+    def test_lookups_are_cached_by_quantized_coordinate(self):
+        geocoder = geocoding.ReverseGeocoder(self.index, precision=2, cache_size=2)
+        # The first two points round to the same key
+        labels = geocoder.lookup_many([(39.9526, -75.1652), (39.9541, -75.1661), (40.27, -76.89)])
+        self.assertEqual(labels, ['Philadelphia, PA', 'Philadelphia, PA', 'Harrisburg, PA'])
+        self.assertEqual(geocoder.stats(), {'hits': 1, 'misses': 2, 'size': 2})
+
+        geocoder.lookup(39.95, -75.17)
+        self.assertEqual(geocoder.stats(), {'hits': 2, 'misses': 2, 'size': 2})
+        # Least recently used (Harrisburg) is evicted
+        geocoder.lookup(39.29, -76.61)
+        geocoder.lookup(40.27, -76.89)
+        self.assertEqual(geocoder.stats(), {'hits': 2, 'misses': 4, 'size': 2})
+
+    def test_unnamed_stops_get_city_labels(self):
+        payload = route_payload(total_distance=200, total_drive_time=9)
+        with override_settings(ROUTE_PLANNER_GAZETTEER_PATH=self.path):
+            route = process_route_data(build_route_data(payload), 0)
+
+        self.assertEqual([stop['city'] for stop in route['stops']],
+                         ['New York, NY', 'Baltimore, MD', 'Baltimore, MD'])
+        # Pickup and dropoff keep their names; the break is named after its city
+        self.assertEqual([stop['location'] for stop in route['stops']],
+                         ['New York, NY', 'Baltimore, MD', 'Washington, DC'])
+
+    def test_reverse_geocode_endpoint(self):
+        body = {'points': [{'lat': 39.95, 'lon': -75.16}, [39.3, -76.6], [10.0, 10.0]]}
+        response = self.client.post('/reverse-geocode/', body, content_type='application/json')
+        self.assertEqual(response.status_code, 503)
+
+        with override_settings(ROUTE_PLANNER_GAZETTEER_PATH=self.path):
+            response = self.client.post('/reverse-geocode/', body, content_type='application/json')
+            invalid = self.client.post('/reverse-geocode/', {'points': [{'lat': 1}]},
+                                       content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['city'] for result in response.json()['results']],
+                         ['Philadelphia, PA', 'Baltimore, MD', None])
+        self.assertEqual(invalid.status_code, 400)
+
+
+def osm_extract(nodes, ways):
+    """OSM XML of ``{id: (lat, lon)}`` nodes and ``(node ids, tags)`` ways"""
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>', '<osm version="0.6">']
+    for node_id, (lat, lon) in nodes.items():
+        lines.append(f'  <node id="{node_id}" lat="{lat}" lon="{lon}"/>')
+    for way_id, (refs, tags) in enumerate(ways, start=1):
+        lines.append(f'  <way id="{way_id}">')
+        lines.extend(f'    <nd ref="{ref}"/>' for ref in refs)
+        lines.extend(f'    <tag k="{key}" v="{value}"/>' for key, value in tags.items())
+        lines.append('  </way>')
+    lines.append('</osm>')
+    return '\n'.join(lines)
+
+
+class RoadGraphRoutingTests(TestCase):
+    NODES = {1: (40.0, -75.0), 2: (40.0, -74.9), 3: (40.0, -74.8), 4: (40.05, -74.9), 5: (40.1, -74.8)}
+    WAYS = [
+        ([1, 2, 3], {'highway': 'residential'}),
+        ([1, 4, 3], {'highway': 'motorway', 'oneway': 'no'}),
+        ([5, 3], {'highway': 'primary', 'oneway': 'yes', 'maxspeed': '50 mph'}),
+        ([1, 5], {'highway': 'footway'}),
+    ]
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.osm_path = os.path.join(self.directory.name, 'extract.osm')
+        with open(self.osm_path, 'w') as f:
+            f.write(osm_extract(self.NODES, self.WAYS))
+
+    def node(self, graph, node_id):
+        return graph.index.nearest_index(*self.NODES[node_id])[0]
+
+    def test_fastest_path_over_csr_graph(self):
+        graph = routing.parse_osm(self.osm_path)
+        # The footway is not drivable; node 5 comes from the primary road
+        self.assertEqual(len(graph), 5)
+        self.assertEqual(len(graph.offsets), len(graph) + 1)
+
+        route = graph.shortest_path(self.node(graph, 1), self.node(graph, 3))
+        # The longer motorway beats the direct residential street
+        self.assertEqual(route.coordinates, [self.NODES[1], self.NODES[4], self.NODES[3]])
+        miles = (geometry.haversine(*self.NODES[1], *self.NODES[4]) +
+                 geometry.haversine(*self.NODES[4], *self.NODES[3]))
+        self.assertAlmostEqual(route.miles, miles)
+        self.assertAlmostEqual(route.hours, miles / 65)
+        # One-way: 5 -> 3 only
+        self.assertIsNone(graph.shortest_path(self.node(graph, 3), self.node(graph, 5)))
+        self.assertIsNotNone(graph.shortest_path(self.node(graph, 5), self.node(graph, 3)))
+
+    @skipIf(hos.np is None, 'NumPy is not installed')
+    def test_npz_round_trip_and_route_cache(self):
+        npz_path = os.path.join(self.directory.name, 'graph.npz')
+        routing.save_graph(routing.parse_osm(self.osm_path), npz_path)
+        graph = routing.load_graph(npz_path)
+        # The arrays are used in place, not copied into lists
+        self.assertIsInstance(graph.targets, memoryview)
+        router = routing.Router(graph)
+
+        first = router.route((40.0, -75.0), (40.0, -74.8))
+        self.assertEqual(router.route((40.001, -75.0), (40.0, -74.8)), first)
+        self.assertEqual(router.stats(), {'hits': 1, 'misses': 1, 'size': 1})
+        with self.assertRaises(ValueError):
+            router.route((45.0, -75.0), (40.0, -74.8))
+
+    def test_calculate_route_from_locations_only(self):
+        cities_path = os.path.join(self.directory.name, 'cities.txt')
+        with open(cities_path, 'w') as f:
+            f.write(geonames_row('Trenton', 40.0, -75.0, admin1='NJ'))
+            f.write(geonames_row('Hamilton', 40.05, -74.9, admin1='NJ'))
+        payload = {
+            'current_location': 'Trenton, NJ',
+            'pickup_location': 'Hamilton',
+            'dropoff_location': '40.0, -74.8',
+            'current_cycle_hours': 10,
+        }
+        with override_settings(ROUTE_PLANNER_ROAD_GRAPH_PATH=self.osm_path,
+                               ROUTE_PLANNER_GAZETTEER_PATH=cities_path):
+            response = self.client.post('/calculate-route/', payload, content_type='application/json')
+            unknown = self.client.post('/calculate-route/', {**payload, 'pickup_location': 'Atlantis'},
+                                       content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        route = response.json()['route']
+        # Trenton -> Hamilton (node 4) -> node 3 by motorway
+        self.assertAlmostEqual(route['totalDistance'],
+                               geometry.haversine(*self.NODES[1], *self.NODES[4]) +
+                               geometry.haversine(*self.NODES[4], *self.NODES[3]))
+        self.assertEqual([point['type'] for point in route['points']], ['start', 'pickup', 'dropoff'])
+        self.assertEqual(route['stops'][-1]['location'], '40.0, -74.8')
+        self.assertEqual(unknown.status_code, 400)
+        self.assertIn('pickup_location', unknown.json()['error'])
+
+    def test_repeated_locations_are_answered_before_routing(self):
+        payload = {
+            'current_location': '40.0, -75.0',
+            'pickup_location': '40.05, -74.9',
+            'dropoff_location': '40.0, -74.8',
+            'current_cycle_hours': 10,
+        }
+        result_cache.get_cache().clear()
+        with override_settings(ROUTE_PLANNER_ROAD_GRAPH_PATH=self.osm_path):
+            first = self.client.post('/calculate-route/', payload, content_type='application/json')
+            with patch('route_planner.routing.Router.route') as route:
+                second = self.client.post('/calculate-route/', payload, content_type='application/json')
+            later = self.client.post('/calculate-route/', {**payload, 'current_cycle_hours': 20},
+                                     content_type='application/json')
+
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.json(), first.json())
+        route.assert_not_called()
+        # Other planning input still misses
+        self.assertEqual(later['X-Cache'], 'MISS')
+        self.assertEqual(later.json()['route']['points'], first.json()['route']['points'])
+
+
+class TimeZoneSchedulingTests(TestCase):
+    CITIES = [
+        ('New York', 40.7128, -74.0060, 'NY', 'America/New_York'),
+        ('Chicago', 41.8781, -87.6298, 'IL', 'America/Chicago'),
+    ]
+
+    def setUp(self):
+        result_cache.get_cache().clear()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'cities.txt')
+        with open(self.path, 'w') as f:
+            for name, lat, lon, state, zone in self.CITIES:
+                f.write(geonames_row(name, lat, lon, admin1=state, timezone_name=zone))
+
+    def chicago_payload(self, **extra):
+        return {
+            **route_payload(total_distance=800, total_drive_time=14),
+            'points': [
+                {'lat': 40.7128, 'lon': -74.0060, 'name': "New York, NY", 'type': 'start'},
+                {'lat': 40.7128, 'lon': -74.0060, 'name': "New York, NY", 'type': 'pickup'},
+                {'lat': 41.8781, 'lon': -87.6298, 'name': "Chicago, IL", 'type': 'dropoff'},
+            ],
+            'fuel_interval_miles': 0,
+            **extra,
+        }
+
+    def test_schedule_counts_elapsed_hours_across_dst(self):
+        zone = ZoneInfo('America/New_York')
+        # Clocks spring forward at 2 AM on 2026-03-08
+        schedule = timezones.Schedule(datetime(2026, 3, 8, 0, 30, tzinfo=zone), zone)
+        self.assertEqual(schedule.start_hours, 0.5)
+        self.assertEqual(schedule.at(3.5).isoformat(), '2026-03-08T04:30:00-04:00')
+        self.assertEqual(schedule.at(24.5, ZoneInfo('America/Chicago')).isoformat(),
+                         '2026-03-09T00:30:00-05:00')
+
+    def test_zone_index_uses_gazetteer_then_the_server_zone(self):
+        zones = timezones.TimeZoneIndex(spatial.get_index(self.path), max_miles=100)
+        self.assertEqual(zones.zone_at(41.85, -87.65).key, 'America/Chicago')
+        self.assertEqual(zones.zone_at(40.0, -75.0).key, 'America/New_York')
+        with self.assertLogs('route_planner.timezones', 'WARNING'):
+            self.assertEqual(zones.zone_at(20.0, -150.0).key, 'UTC')
+        # A real zone, so it keeps daylight saving time
+        with override_settings(TIME_ZONE='America/New_York'), self.assertLogs('route_planner.timezones', 'WARNING'):
+            zone = timezones.TimeZoneIndex().zone_at(40.7, -74.0)
+        self.assertEqual(datetime(2026, 7, 1, tzinfo=zone).utcoffset(), timedelta(hours=-4))
+
+    def test_log_days_end_at_local_midnight_across_dst(self):
+        zone = ZoneInfo('America/New_York')
+        # Clocks fall back at 2 AM on 2026-11-01, which is 25 hours long
+        schedule = timezones.Schedule(datetime(2026, 10, 31, 20, tzinfo=zone), zone)
+        self.assertEqual([schedule.midnight(day) for day in range(4)], [0, 24, 49, 73])
+        events, _ = hos.simulate(hos.single_leg_plan(20, 1100), start_time=schedule.start_hours, fuel_interval=0)
+        builder = LogSheetBuilder([], schedule=schedule)
+        for event in events:
+            builder.add(event)
+        sheets = builder.finish()
+
+        self.assertEqual([sheet['activities'][-1]['endTime'] for sheet in sheets], ['24', '25', '24'])
+        for sheet in sheets[1:]:
+            self.assertEqual(sheet['activities'][0]['startTime'], '0')
+            self.assertEqual(datetime.fromisoformat(sheet['activities'][0]['startAt']).time(), datetime.min.time())
+        # The long day keeps its last hour through the packed grid
+        activities = [{'status': a['status'], 'start_time': a['startTime'], 'end_time': a['endTime'],
+                       'location': a['location'], 'remarks': a['remarks']} for a in sheets[1]['activities']]
+        decoded = duty_grid.decode(*duty_grid.encode(activities))
+        self.assertEqual(decoded[-1]['end_time'], 25)
+
+    def test_spring_forward_day_packs_without_a_padded_hour(self):
+        zone = ZoneInfo('America/New_York')
+        # Clocks spring forward at 2 AM on 2026-03-08, which is 23 hours long
+        schedule = timezones.Schedule(datetime(2026, 3, 7, 20, tzinfo=zone), zone)
+        events, _ = hos.simulate(hos.single_leg_plan(20, 1100), start_time=schedule.start_hours, fuel_interval=0)
+        builder = LogSheetBuilder([], schedule=schedule)
+        for event in events:
+            builder.add(event)
+        activities = builder.finish()[1]['activities']
+        self.assertEqual(activities[-1]['endTime'], '23')
+
+        packed = pack_activities(activities)
+        self.assertEqual(len(packed['duty_grid']), 23)
+        decoded = duty_grid.decode(packed['duty_grid'], packed['grid_notes'])
+        self.assertEqual(decoded[-1]['end_time'], 23)
+        self.assertEqual([(a['status'], a['end_time']) for a in decoded],
+                         [(a['status'], float(a['endTime'])) for a in activities])
+
+    def test_log_days_from_a_later_hour_match_the_full_logs(self):
+        zone = ZoneInfo('America/New_York')
+        schedule = timezones.Schedule(datetime(2026, 10, 31, 20, tzinfo=zone), zone)
+        events, _ = hos.simulate(hos.single_leg_plan(20, 1100), start_time=schedule.start_hours, fuel_interval=0)
+        sheets = {}
+        for from_hours in (0.0, 30.0):
+            builder = LogSheetBuilder([], schedule=schedule, from_hours=from_hours)
+            for event in events:
+                builder.add(event)
+            sheets[from_hours] = builder.finish()
+
+        # Hour 30 is on the second (25-hour) day
+        self.assertEqual(sheets[30.0], sheets[0.0][1:])
+
+    def test_stops_and_activities_get_local_timestamps(self):
+        payload = self.chicago_payload(start_time='2026-10-19T06:00:00')
+        with override_settings(ROUTE_PLANNER_GAZETTEER_PATH=self.path):
+            route = process_route_data(build_route_data(payload), 0)
+            log_sheets = generate_eld_logs(route)
+
+        self.assertEqual(route['startTime'], '2026-10-19T06:00:00-04:00')
+        self.assertEqual(route['timeZone'], 'America/New_York')
+        pickup, dropoff = route['stops'][0], route['stops'][-1]
+        self.assertEqual(pickup['arrivalTime'], '6:00 AM')
+        self.assertEqual(pickup['arrivalAt'], '2026-10-19T06:00:00-04:00')
+        self.assertEqual(dropoff['timeZone'], 'America/Chicago')
+        arrival = datetime.fromisoformat(dropoff['arrivalAt'])
+        self.assertEqual(arrival.utcoffset(), timedelta(hours=-5))
+        self.assertEqual(arrival, datetime.fromisoformat(route['startTime']) +
+                         timedelta(hours=dropoff['arrivalHours'] - 6))
+        # Log activities stay on the home terminal's clock
+        first = log_sheets[0]['activities'][0]
+        self.assertEqual((first['startAt'], first['endAt']),
+                         ('2026-10-19T00:00:00-04:00', '2026-10-19T06:00:00-04:00'))
+
+        with self.assertRaises(ValueError):
+            build_route_data({**payload, 'time_zone': 'Mars/Olympus'})
+
+    def test_trip_without_start_time_keeps_relative_clock(self):
+        route = process_route_data(build_route_data(route_payload()), 0)
+        self.assertIsNone(route['startTime'])
+        self.assertEqual(route['stops'][0]['arrivalTime'], '8:00 AM')
+        self.assertIsNone(route['stops'][0]['arrivalAt'])
+
+    def test_start_and_arrival_times_are_saved(self):
+        payload = self.chicago_payload(start_time='2026-10-19T10:00:00Z', time_zone='America/Chicago')
+        with override_settings(ROUTE_PLANNER_GAZETTEER_PATH=self.path):
+            response = self.client.post('/calculate-route/', payload, content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        trip = Trip.objects.get(pk=response.json()['tripId'])
+        self.assertEqual(trip.start_at, datetime(2026, 10, 19, 10, tzinfo=ZoneInfo('UTC')))
+        self.assertEqual(trip.time_zone, 'America/Chicago')
+        stops = list(trip.stops.all())
+        self.assertEqual([stop.time_zone for stop in (stops[0], stops[-1])],
+                         ['America/New_York', 'America/Chicago'])
+
+        data = self.client.get(f'/trips/{trip.id}/').json()
+        self.assertEqual(data['start_at'], '2026-10-19T05:00:00-05:00')
+        self.assertEqual(data['stops'][0]['arrival_at'], '2026-10-19T06:00:00-04:00')
+
+
+def actual_event(event):
+    """Re-plan request event of a simulated DutyEvent"""
+    return {'status': event.status, 'start': event.start, 'end': event.end,
+            'miles': event.end_mile - event.start_mile, 'kind': event.kind}
+
+
+class TripReplanTests(TestCase):
+    LINE = [(40.7128, -74.0060), (39.9526, -75.1652), (38.9072, -77.0369)]
+
+    def setUp(self):
+        result_cache.get_cache().clear()
+        self.payload = {
+            **route_payload(total_distance=600, total_drive_time=11),
+            'geometry': geometry.encode_polyline(self.LINE),
+            'fuel_interval_miles': 0,
+            'driver_id': 'driver-7',
+        }
+        response = self.client.post('/calculate-route/', self.payload, content_type='application/json')
+        self.trip = Trip.objects.get(pk=response.json()['tripId'])
+        self.planned = process_route_data(build_route_data(self.payload), 10)['events']
+        self.line = geometry.RouteLine(self.LINE)
+
+    def position(self, mile):
+        return self.line.locate_fraction(mile / 600)
+
+    def replan(self, events, mile):
+        return self.client.post(f'/trips/{self.trip.id}/replan/',
+                                {'position': self.position(mile), 'events': events},
+                                content_type='application/json')
+
+    def test_replay_seeds_clocks_from_actual_events(self):
+        pickup, drive, rest = (hos.DutyEvent(hos.ON_DUTY, 8, 9, 0, 0, hos.PICKUP),
+                               hos.DutyEvent(hos.DRIVING, 9, 15, 0, 300, hos.DRIVE),
+                               hos.DutyEvent(hos.OFF_DUTY, 15, 15.5, 300, 300, hos.BREAK))
+        clocks = hos.replay([pickup, drive, rest], hos.DutyClocks(cycle=10))
+        self.assertEqual((clocks.cycle, clocks.driving, clocks.since_break, clocks.shift_start,
+                          clocks.since_fuel), (17, 6, 0, 8, 300))
+        # The gap before the next event adds up with the off-duty time to a rest
+        later = hos.DutyEvent(hos.ON_DUTY, 25, 26, 300, 300, hos.DROPOFF)
+        clocks = hos.replay([pickup, drive, rest, later], hos.DutyClocks(cycle=10))
+        self.assertEqual((clocks.cycle, clocks.driving, clocks.shift_start), (18, 0, 25))
+
+    def test_actual_events_spread_the_truck_mile_and_end_legs(self):
+        events, locations = replan.parse_actual_events([
+            {'status': 'onDuty', 'start': 8, 'end': 9, 'kind': 'pickup', 'location': 'Depot'},
+            {'status': 'driving', 'start': 9, 'end': 12},
+            {'status': 'offDuty', 'start': 12, 'end': 12.5},
+            {'status': 'driving', 'start': 12.5, 'end': 13.5},
+        ], 200)
+
+        self.assertEqual([(event.start_mile, event.end_mile) for event in events],
+                         [(0, 0), (0, 150), (150, 150), (150, 200)])
+        # Driving after the pickup belongs to the next leg
+        self.assertEqual([event.leg for event in events], [0, 1, 1, 1])
+        self.assertEqual(locations, ['Depot', None, None, None])
+        with self.assertRaises(ValueError):
+            replan.parse_actual_events([{'status': 'driving', 'start': 9, 'end': 10, 'kind': 'nap'}], 0)
+
+    def test_remaining_plan_drives_from_the_truck(self):
+        leg_stops = [stop for stop in self.trip.stops.all() if stop.stop_type in replan.LEG_STOP_TYPES]
+        plan = replan.remaining_plan(self.trip, leg_stops[1:], 300)
+        self.assertEqual([(task[0], task[3]) for task in plan], [(hos.DRIVING, hos.DRIVE), (hos.ON_DUTY, hos.DROPOFF)])
+        self.assertAlmostEqual(plan[0][2], 300)
+        self.assertAlmostEqual(plan[0][1], 5.5)
+
+    def test_on_time_replan_writes_nothing(self):
+        # Pickup, 8 hours of driving and the break
+        events = self.planned[:3]
+        # Including the savepoints of the transaction the trip is locked in
+        with self.assertNumQueries(10):
+            response = self.replan([actual_event(event) for event in events], events[-1].end_mile)
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['keptStops'], 2)
+        self.assertEqual([stop['type'] for stop in body['stops']], ['Dropoff'])
+        zero = {'created': 0, 'updated': 0, 'deleted': 0}
+        self.assertEqual(body['changes'], {'stops': zero, 'logSheets': zero})
+
+    def test_replan_invalidates_the_cached_plan(self):
+        cached = self.client.post('/calculate-route/', self.payload, content_type='application/json')
+        self.assertEqual(cached['X-Cache'], 'HIT')
+        events = self.planned[:2]
+        self.assertEqual(self.replan([actual_event(event) for event in events], 300).status_code, 200)
+
+        self.trip.refresh_from_db()
+        self.assertIsNotNone(self.trip.replanned_at)
+        replayed = self.client.post('/calculate-route/', self.payload, content_type='application/json')
+        self.assertEqual(replayed['X-Cache'], 'MISS')
+        self.assertNotEqual(replayed.json()['tripId'], self.trip.id)
+
+    def test_delayed_replan_updates_remaining_stops_and_logs(self):
+        pickup, drive = self.planned[:2]
+        mile = 600 * 4 / 11
+        events = [
+            actual_event(pickup),
+            {'status': hos.DRIVING, 'start': 9, 'end': 13, 'miles': mile},
+            {'status': hos.OFF_DUTY, 'start': 13, 'end': 16},
+        ]
+        response = self.replan(events, mile)
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        # 6 hours left in the 14-hour window, then a rest before the last hour
+        self.assertEqual([stop['type'] for stop in body['stops']], ['Required Rest Period', 'Dropoff'])
+        self.assertAlmostEqual(body['stops'][0]['arrivalHours'], 22)
+        self.assertAlmostEqual(body['stops'][1]['arrivalHours'], 33)
+        self.assertEqual(body['changes']['stops'], {'created': 0, 'updated': 2, 'deleted': 0})
+        self.assertEqual(body['changes']['logSheets'], {'created': 1, 'updated': 1, 'deleted': 0})
+
+        stops = list(self.trip.stops.all())
+        self.assertEqual([stop.stop_type for stop in stops], ['PICKUP', 'REQUIRED REST PERIOD', 'DROPOFF'])
+        self.assertAlmostEqual(stops[1].mile, mile + 600 * 6 / 11)
+        sheets = list(self.trip.log_sheets.all())
+        self.assertEqual(len(sheets), 2)
+        statuses = [activity.status for activity in sheets[0].activities.all()]
+        self.assertEqual(statuses, ['offDuty', 'onDuty', 'driving', 'offDuty', 'driving', 'sleeperBerth'])
+
+        # The driver's days now hold 1 + 4 + 6 and 1 + 1 on-duty hours
+        cycle = ledger.summary(DriverCycleLedger.objects.get(driver_id='driver-7'),
+                               ledger.trip_start_date(self.trip) + timedelta(days=1))
+        self.assertEqual([day['hours'] for day in cycle['days'][-2:]], [11, 2])
+
+    def test_later_replans_rewrite_only_the_days_from_the_previous_one(self):
+        mile = 600 * 4 / 11
+        events = [
+            actual_event(self.planned[0]),
+            {'status': hos.DRIVING, 'start': 9, 'end': 13, 'miles': mile},
+            {'status': hos.OFF_DUTY, 'start': 13, 'end': 27},
+        ]
+        self.assertEqual(self.replan(events, mile).json()['firstLogDay'], 1)
+        first_day = list(self.trip.log_sheets.get(day=1).activities.values_list('status', 'start_time', 'end_time'))
+
+        events.append({'status': hos.DRIVING, 'start': 27, 'end': 28, 'miles': 600 / 11})
+        response = self.replan(events, mile + 600 / 11)
+
+        body = response.json()
+        # The previous re-plan was made on day 2, so day 1 is not read again
+        self.assertEqual(body['firstLogDay'], 2)
+        self.assertEqual([sheet['date'] for sheet in body['logSheets']], ['Day 2'])
+        # Day 2 now logs the hour driven apart from the planned driving
+        self.assertEqual(body['changes']['logSheets'], {'created': 0, 'updated': 1, 'deleted': 0})
+        self.assertEqual(
+            list(self.trip.log_sheets.get(day=1).activities.values_list('status', 'start_time', 'end_time')),
+            first_day)
+
+    def test_planned_stops_passed_without_happening_are_dropped(self):
+        pickup, drive, planned_break = self.planned[:3]
+        mile = 600 * 8.5 / 11
+        response = self.replan([actual_event(pickup),
+                                {'status': hos.DRIVING, 'start': 9, 'end': 17.5, 'miles': mile}], mile)
+
+        body = response.json()
+        self.assertEqual(body['keptStops'], 1)
+        self.assertEqual(body['changes']['stops'], {'created': 1, 'updated': 1, 'deleted': 1})
+        stops = list(self.trip.stops.all())
+        self.assertEqual([(stop.sequence, stop.stop_type) for stop in stops],
+                         [(0, 'PICKUP'), (2, 'REQUIRED BREAK'), (3, 'DROPOFF')])
+        # The break is taken where the truck is, past the planned one
+        self.assertAlmostEqual(stops[1].mile, mile)
+        self.assertGreater(stops[1].mile, planned_break.start_mile)
+
+    def test_invalid_replans(self):
+        self.assertEqual(self.client.post('/trips/999/replan/', {'position': [0, 0]},
+                                          content_type='application/json').status_code, 404)
+        self.assertEqual(self.client.post(f'/trips/{self.trip.id}/replan/', {},
+                                          content_type='application/json').status_code, 400)
+        bad_status = self.replan([{'status': 'napping', 'start': 8, 'end': 9}], 0)
+        overlapping = self.replan([{'status': 'onDuty', 'start': 8, 'end': 9},
+                                   {'status': 'driving', 'start': 8.5, 'end': 10}], 0)
+        self.assertEqual((bad_status.status_code, overlapping.status_code), (400, 400))
@@ -0,0 +1,129 @@
+"""
+Coordinate -> time zone lookups for real-clock trip schedules.
+
+Zones come from the ``timezone`` column of the gazetteer at
+``ROUTE_PLANNER_GAZETTEER_PATH`` (GeoNames cities tables carry one).
+``TimeZoneIndex`` precomputes the zone of every grid cell holding a
+gazetteer place (that of its most populous place), so the lookups made
+for each stop of a plan are a dict access. Cells without a place take
+the zone of the nearest place within ``max_miles`` and are memoized the
+same way. Without a gazetteer, or far from any place, the zone falls
+back to the server's ``TIME_ZONE`` (with a warning): a real zone keeps
+daylight saving time, which a zone guessed from the longitude would not.
+"""
+import logging
+import math
+import threading
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from django.conf import settings
+
+from . import spatial
+
+logger = logging.getLogger(__name__)
+
+
+def default_zone():
+    """``ZoneInfo`` of the ``TIME_ZONE`` setting (UTC if it is unknown)"""
+    return get_zone(settings.TIME_ZONE) or ZoneInfo('UTC')
+
+
+def get_zone(name):
+    """``ZoneInfo`` named ``name``, None if it is unknown"""
+    try:
+        return ZoneInfo(name) if name else None
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+class TimeZoneIndex:
+    """Time zone of coordinates, precomputed per grid cell of a place index."""
+
+    def __init__(self, index=None, max_miles=100.0):
+        self.index = index
+        self.max_miles = max_miles
+        self._cells = {}
+        self._lock = threading.Lock()
+        if index is not None:
+            for cell, entries in index.cells.items():
+                places = [index.places[entry[2]] for entry in entries]
+                places.sort(key=spatial.population, reverse=True)
+                zone = next(filter(None, (_place_zone(place) for place in places)), None)
+                if zone is not None:
+                    self._cells[cell] = zone
+
+    def _cell(self, lat, lon):
+        size = self.index.cell_degrees if self.index is not None else spatial.CELL_DEGREES
+        return math.floor(lat / size), math.floor(lon / size)
+
+    def zone_at(self, lat, lon):
+        """``ZoneInfo`` of (lat, lon)"""
+        cell = self._cell(lat, lon)
+        zone = self._cells.get(cell)
+        if zone is None:
+            zone = self._nearest_zone(lat, lon)
+            if zone is None:
+                zone = default_zone()
+                logger.warning('No gazetteer time zone near %.4f, %.4f; using %s', lat, lon, zone.key)
+            with self._lock:
+                self._cells[cell] = zone
+        return zone
+
+    def _nearest_zone(self, lat, lon):
+        if self.index is None:
+            return None
+        found = self.index.nearest(lat, lon, self.max_miles)
+        return _place_zone(found[0]) if found is not None else None
+
+
+def _place_zone(place):
+    return get_zone((place.properties or {}).get('timezone'))
+
+
+_zone_index = None
+
+
+def get_time_zone_index():
+    """The process-wide ``TimeZoneIndex``, rebuilt when the gazetteer file changes."""
+    global _zone_index
+    index = spatial.get_index(settings.ROUTE_PLANNER_GAZETTEER_PATH)
+    zone_index = _zone_index
+    if zone_index is None or zone_index.index is not index:
+        zone_index = _zone_index = TimeZoneIndex(index, settings.ROUTE_PLANNER_TIME_ZONE_MAX_MILES)
+    return zone_index
+
+
+class Schedule:
+    """
+    Maps trip hours (from midnight of the first day in the home terminal's
+    zone) to aware datetimes.
+    """
+
+    def __init__(self, start, zone):
+        self.zone = zone
+        start = start.astimezone(zone)
+        midnight = datetime(start.year, start.month, start.day, tzinfo=zone)
+        # Offsets are elapsed hours, so add them in UTC to stay right across DST changes
+        self.origin = midnight.astimezone(dt_timezone.utc)
+        self.start_hours = (start.astimezone(dt_timezone.utc) - self.origin).total_seconds() / 3600
+
+    def at(self, hours, zone=None):
+        """Aware datetime ``hours`` into the trip, in ``zone`` (default: the home zone)"""
+        return (self.origin + timedelta(hours=hours)).astimezone(zone or self.zone)
+
+    def midnight(self, day):
+        """
+        Trip hours of the home zone's midnight starting day ``day`` of the
+        trip (0 is the first). Days are 23 or 25 hours long across DST changes.
+        """
+        first = self.origin.astimezone(self.zone).date()
+        local = datetime.combine(first + timedelta(days=day), time(), tzinfo=self.zone)
+        return (local.astimezone(dt_timezone.utc) - self.origin).total_seconds() / 3600
+
+
+def local_isoformat(value, zone_name):
+    """ISO 8601 of an aware datetime in the zone named ``zone_name`` (UTC if unknown)"""
+    if value is None:
+        return None
+    return value.astimezone(get_zone(zone_name) or dt_timezone.utc).isoformat()
@@ -1,13 +1,32 @@
 from django.urls import path
-from .views import home, calculate_route, get_trips
+from .views import (
+    home, calculate_route, calculate_route_cache_stats, calculate_routes_batch, get_trips,
+)
 from . import views
+from .metrics import metrics_view
 
 urlpatterns = [
     path('', home, name='home'),
     path('calculate-route/', calculate_route, name='calculate-route'),
+    path('calculate-route/cache-stats/', calculate_route_cache_stats, name='calculate-route-cache-stats'),
+    path('calculate-routes/batch/', calculate_routes_batch, name='calculate-routes-batch'),
+    path('trips/export/', views.export_trips, name='trip-export'),
     path('trips/', views.TripListView.as_view(), name='trip-list'),
     path('trips/<int:pk>/', views.TripDetailView.as_view(), name='trip-detail'),
+    path('trips/<int:pk>/logs.<str:render_format>', views.render_log_sheets, name='trip-logs-render'),
+    path('trips/<int:pk>/logs/<int:day>.<str:render_format>', views.render_log_sheets,
+         name='log-sheet-render'),
+    path('trips/<int:pk>/replan/', views.replan_trip, name='trip-replan'),
     path('trip/', get_trips, name='trip'),
+    path('drivers/<str:driver_id>/cycle/', views.driver_cycle, name='driver-cycle'),
+    path('drivers/<str:driver_id>/logs/', views.record_driver_logs, name='driver-logs'),
+    path('reverse-geocode/', views.reverse_geocode, name='reverse-geocode'),
+    path('metrics', metrics_view, name='metrics'),
+    # Async variants for ASGI deployments
+    path('async/calculate-route/', views.calculate_route_async, name='calculate-route-async'),
+    path('async/trips/', views.trip_list_async, name='trip-list-async'),
+    path('async/trips/export/', views.export_trips_async, name='trip-export-async'),
+    path('async/trips/<int:pk>/', views.trip_detail_async, name='trip-detail-async'),
 ]
 
 
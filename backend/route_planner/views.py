@@ -1,21 +1,293 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.http import Http404, HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
+from django.utils.dateparse import parse_date, parse_datetime
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
 from rest_framework.decorators import api_view
+from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework import status, generics
-from .models import Trip, Stop, LogSheet, LogActivity
+from .models import Trip, LogSheet, DriverCycleLedger
 from .serializers import TripSerializer, TripInputSerializer
-from .services import process_route_data, generate_eld_logs
+from .services import plan_trip
+from .geometry import encode_polyline, point_coordinates
+from .persistence import save_trip_plan, save_trip_plans, save_trip_replan
+from .batch import plan_trips, plan_trip_async
+from . import cache as result_cache, exports, geocoding, idempotency, ledger, rendering, replan, routing, timezones
+from .metrics import stage
+from .pagination import TripCursorPagination
 
 
 def home(request, *args, **kwargs):
     return render(request, 'index.html')
 
 
+# Prefetch lookups needed to serialize each nested relation of a trip
+TRIP_PREFETCHES = {
+    'stops': 'stops',
+    'log_sheets': 'log_sheets__activities',
+}
+
+
+def parse_projection(query_params):
+    """Read the ``?fields=`` and ``?expand=`` comma-separated projections."""
+    def split(name):
+        if name not in query_params:
+            return None
+        return {value.strip() for value in query_params[name].split(',') if value.strip()}
+
+    return split('fields'), split('expand')
+
+
+def trip_queryset(fields=None, expand=None):
+    """Trips with only the relations the projection serializes prefetched."""
+    relations = TripSerializer.selected_relations(fields, expand)
+    return Trip.objects.prefetch_related(*(TRIP_PREFETCHES[name] for name in relations))
+
+
+def paginated_trips(request):
+    """One cursor page of projected trips for a DRF ``request``."""
+    fields, expand = parse_projection(request.query_params)
+    paginator = TripCursorPagination()
+    trips = paginator.paginate_queryset(trip_queryset(fields, expand), request)
+    serializedData = TripSerializer(trips, many=True, fields=fields, expand=expand).data
+    return paginator.get_paginated_response(serializedData)
+
+
 @api_view(['GET'])
 def get_trips(request):
-    trips = Trip.objects.all()
-    serializedData = TripSerializer(trips, many=True).data
-    return Response(serializedData)
+    return paginated_trips(request)
+
+
+REQUIRED_TRIP_FIELDS = ['current_location', 'pickup_location', 'dropoff_location',
+                        'current_cycle_hours', 'total_distance', 'total_drive_time', 'points']
+# Totals a multi-leg payload may leave out; they are summed from its legs
+LEG_TOTAL_FIELDS = ['total_distance', 'total_drive_time']
+# Fields server-side routing fills in, and the locations it routes through
+ROUTED_FIELDS = ['total_distance', 'total_drive_time', 'points']
+ROUTED_LOCATIONS = [('current_location', 'start'), ('pickup_location', 'pickup'), ('dropoff_location', 'dropoff')]
+
+
+def missing_trip_field(data):
+    """First required calculate-route field missing from ``data``, if any."""
+    for field in REQUIRED_TRIP_FIELDS:
+        if field not in data and not (data.get('legs') and field in LEG_TOTAL_FIELDS):
+            return field
+    return None
+
+
+def with_ledger_cycle_hours(data):
+    """
+    ``data`` with ``current_cycle_hours`` defaulted from the driver's ledger.
+
+    Only applies when the payload names a ``driver_id`` and leaves the
+    cycle hours out; otherwise ``data`` is returned unchanged.
+    """
+    if 'current_cycle_hours' in data or not data.get('driver_id'):
+        return data
+    return {**{key: data[key] for key in data}, 'current_cycle_hours': ledger.cycle_hours(data['driver_id'])}
+
+
+def server_router(data):
+    """
+    ``Router`` to compute the route of ``data`` with, or None when the
+    payload brings its own route or no road graph is configured (see
+    ``with_server_route``).
+    """
+    if data.get('legs') or any(field in data for field in ROUTED_FIELDS):
+        return None
+    router = routing.get_router()
+    if router is None or not all(data.get(field) for field, _ in ROUTED_LOCATIONS):
+        return None
+    return router
+
+
+def with_server_route(data):
+    """
+    ``data`` with its route computed server-side from the location names.
+
+    Only applies when the payload leaves out all of ``total_distance``,
+    ``total_drive_time`` and ``points`` (and has no ``legs``) and a road
+    graph is configured: each location is placed with ``geocoding.locate``
+    and the trip is routed current -> pickup -> dropoff over the graph.
+    Raises ``ValueError`` when a location cannot be placed or reached.
+    """
+    router = server_router(data)
+    if router is None:
+        return data
+
+    points = []
+    for field, point_type in ROUTED_LOCATIONS:
+        coordinates = geocoding.locate(str(data[field]))
+        if coordinates is None:
+            raise ValueError(f'Unknown {field}: {data[field]}')
+        points.append({'lat': coordinates[0], 'lon': coordinates[1], 'name': data[field], 'type': point_type})
+    routes = [router.route(point_coordinates(origin), point_coordinates(destination))
+              for origin, destination in zip(points, points[1:])]
+
+    geometry = list(routes[0].coordinates)
+    for route in routes[1:]:
+        geometry.extend(route.coordinates[1:])
+    return {
+        **{key: data[key] for key in data},
+        'total_distance': sum(route.miles for route in routes),
+        'total_drive_time': sum(route.hours for route in routes),
+        'points': points,
+        'geometry': data.get('geometry') or [list(coordinates) for coordinates in geometry],
+    }
+
+
+def build_legs(legs):
+    """
+    Normalize the optional ``legs`` of a calculate-route payload.
+
+    Each leg drives ``distance`` miles in ``drive_time`` hours to a stop
+    ``name`` (optionally at ``lat``/``lon``) and spends ``dwell_hours``
+    (default 1) on duty there, loading for a ``type`` of ``pickup`` or
+    unloading for ``dropoff`` (the default).
+    """
+    if not isinstance(legs, list) or not legs:
+        raise ValueError('legs must be a non-empty list')
+    normalized = []
+    for index, leg in enumerate(legs):
+        if not isinstance(leg, dict):
+            raise ValueError(f'Leg {index} must be an object')
+        for field in ('distance', 'drive_time'):
+            if field not in leg:
+                raise ValueError(f'Leg {index}: missing required field: {field}')
+        leg_type = leg.get('type', 'dropoff')
+        if leg_type not in ('pickup', 'dropoff'):
+            raise ValueError(f'Leg {index}: type must be "pickup" or "dropoff"')
+        normalized.append({
+            'distance': float(leg['distance']),
+            'drive_time': float(leg['drive_time']),
+            'dwell_hours': float(leg.get('dwell_hours', 1)),
+            'type': leg_type,
+            'name': leg.get('name') or f'Stop {index + 1}',
+            'lat': float(leg['lat']) if leg.get('lat') is not None else None,
+            'lon': float(leg['lon']) if leg.get('lon') is not None else None,
+        })
+        if min(normalized[-1]['distance'], normalized[-1]['drive_time'], normalized[-1]['dwell_hours']) < 0:
+            raise ValueError(f'Leg {index}: distance, drive_time and dwell_hours must not be negative')
+    return normalized
+
+
+def build_route_data(data):
+    """Build the route_data dict for HOS processing from a calculate-route payload."""
+    legs = build_legs(data['legs']) if data.get('legs') else None
+    if legs:
+        total_distance = sum(leg['distance'] for leg in legs)
+        total_drive_time = sum(leg['drive_time'] for leg in legs)
+    else:
+        total_distance = float(data['total_distance'])
+        total_drive_time = float(data['total_drive_time'])
+    route_data = {
+        'total_distance': total_distance,
+        'total_distance_km': float(data.get('total_distance_km', total_distance * 1.60934)),
+        'total_drive_time': total_drive_time,
+        'points': data['points'],
+        'geometry': data.get('geometry'),
+        'geometry_precision': int(data.get('geometry_precision', 5)),
+        'simplify_tolerance': float(data.get(
+            'simplify_tolerance', settings.ROUTE_PLANNER_SIMPLIFY_TOLERANCE_MILES)),
+        'fuel_interval': float(data.get('fuel_interval_miles', settings.ROUTE_PLANNER_FUEL_INTERVAL_MILES)),
+    }
+    if legs:
+        route_data['legs'] = legs
+    if data.get('start_time'):
+        start_time = parse_datetime(str(data['start_time']))
+        if start_time is None:
+            raise ValueError('start_time must be an ISO 8601 datetime')
+        route_data['start_time'] = start_time.isoformat()
+    if data.get('time_zone'):
+        if timezones.get_zone(data['time_zone']) is None:
+            raise ValueError(f"Unknown time zone: {data['time_zone']}")
+        route_data['time_zone'] = data['time_zone']
+    return route_data
+
+
+def route_input(data):
+    """
+    ``(data, route_data)`` of a calculate-route payload, routed server-side
+    when it only names its locations. Raises ``ValueError`` (or
+    ``TypeError``) for invalid payloads.
+    """
+    data = with_server_route(data)
+    field = missing_trip_field(data)
+    if field:
+        raise ValueError(f'Missing required field: {field}')
+    return data, build_route_data(data)
+
+
+def planning_key(data):
+    """
+    ``(data, route_data, request_hash)`` of a calculate-route payload.
+
+    Payloads to be routed server-side are keyed by their locations and the
+    road graph's version instead, so repeats are answered from the result
+    cache without routing; their ``route_data`` is None until
+    ``route_input`` computes it. Raises ``ValueError`` (or ``TypeError``)
+    for invalid payloads.
+    """
+    router = server_router(data)
+    if router is None:
+        data, route_data = route_input(data)
+        return data, route_data, result_cache.payload_hash(data, route_data)
+    if 'current_cycle_hours' not in data:
+        raise ValueError('Missing required field: current_cycle_hours')
+    return data, None, result_cache.location_hash(data, router.version)
+
+
+def build_trip(data, processed_route):
+    """
+    Unsaved Trip for a calculate-route payload and its processed route.
+
+    Without a road geometry the waypoints are stored as the route polyline,
+    which is the line stops were placed along (and are re-planned along).
+    """
+    return Trip(
+        current_location=data['current_location'],
+        pickup_location=data['pickup_location'],
+        dropoff_location=data['dropoff_location'],
+        current_cycle_hours=float(data['current_cycle_hours']),
+        total_distance=processed_route['totalDistance'],
+        total_drive_time=processed_route['totalDriveTime'],
+        route_polyline=processed_route['geometry'] or encode_polyline(processed_route['points']),
+        driver_id=data.get('driver_id') or '',
+        start_at=parse_datetime(processed_route['startTime']) if processed_route.get('startTime') else None,
+        time_zone=processed_route.get('timeZone') or '',
+    )
+
+
+def save_planned_trip(data, processed_route, log_sheets, idempotency_record=None):
+    """
+    Save a planned trip and complete its idempotency claim in one transaction.
+
+    Returns the response body, or None when the claim's lease expired and
+    another request took its key over: the trip is rolled back then, so
+    the key's trip is written only once.
+    """
+    def save():
+        trip = save_trip_plan(build_trip(data, processed_route), processed_route, log_sheets)
+        return {
+            'route': processed_route,
+            'logSheets': log_sheets,
+            'tripId': trip.id
+        }
+
+    if idempotency_record is None:
+        return save()
+    with transaction.atomic():
+        body = save()
+        if not idempotency.complete(idempotency_record, status.HTTP_200_OK, body, body['tripId']):
+            transaction.set_rollback(True)
+            return None
+    return body
 
 
 @api_view(['POST'])
@@ -23,97 +295,535 @@ def calculate_route(request):
     """
     Accept pre-computed route data from the frontend (via Navigatr SDK),
     process HOS regulations, and generate ELD logs.
+
+    An optional ``geometry`` list of ``{lat, lon}`` points (or ``[lat, lon]``
+    pairs), or a Google encoded polyline string, places rest stops on the
+    actual road instead of between waypoints. It is simplified server-side
+    (``simplify_tolerance`` miles) and returned and stored encoded.
+
+    Fuel stops are planned at least every ``fuel_interval_miles`` (default
+    ``ROUTE_PLANNER_FUEL_INTERVAL_MILES``, 0 for none) and placed at the
+    nearest known fuel station.
+
+    An optional ``start_time`` (ISO 8601) schedules the trip on the real
+    clock: stops get an ``arrivalAt`` in their local time zone and log
+    activities ``startAt``/``endAt`` in the home terminal's ``time_zone``
+    (default: the zone of the first point).
+
+    Multi-drop trips send ``legs`` (see ``build_legs``) instead of the
+    totals; the HOS clocks carry from each leg into the next. With a
+    ``driver_id``, ``current_cycle_hours`` defaults to the driver's cycle
+    ledger and the planned hours are added to it. Without ``points`` and
+    totals the route is computed server-side (see ``with_server_route``).
+
+    Resubmitting an identical payload returns the cached result and its
+    existing ``tripId`` (``X-Cache: HIT``) without planning or writing again.
+    Retries sent with an ``Idempotency-Key`` header replay the response of
+    the first request with that key, waiting for it if it is still running.
     """
     data = request.data
+    idempotency_record = None
 
     try:
-        # Validate required fields
-        required = ['current_location', 'pickup_location', 'dropoff_location',
-                     'current_cycle_hours', 'total_distance', 'total_drive_time', 'points']
-        for field in required:
-            if field not in data:
+        with stage('validation'):
+            body_hash = idempotency.request_hash(data)
+            data = with_ledger_cycle_hours(data)
+            # Validate required fields
+            try:
+                data, route_data, request_hash = planning_key(data)
+            except (TypeError, ValueError) as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Retries carrying the same Idempotency-Key replay the first response
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if idempotency_key:
+            if len(idempotency_key) > 255:
                 return Response(
-                    {'error': f'Missing required field: {field}'},
+                    {'error': 'Idempotency-Key must be at most 255 characters'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
+            try:
+                with stage('idempotency'):
+                    idempotency_record, replay = idempotency.claim(idempotency_key, body_hash)
+            except idempotency.IdempotencyConflict as e:
+                return Response({'error': str(e)}, status=e.status_code)
+            if replay is not None:
+                return Response(replay.response, status=replay.status_code,
+                                headers={'Idempotent-Replayed': 'true'})
+
+        # Identical payloads are answered from the result cache
+        cache_key = result_cache.result_key(request_hash)
+        with stage('cache_lookup'):
+            body = result_cache.lookup(cache_key)
+        cache_status = 'HIT'
+        if body is None:
+            cache_status = 'MISS'
+
+            if route_data is None:
+                try:
+                    with stage('routing'):
+                        data, route_data = route_input(data)
+                except (TypeError, ValueError) as e:
+                    if idempotency_record is not None:
+                        idempotency.release(idempotency_record)
+                    return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+            # Process HOS and generate ELD logs
+            with stage('hos'):
+                processed_route, log_sheets = plan_trip(route_data, float(data['current_cycle_hours']))
 
-        # Create trip
-        trip = Trip.objects.create(
-            current_location=data['current_location'],
-            pickup_location=data['pickup_location'],
-            dropoff_location=data['dropoff_location'],
-            current_cycle_hours=float(data['current_cycle_hours'])
+            # Save the whole trip graph in one transaction
+            with stage('db_write'):
+                body = save_planned_trip(data, processed_route, log_sheets, idempotency_record)
+            while body is None:
+                # The key was taken over: answer as the request that took it does
+                idempotency_record = None
+                try:
+                    with stage('idempotency'):
+                        idempotency_record, replay = idempotency.claim(idempotency_key, body_hash)
+                except idempotency.IdempotencyConflict as e:
+                    return Response({'error': str(e)}, status=e.status_code)
+                if replay is not None:
+                    return Response(replay.response, status=replay.status_code,
+                                    headers={'Idempotent-Replayed': 'true'})
+                with stage('db_write'):
+                    body = save_planned_trip(data, processed_route, log_sheets, idempotency_record)
+            result_cache.store(cache_key, body)
+
+        elif idempotency_record is not None:
+            idempotency.complete(idempotency_record, status.HTTP_200_OK, body, body['tripId'])
+        return Response(body, headers={'X-Cache': cache_status})
+
+    except Exception as e:
+        if idempotency_record is not None:
+            idempotency.release(idempotency_record)
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
-        trip.total_distance = float(data['total_distance'])
-        trip.total_drive_time = float(data['total_drive_time'])
-        trip.save()
 
-        # Build route_data dict for HOS processing
-        route_data = {
-            'total_distance': float(data['total_distance']),
-            'total_distance_km': float(data.get('total_distance_km', data['total_distance'] * 1.60934)),
-            'total_drive_time': float(data['total_drive_time']),
-            'points': data['points'],
-        }
+@csrf_exempt
+@require_POST
+async def calculate_route_async(request):
+    """
+    ``calculate_route`` for ASGI servers.
+
+    Same payload, headers and response as the sync view. Database and
+    cache work is awaited and HOS planning runs in the batch process pool
+    (or a thread), so one worker keeps serving other requests meanwhile.
+    """
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON body'}, status=status.HTTP_400_BAD_REQUEST)
+    if not isinstance(data, dict):
+        return JsonResponse({'error': 'Expected a JSON object'}, status=status.HTTP_400_BAD_REQUEST)
+    idempotency_record = None
 
-        # Process HOS
-        processed_route = process_route_data(route_data, float(data['current_cycle_hours']))
-
-        # Save stops
-        for index, stop_data in enumerate(processed_route['stops']):
-            Stop.objects.create(
-                trip=trip,
-                location=stop_data['location'],
-                stop_type=stop_data['type'].upper(),
-                duration=stop_data['duration'],
-                arrival_time=stop_data['arrivalTime'],
-                sequence=index
-            )
-
-        # Generate and save ELD logs
-        log_sheets = generate_eld_logs(processed_route)
-        for log_data in log_sheets:
-            log_sheet = LogSheet.objects.create(
-                trip=trip,
-                date=log_data['date'],
-                from_location=log_data['from'],
-                to_location=log_data['to'],
-                total_miles=int(float(log_data['totalMiles'])),
-                carrier=log_data['carrier'],
-                remarks=log_data['remarks'],
-                shipping_documents=log_data['shippingDocuments']
-            )
-            for activity in log_data['activities']:
-                LogActivity.objects.create(
-                    log_sheet=log_sheet,
-                    status=activity['status'],
-                    start_time=activity['startTime'],
-                    end_time=activity['endTime'],
-                    location=activity['location'],
-                    remarks=activity['remarks']
+    try:
+        with stage('validation'):
+            body_hash = idempotency.request_hash(data)
+            data = await sync_to_async(with_ledger_cycle_hours)(data)
+            try:
+                data, route_data, request_hash = await sync_to_async(planning_key, thread_sensitive=False)(data)
+            except (TypeError, ValueError) as e:
+                return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if idempotency_key:
+            if len(idempotency_key) > 255:
+                return JsonResponse(
+                    {'error': 'Idempotency-Key must be at most 255 characters'},
+                    status=status.HTTP_400_BAD_REQUEST
                 )
+            try:
+                with stage('idempotency'):
+                    idempotency_record, replay = await idempotency.aclaim(idempotency_key, body_hash)
+            except idempotency.IdempotencyConflict as e:
+                return JsonResponse({'error': str(e)}, status=e.status_code)
+            if replay is not None:
+                return JsonResponse(replay.response, status=replay.status_code,
+                                    headers={'Idempotent-Replayed': 'true'})
 
-        return Response({
-            'route': processed_route,
-            'logSheets': log_sheets,
-            'tripId': trip.id
-        })
+        cache_key = result_cache.result_key(request_hash)
+        with stage('cache_lookup'):
+            body = await sync_to_async(result_cache.lookup)(cache_key)
+        cache_status = 'HIT'
+        if body is None:
+            cache_status = 'MISS'
+
+            if route_data is None:
+                try:
+                    with stage('routing'):
+                        data, route_data = await sync_to_async(route_input, thread_sensitive=False)(data)
+                except (TypeError, ValueError) as e:
+                    if idempotency_record is not None:
+                        await sync_to_async(idempotency.release)(idempotency_record)
+                    return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+            with stage('hos'):
+                plan, error = await plan_trip_async(route_data, float(data['current_cycle_hours']))
+            if error is not None:
+                raise ValueError(error)
+            processed_route, log_sheets = plan
+
+            with stage('db_write'):
+                body = await sync_to_async(save_planned_trip)(data, processed_route, log_sheets, idempotency_record)
+            while body is None:
+                idempotency_record = None
+                try:
+                    with stage('idempotency'):
+                        idempotency_record, replay = await idempotency.aclaim(idempotency_key, body_hash)
+                except idempotency.IdempotencyConflict as e:
+                    return JsonResponse({'error': str(e)}, status=e.status_code)
+                if replay is not None:
+                    return JsonResponse(replay.response, status=replay.status_code,
+                                        headers={'Idempotent-Replayed': 'true'})
+                with stage('db_write'):
+                    body = await sync_to_async(save_planned_trip)(
+                        data, processed_route, log_sheets, idempotency_record)
+            await sync_to_async(result_cache.store)(cache_key, body)
+
+        elif idempotency_record is not None:
+            await sync_to_async(idempotency.complete)(
+                idempotency_record, status.HTTP_200_OK, body, body['tripId'])
+        with stage('serialization'):
+            return JsonResponse(body, headers={'X-Cache': cache_status})
 
     except Exception as e:
-        if 'trip' in locals():
-            trip.delete()
+        if idempotency_record is not None:
+            await sync_to_async(idempotency.release)(idempotency_record)
+        return JsonResponse(
+            {'error': str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@require_GET
+async def trip_list_async(request):
+    """Cursor-paginated trips, as ``GET /trips/``, read with the async ORM."""
+    request = Request(request)
+    fields, expand = parse_projection(request.query_params)
+    paginator = TripCursorPagination()
+    trips = await paginator.apaginate_queryset(trip_queryset(fields, expand), request)
+    serializedData = TripSerializer(trips, many=True, fields=fields, expand=expand).data
+    return JsonResponse(paginator.get_paginated_response(serializedData).data)
+
+
+@require_GET
+async def trip_detail_async(request, pk):
+    """One trip, as ``GET /trips/<pk>/``, read with the async ORM."""
+    fields, expand = parse_projection(request.GET)
+    try:
+        trip = await trip_queryset(fields, expand).aget(pk=pk)
+    except Trip.DoesNotExist:
+        return JsonResponse({'detail': 'No Trip matches the given query.'},
+                            status=status.HTTP_404_NOT_FOUND)
+    return JsonResponse(TripSerializer(trip, fields=fields, expand=expand).data)
+
+
+@api_view(['GET'])
+def calculate_route_cache_stats(request):
+    """Hit/miss counters of the calculate-route result cache."""
+    return Response(result_cache.stats())
+
+
+@api_view(['POST'])
+def calculate_routes_batch(request):
+    """
+    Plan a whole fleet in one request.
+
+    Takes ``{"trips": [...]}`` where each entry is a calculate-route payload.
+    HOS/ELD planning runs across a process pool, the resulting trip graphs
+    are saved with one bulk insert per table, and each entry of ``results``
+    reports either its trip or its own error without failing the batch.
+    """
+    trips = request.data.get('trips') if isinstance(request.data, dict) else None
+    if not isinstance(trips, list) or not trips:
+        return Response(
+            {'error': 'Expected a non-empty "trips" list'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if len(trips) > settings.ROUTE_PLANNER_BATCH_MAX_TRIPS:
+        return Response(
+            {'error': f'A batch may contain at most {settings.ROUTE_PLANNER_BATCH_MAX_TRIPS} trips'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    results = [None] * len(trips)
+    jobs, job_indexes = [], []
+    for index, data in enumerate(trips):
+        try:
+            if not isinstance(data, dict):
+                raise ValueError('Trip payload must be an object')
+            data, route_data = route_input(with_ledger_cycle_hours(data))
+            trips[index] = data
+            jobs.append((route_data, float(data['current_cycle_hours'])))
+            job_indexes.append(index)
+        except (TypeError, ValueError) as e:
+            results[index] = {'index': index, 'error': str(e)}
+
+    with stage('hos'):
+        planned = plan_trips(jobs)
+    plans, plan_indexes = [], []
+    for index, (plan, error) in zip(job_indexes, planned):
+        if error is not None:
+            results[index] = {'index': index, 'error': error}
+            continue
+        processed_route, log_sheets = plan
+        plans.append((build_trip(trips[index], processed_route), processed_route, log_sheets))
+        plan_indexes.append(index)
+
+    try:
+        with stage('db_write'):
+            save_trip_plans(plans)
+    except Exception as e:
         return Response(
             {'error': str(e)},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+    for index, (trip, processed_route, log_sheets) in zip(plan_indexes, plans):
+        results[index] = {
+            'index': index,
+            'route': processed_route,
+            'logSheets': log_sheets,
+            'tripId': trip.id,
+        }
+
+    return Response({
+        'results': results,
+        'created': len(plans),
+        'failed': len(trips) - len(plans),
+    })
+
+
+def export_params(request):
+    """``(format, start, end)`` of an export request; raises ValueError if invalid."""
+    export_format = request.GET.get('format', 'ndjson')
+    if export_format not in exports.FORMATS:
+        raise ValueError(f'format must be one of: {", ".join(sorted(exports.FORMATS))}')
+    start = exports.parse_bound(request.GET['start']) if request.GET.get('start') else None
+    end = exports.parse_bound(request.GET['end'], end=True) if request.GET.get('end') else None
+    return export_format, start, end
+
+
+def export_response(lines, export_format):
+    response = StreamingHttpResponse(lines, content_type=exports.FORMATS[export_format])
+    response['Content-Disposition'] = f'attachment; filename="trips.{export_format}"'
+    return response
+
+
+@require_GET
+def export_trips(request):
+    """
+    Stream trips and their ELD logs for audits.
+
+    ``?format=ndjson`` (default) or ``csv``, optionally limited with
+    ``?start=``/``?end=`` ISO dates or datetimes on the trip creation time
+    (a plain ``end`` date is inclusive). Rendered as a plain Django
+    streaming response, so nothing is buffered under WSGI. ASGI servers
+    would buffer it; they stream ``export_trips_async`` instead.
+    """
+    try:
+        export_format, start, end = export_params(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return export_response(exports.export_trips(export_format, start, end), export_format)
+
+
+@require_GET
+async def export_trips_async(request):
+    """``export_trips`` for ASGI servers, streamed from an async iterator."""
+    try:
+        export_format, start, end = export_params(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return export_response(exports.aexport_trips(export_format, start, end), export_format)
+
+
+@require_GET
+def render_log_sheets(request, pk, render_format, day=None):
+    """
+    A trip's ELD log sheets (or the sheet of one ``day``) as SVG or PDF.
+
+    Documents are cached by content hash, which is also sent as the ETag
+    so clients can revalidate without downloading again.
+    """
+    if render_format not in rendering.FORMATS:
+        raise Http404('Unknown log sheet format')
+    sheets = LogSheet.objects.filter(trip_id=pk).prefetch_related('activities')
+    if day is not None:
+        sheets = sheets.filter(day=day)
+    sheets = list(sheets)
+    if not sheets:
+        raise Http404('No log sheets found')
+
+    document, digest, hit = rendering.render(sheets, render_format)
+    etag = f'"{digest}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        return HttpResponseNotModified(headers={'ETag': etag})
+
+    name = f'trip-{pk}-day-{day}' if day is not None else f'trip-{pk}-logs'
+    response = HttpResponse(document, content_type=rendering.FORMATS[render_format])
+    response['Content-Disposition'] = f'inline; filename="{name}.{render_format}"'
+    response['ETag'] = etag
+    response['X-Cache'] = 'HIT' if hit else 'MISS'
+    return response
+
+
+@api_view(['POST'])
+def replan_trip(request, pk):
+    """
+    Re-plan the rest of a trip that is under way.
+
+    Takes the truck's ``position`` (``{"lat", "lon"}`` or ``[lat, lon]``)
+    and the duty ``events`` that actually happened since the trip started.
+    Each event is ``{"status", "start", "end"}`` in hours from midnight of
+    the first trip day, with optional ``miles``, ``kind`` (``pickup``,
+    ``dropoff``, ``fuel``...) and, for stops, ``location``. An optional
+    ``fuel_interval_miles`` works as for ``calculate-route``.
+
+    HOS clocks are seeded from the events and only the remaining legs are
+    planned again. Stops and log sheets are then updated in place, and
+    only the rows that changed are written. Cached ``calculate-route``
+    results of the trip are no longer served. Returns the new stops after
+    the ``keptStops``, the log sheets from day ``firstLogDay`` (that of the
+    previous re-plan) on and the row ``changes``.
+    """
+    data = request.data if isinstance(request.data, dict) else {}
+    # The trip stays locked from reading its stops to writing the new ones,
+    # so concurrent re-plans of it run one after the other
+    with transaction.atomic():
+        try:
+            trip = Trip.objects.select_for_update().get(pk=pk)
+        except Trip.DoesNotExist:
+            return Response({'error': 'Trip not found'}, status=status.HTTP_404_NOT_FOUND)
+        if 'position' not in data:
+            return Response({'error': 'Missing required field: position'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            with stage('hos'):
+                result = replan.replan_trip(
+                    trip, data['position'], data.get('events') or [],
+                    fuel_interval=float(data.get('fuel_interval_miles', settings.ROUTE_PLANNER_FUEL_INTERVAL_MILES)),
+                )
+        except (AttributeError, IndexError, KeyError, TypeError, ValueError) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        with stage('db_write'):
+            changes = save_trip_replan(trip, result)
+    return Response({
+        'tripId': trip.id,
+        'keptStops': result['keptStops'],
+        'stops': result['stops'],
+        'firstLogDay': result['firstLogDay'],
+        'logSheets': result['logSheets'],
+        'changes': changes,
+    })
+
+
+@api_view(['GET'])
+def driver_cycle(request, driver_id):
+    """The driver's on-duty hours over the last 8 days and what is left of the 70."""
+    cycle_ledger = DriverCycleLedger.objects.filter(driver_id=driver_id).first()
+    if cycle_ledger is None:
+        cycle_ledger = DriverCycleLedger(driver_id=driver_id)
+    return Response(ledger.summary(cycle_ledger))
+
+
+@api_view(['POST'])
+def record_driver_logs(request, driver_id):
+    """
+    Record a driver's actual log sheets in their cycle ledger.
+
+    Takes ``{"logSheets": [{"date": "YYYY-MM-DD", "activities": [...]}]}``
+    with activities shaped like generated ones (``status``, ``startTime``,
+    ``endTime``). Each sheet replaces the on-duty total of its date.
+    """
+    log_sheets = request.data.get('logSheets') if isinstance(request.data, dict) else None
+    if not isinstance(log_sheets, list) or not log_sheets:
+        return Response(
+            {'error': 'Expected a non-empty "logSheets" list'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        sheets = []
+        for index, sheet in enumerate(log_sheets):
+            day = parse_date(str(sheet.get('date', '')))
+            if day is None:
+                raise ValueError(f'Log sheet {index}: date must be YYYY-MM-DD')
+            sheets.append((day, sheet.get('activities') or []))
+        with transaction.atomic():
+            cycle_ledger = ledger.record_actual_sheets(driver_id, sheets)
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(ledger.summary(cycle_ledger))
+
+
+@api_view(['POST'])
+def reverse_geocode(request):
+    """
+    Nearest-city labels of a batch of coordinates from the offline gazetteer.
+
+    Takes ``{"points": [{"lat", "lon"} or [lat, lon], ...]}`` and returns
+    one ``{"lat", "lon", "city"}`` per point, ``city`` being null where no
+    city is within ``ROUTE_PLANNER_GEOCODE_MAX_MILES``.
+    """
+    points = request.data.get('points') if isinstance(request.data, dict) else None
+    if not isinstance(points, list) or not points:
+        return Response(
+            {'error': 'Expected a non-empty "points" list'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if len(points) > settings.ROUTE_PLANNER_GEOCODE_MAX_POINTS:
+        return Response(
+            {'error': f'At most {settings.ROUTE_PLANNER_GEOCODE_MAX_POINTS} points may be looked up at once'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        coordinates = [point_coordinates(point) for point in points]
+    except (IndexError, KeyError, TypeError, ValueError):
+        return Response(
+            {'error': 'Every point must be {"lat", "lon"} or [lat, lon]'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    geocoder = geocoding.get_geocoder()
+    if geocoder is None:
+        return Response(
+            {'error': 'Reverse geocoding is not configured'},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+    cities = geocoder.lookup_many(coordinates)
+    return Response({'results': [
+        {'lat': lat, 'lon': lon, 'city': city} for (lat, lon), city in zip(coordinates, cities)
+    ]})
+
+
+class TripProjectionMixin:
+    """Apply ``?fields=``/``?expand=`` to the queryset and serializer of read requests."""
+
+    def get_projection(self):
+        if self.request.method not in ('GET', 'HEAD'):
+            return None, None
+        return parse_projection(self.request.query_params)
+
+    def get_queryset(self):
+        return trip_queryset(*self.get_projection())
+
+    def get_serializer(self, *args, **kwargs):
+        fields, expand = self.get_projection()
+        kwargs.setdefault('fields', fields)
+        kwargs.setdefault('expand', expand)
+        return super().get_serializer(*args, **kwargs)
+
 
-class TripListView(generics.ListCreateAPIView):
-    queryset = Trip.objects.all()
+class TripListView(TripProjectionMixin, generics.ListCreateAPIView):
     serializer_class = TripSerializer
+    pagination_class = TripCursorPagination
 
 
-class TripDetailView(generics.RetrieveAPIView):
-    queryset = Trip.objects.all()
+class TripDetailView(TripProjectionMixin, generics.RetrieveAPIView):
     serializer_class = TripSerializer
\ No newline at end of file